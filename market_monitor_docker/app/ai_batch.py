@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""Batched, schema-validated LLM analysis: several tickers per request.
+
+``build_batch_prompt`` packs each ticker's inputs as one compact JSON line
+so the instructions are sent once per batch. Providers are asked for
+``BATCH_SCHEMA`` (OpenAI ``json_schema`` response format, or an Anthropic
+tool whose input is the schema); ``parse_batch`` keeps only the items that
+pass ``validate_analysis`` and reports the rest so the caller can retry
+those tickers one at a time.
+"""
+import hashlib
+import json
+import random
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+TRENDS = ("bullish", "bearish", "neutral")
+MAX_KEY_POINTS = 8
+
+ANALYSIS_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {
+        "ticker": {"type": "string"},
+        "trend": {"type": "string", "enum": list(TRENDS)},
+        "summary": {"type": "string"},
+        "key_points": {"type": "array", "items": {"type": "string"}},
+    },
+    "required": ["ticker", "trend", "summary", "key_points"],
+    "additionalProperties": False,
+}
+# OpenAI 的 strict schema 頂層必須是 object，陣列包在 analyses 欄位中
+BATCH_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {"analyses": {"type": "array", "items": ANALYSIS_SCHEMA}},
+    "required": ["analyses"],
+    "additionalProperties": False,
+}
+BATCH_TOOL = "record_analyses"
+
+SYSTEM_PROMPT = "你是專業的股市分析師，提供繁體中文的市場分析。"
+
+
+def build_batch_prompt(inputs: Sequence[Dict[str, Any]], indicator_labels: Sequence[Tuple[str, str]]) -> str:
+    """One prompt covering every ticker in ``inputs`` (the dicts built by ``build_ai_prompt``)."""
+    legend = "、".join(f"{key}={label}" for key, label in indicator_labels)
+    lines = "\n".join(json.dumps(item, ensure_ascii=False, separators=(",", ":")) for item in inputs)
+    return f"""以下是 {len(inputs)} 檔股票的最新數據，每行一檔 JSON：
+current 為當前價格，change_percent 為日變化（%），high_30d / low_30d 為 30 天高低點，headlines 為最新新聞標題；
+技術指標欄位：{legend}。
+
+{lines}
+
+請逐檔提供簡潔的分析（繁體中文）：
+1. 整體趨勢判斷 trend（bullish / bearish / neutral）
+2. 3-5 個關鍵要點 key_points
+3. 簡短總結 summary（50 字內）
+
+每檔股票回傳 analyses 中的一筆，ticker 必須與輸入相同。"""
+
+
+def validate_analysis(item: Any, require_ticker: bool = True) -> Optional[str]:
+    """Why ``item`` does not match ``ANALYSIS_SCHEMA``, or None when it does."""
+    if not isinstance(item, dict):
+        return "analysis is not an object"
+    if require_ticker and (not isinstance(item.get("ticker"), str) or not item["ticker"].strip()):
+        return "missing ticker"
+    if item.get("trend") not in TRENDS:
+        return f"invalid trend {item.get('trend')!r}"
+    if not isinstance(item.get("summary"), str) or not item["summary"].strip():
+        return "missing summary"
+    points = item.get("key_points")
+    if not isinstance(points, list) or not points or not all(isinstance(p, str) for p in points):
+        return "key_points must be a non-empty list of strings"
+    return None
+
+
+def normalize_analysis(item: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "trend": item["trend"],
+        "summary": item["summary"].strip(),
+        "key_points": [p.strip() for p in item["key_points"] if p.strip()][:MAX_KEY_POINTS],
+    }
+
+
+def extract_json(text: str) -> Any:
+    """The first JSON value in ``text``; tolerates code fences or prose around it."""
+    text = text.strip()
+    try:
+        return json.loads(text)
+    except ValueError:
+        pass
+    decoder = json.JSONDecoder()
+    start = min((i for i in (text.find("{"), text.find("[")) if i >= 0), default=-1)
+    while start >= 0:
+        try:
+            return decoder.raw_decode(text, start)[0]
+        except ValueError:
+            # 從下一個可能的起點再試，不像貪婪的正規表示式會跨越多個物件
+            candidates = [i for i in (text.find("{", start + 1), text.find("[", start + 1)) if i >= 0]
+            start = min(candidates, default=-1)
+    raise ValueError("no JSON value in response")
+
+
+def parse_batch(answer: Any, tickers: Sequence[str]) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, str]]:
+    """Split a batch answer (text or already-decoded JSON) into valid analyses and per-ticker errors.
+
+    Every ticker in ``tickers`` ends up in exactly one of the two dicts;
+    items for tickers that were not asked for are ignored.
+    """
+    payload = extract_json(answer) if isinstance(answer, str) else answer
+    items = payload.get("analyses") if isinstance(payload, dict) else payload
+    if not isinstance(items, list):
+        raise ValueError("batch answer has no analyses array")
+    wanted = {t.upper(): t for t in tickers}
+    results: Dict[str, Dict[str, Any]] = {}
+    errors: Dict[str, str] = {}
+    for item in items:
+        ticker = wanted.get(str(item.get("ticker", "")).strip().upper()) if isinstance(item, dict) else None
+        if ticker is None or ticker in results:
+            continue
+        error = validate_analysis(item)
+        if error is None:
+            results[ticker] = normalize_analysis(item)
+            errors.pop(ticker, None)
+        else:
+            errors[ticker] = error
+    for ticker in tickers:
+        if ticker not in results:
+            errors.setdefault(ticker, "missing from batch answer")
+    return results, errors
+
+
+class StubProvider:
+    """Offline provider: deterministic analyses derived from the inputs themselves.
+
+    ``drop_rate`` leaves that fraction of tickers out of batch answers so the
+    per-ticker retry path can be exercised without a real API.
+    """
+
+    def __init__(self, drop_rate: float = 0.0, seed: int = 0):
+        self.drop_rate = drop_rate
+        self._rng = random.Random(seed)
+        self.requests = 0
+
+    @staticmethod
+    def analyse(inputs: Dict[str, Any]) -> Dict[str, Any]:
+        change = inputs.get("change_percent")
+        change = change if isinstance(change, (int, float)) else 0.0
+        trend = "bullish" if change > 0.5 else "bearish" if change < -0.5 else "neutral"
+        rsi = inputs.get("rsi_14")
+        points = [f"日變化 {change:+.2f}%", f"30 天區間 {inputs.get('low_30d')} - {inputs.get('high_30d')}"]
+        if isinstance(rsi, (int, float)):
+            points.append(f"RSI(14) {rsi:.1f}")
+        points += [f"新聞：{title}" for title in (inputs.get("headlines") or [])[:2]]
+        digest = hashlib.sha256(json.dumps(inputs, sort_keys=True, ensure_ascii=False).encode()).hexdigest()[:6]
+        return {
+            "trend": trend,
+            "summary": f"{inputs.get('ticker')} 離線模擬分析（{digest}）。",
+            "key_points": points,
+        }
+
+    def batch(self, inputs: Sequence[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+        self.requests += 1
+        return {"analyses": [
+            {"ticker": item.get("ticker"), **self.analyse(item)}
+            for item in inputs if self._rng.random() >= self.drop_rate
+        ]}
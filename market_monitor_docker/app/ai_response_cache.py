@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""Content-addressed cache of LLM analysis results."""
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from persistence import atomic_write_json
+
+
+class AIResponseCache:
+    """Maps a hash of (provider, model, prompt inputs) to a parsed analysis.
+
+    Entries expire after ``ttl_sec`` and the least recently used ones are
+    evicted beyond ``max_entries``. Hit / miss counters are persisted with
+    the entries so they accumulate across restarts.
+    """
+
+    def __init__(self, path: Path, ttl_sec: int = 72 * 3600, max_entries: int = 500):
+        self.path = path
+        self.ttl_sec = ttl_sec
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.load()
+
+    @staticmethod
+    def key_for(provider: str, model: str, inputs: Dict[str, Any]) -> str:
+        payload = json.dumps(
+            {"provider": provider, "model": model, "inputs": inputs},
+            ensure_ascii=False, sort_keys=True, separators=(",", ":"),
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def load(self) -> None:
+        if not self.path.exists():
+            return
+        try:
+            raw = json.loads(self.path.read_text(encoding="utf-8"))
+        except Exception:
+            return
+        entries = raw.get("entries", {})
+        self._entries = OrderedDict(sorted(entries.items(), key=lambda kv: kv[1].get("used_at", 0)))
+        self.hits = int(raw.get("hits", 0))
+        self.misses = int(raw.get("misses", 0))
+
+    def save(self) -> None:
+        self._evict()
+        atomic_write_json(self.path, {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": self._entries,
+        })
+
+    def _evict(self, now: Optional[float] = None) -> None:
+        now = now if now is not None else time.time()
+        expired = [k for k, v in self._entries.items() if now - v.get("stored_at", 0) > self.ttl_sec]
+        for key in expired:
+            del self._entries[key]
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is None or time.time() - entry.get("stored_at", 0) > self.ttl_sec:
+            self._entries.pop(key, None)
+            self.misses += 1
+            return None
+        entry["used_at"] = time.time()
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return dict(entry["value"])
+
+    def put(self, key: str, value: Dict[str, Any]) -> None:
+        now = time.time()
+        self._entries[key] = {"value": value, "stored_at": now, "used_at": now}
+        self._entries.move_to_end(key)
+        self._evict(now)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "ai_cache_hits": self.hits,
+            "ai_cache_misses": self.misses,
+            "ai_cache_hit_ratio": round(self.hits / total, 3) if total else None,
+            "ai_cache_entries": len(self._entries),
+        }
@@ -0,0 +1,313 @@
+# -*- coding: utf-8 -*-
+"""Incremental alert rules evaluated against each new snapshot.
+
+Rules are indexed by (ticker, field); a refresh only evaluates the rules
+whose input fields changed value, so the cost follows the number of changed
+fields rather than rules x tickers. Each (rule, ticker) pair keeps arm /
+baseline state for hysteresis plus a cooldown between firings. An edge
+that occurs during the cooldown is not consumed: the rule's state is left
+as it was and the rule is evaluated again once the cooldown has passed.
+"""
+import asyncio
+import json
+import math
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Deque, Dict, Iterable, List, Optional, Tuple
+
+RULE_TYPES = ("threshold", "percent_move", "range_break", "cross")
+WILDCARD = "*"
+
+
+def ticker_values(entry: Dict[str, Any]) -> Dict[str, float]:
+    """Flatten one snapshot ticker entry into the numeric fields rules can refer to."""
+    values: Dict[str, float] = {}
+    price = (entry.get("price") or {}).get("price")
+    if isinstance(price, (int, float)):
+        values["price"] = float(price)
+    for key, value in ((entry.get("history") or {}).get("stats") or {}).items():
+        if isinstance(value, (int, float)) and math.isfinite(value):
+            values[key] = float(value)
+    intraday = entry.get("intraday") or {}
+    if isinstance(intraday.get("change_percent"), (int, float)):
+        values["intraday_change_percent"] = float(intraday["change_percent"])
+    return values
+
+
+class Rule:
+    """One alert rule from the config file.
+
+    ``threshold``: ``field`` crosses ``value`` in direction ``op`` (``>=`` / ``<=``);
+    re-arms once it moves back by ``hysteresis``.
+    ``percent_move``: ``field`` moves ``percent`` % away from a baseline that
+    resets after firing or after ``window_sec``.
+    ``range_break``: ``field`` (default price) breaks above ``high_52w`` or
+    below ``low_52w``.
+    ``cross``: ``field`` crosses ``other`` (``direction`` ``above`` / ``below`` /
+    ``both``); a crossing counts once the gap exceeds ``hysteresis``.
+    """
+
+    def __init__(self, spec: Dict[str, Any], default_cooldown: float):
+        self.id = str(spec.get("id") or uuid.uuid4().hex[:8])
+        self.type = spec.get("type", "threshold")
+        if self.type not in RULE_TYPES:
+            raise ValueError(f"unknown alert type {self.type!r} in rule {self.id}")
+        tickers = spec.get("tickers") or spec.get("ticker") or WILDCARD
+        self.tickers = [tickers.upper()] if isinstance(tickers, str) else [t.upper() for t in tickers]
+        self.field = spec.get("field", "price")
+        self.op = spec.get("op", ">=")
+        if self.op not in (">=", "<="):
+            raise ValueError(f"unsupported op {self.op!r} in rule {self.id}")
+        self.value = spec.get("value")
+        self.percent = abs(float(spec.get("percent", 3.0)))
+        self.window_sec = float(spec.get("window_sec", 3600))
+        self.other = spec.get("other")
+        self.direction = spec.get("direction", "both")
+        self.hysteresis = abs(float(spec.get("hysteresis", 0.0)))
+        self.cooldown_sec = float(spec.get("cooldown_sec", default_cooldown))
+        self.message = spec.get("message")
+        if self.type == "threshold" and not isinstance(self.value, (int, float)):
+            raise ValueError(f"threshold rule {self.id} needs a numeric value")
+        if self.type == "cross" and not self.other:
+            raise ValueError(f"cross rule {self.id} needs an 'other' field")
+
+    @property
+    def inputs(self) -> Tuple[str, ...]:
+        """Fields whose change can make this rule fire."""
+        if self.type == "range_break":
+            return (self.field, "high_52w", "low_52w")
+        if self.type == "cross":
+            return (self.field, self.other)
+        return (self.field,)
+
+    def evaluate(self, values: Dict[str, float], state: Dict[str, Any], now: float) -> Optional[Tuple[float, str]]:
+        """Update ``state`` and return (value, description) when the rule fires."""
+        v = values.get(self.field)
+        if v is None:
+            return None
+
+        if self.type == "threshold":
+            hit = v >= self.value if self.op == ">=" else v <= self.value
+            rearm = v < self.value - self.hysteresis if self.op == ">=" else v > self.value + self.hysteresis
+            # 首次看到的值只建立狀態，避免啟動時對既有狀態重複告警
+            if "armed" not in state:
+                state["armed"] = not hit
+                return None
+            if state["armed"] and hit:
+                state["armed"] = False
+                return v, f"{self.field} {self.op} {self.value}"
+            if not state["armed"] and rearm:
+                state["armed"] = True
+            return None
+
+        if self.type == "percent_move":
+            base, since = state.get("base"), state.get("since", 0.0)
+            if base is None or now - since > self.window_sec:
+                state["base"], state["since"] = v, now
+                return None
+            if base and abs(v - base) / abs(base) * 100 >= self.percent:
+                state["base"], state["since"] = v, now
+                return v, f"{self.field} {'+' if v > base else ''}{(v - base) / base * 100:.2f}%（{self.window_sec / 60:.0f} 分鐘內）"
+            return None
+
+        if self.type == "range_break":
+            high, low = values.get("high_52w"), values.get("low_52w")
+            side = "high" if high is not None and v > high else "low" if low is not None and v < low else None
+            if "side" not in state:
+                state["side"] = side
+                return None
+            previous, state["side"] = state["side"], side
+            if side is not None and side != previous:
+                return v, f"{self.field} 突破 52 週{'高' if side == 'high' else '低'}點 {high if side == 'high' else low}"
+            return None
+
+        # cross
+        other = values.get(self.other)
+        if other is None:
+            return None
+        gap = v - other
+        if abs(gap) <= self.hysteresis:
+            return None
+        sign = 1 if gap > 0 else -1
+        previous, state["sign"] = state.get("sign"), sign
+        if previous is None or previous == sign:
+            return None
+        if self.direction == "both" or (self.direction == "above") == (sign > 0):
+            return v, f"{self.field} {'上穿' if sign > 0 else '下穿'} {self.other}"
+        return None
+
+
+class AlertEngine:
+    """Loads rules from a JSON file and evaluates only rules whose inputs changed."""
+
+    def __init__(self, path: Path, cooldown_sec: float = 900.0, history: int = 100):
+        self.path = path
+        self.cooldown_sec = cooldown_sec
+        self.rules: List[Rule] = []
+        self.errors: List[str] = []
+        self.recent: Deque[Dict[str, Any]] = deque(maxlen=history)
+        self.evaluations = 0
+        self.fired = 0
+        self._index: Dict[Tuple[str, str], List[Rule]] = defaultdict(list)
+        self._values: Dict[str, Dict[str, float]] = {}
+        self._state: Dict[Tuple[str, str], Dict[str, Any]] = defaultdict(dict)
+        self._last_fired: Dict[Tuple[str, str], float] = {}
+        # ticker -> 冷卻期間被擋下、冷卻結束後要重新評估的規則
+        self._deferred: Dict[str, Dict[str, Rule]] = defaultdict(dict)
+        self._mtime: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def reload_if_changed(self) -> bool:
+        try:
+            mtime = self.path.stat().st_mtime
+        except OSError:
+            mtime = None
+        if mtime == self._mtime:
+            return False
+        self._mtime = mtime
+        rules, errors = [], []
+        if mtime is not None:
+            try:
+                config = json.loads(self.path.read_text(encoding="utf-8"))
+                specs = config.get("rules", []) if isinstance(config, dict) else config
+                cooldown = float(config.get("cooldown_sec", self.cooldown_sec)) if isinstance(config, dict) else self.cooldown_sec
+                for spec in specs:
+                    try:
+                        rules.append(Rule(spec, cooldown))
+                    except (TypeError, ValueError) as e:
+                        errors.append(str(e))
+            except (OSError, ValueError) as e:
+                errors.append(f"alert rules unreadable: {e}")
+        self.load(rules)
+        self.errors = errors
+        return True
+
+    def load(self, rules: Iterable[Rule]) -> None:
+        with self._lock:
+            self.rules = list(rules)
+            self._index = defaultdict(list)
+            for rule in self.rules:
+                for ticker in rule.tickers:
+                    for field in rule.inputs:
+                        self._index[(ticker, field)].append(rule)
+            # 規則變更後重新建立狀態，下一次刷新會把所有欄位視為已變動
+            self._values.clear()
+            self._state.clear()
+            self._deferred.clear()
+
+    def evaluate(self, tickers: Dict[str, Dict[str, Any]], now: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Compare each ticker against its previous values and return newly fired alerts."""
+        now = now if now is not None else time.time()
+        fired: List[Dict[str, Any]] = []
+        with self._lock:
+            if not self.rules:
+                return fired
+            for ticker, entry in tickers.items():
+                values = ticker_values(entry)
+                before = self._values.get(ticker, {})
+                self._values[ticker] = values
+                candidates: Dict[str, Rule] = {}
+                for field, value in values.items():
+                    if before.get(field) == value:
+                        continue
+                    for rule in (*self._index.get((ticker, field), ()), *self._index.get((WILDCARD, field), ())):
+                        candidates[rule.id] = rule
+                deferred = self._deferred.get(ticker)
+                if deferred:
+                    # 冷卻已結束的規則即使欄位沒有變動也要重新評估
+                    for rule_id, rule in list(deferred.items()):
+                        if now - self._last_fired.get((rule_id, ticker), 0.0) >= rule.cooldown_sec:
+                            candidates[rule_id] = deferred.pop(rule_id)
+                for rule in candidates.values():
+                    self.evaluations += 1
+                    key = (rule.id, ticker)
+                    state = self._state[key]
+                    cooling = now - self._last_fired.get(key, 0.0) < rule.cooldown_sec
+                    saved = dict(state) if cooling else None
+                    result = rule.evaluate(values, state, now)
+                    if result is None:
+                        continue
+                    if cooling:
+                        # 冷卻中不消耗這次觸發：還原狀態，冷卻結束後再評估一次
+                        state.clear()
+                        state.update(saved)
+                        self._deferred[ticker][rule.id] = rule
+                        continue
+                    self._last_fired[key] = now
+                    value, description = result
+                    alert = {
+                        "id": uuid.uuid4().hex[:12],
+                        "rule_id": rule.id,
+                        "type": rule.type,
+                        "ticker": ticker,
+                        "field": rule.field,
+                        "value": round(value, 4),
+                        "message": (rule.message or "{ticker} {description}").format(
+                            ticker=ticker, description=description, value=round(value, 4)),
+                        "fired_at_unix": int(now),
+                    }
+                    fired.append(alert)
+                    self.fired += 1
+                    self.recent.appendleft(alert)
+        return fired
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "alert_rules": len(self.rules),
+            "alert_rule_errors": self.errors,
+            "alert_evaluations": self.evaluations,
+            "alerts_fired": self.fired,
+        }
+
+
+class FileSink:
+    """Appends alerts to a JSON-lines file."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def deliver(self, alerts: List[Dict[str, Any]]) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        lines = "".join(json.dumps(a, ensure_ascii=False) + "\n" for a in alerts)
+        with self._lock, open(self.path, "a", encoding="utf-8") as fh:
+            fh.write(lines)
+
+
+class WebhookSink:
+    """POSTs ``{"alerts": [...]}`` to a URL through the given async request function."""
+
+    def __init__(self, url: str, post: Callable[[str, Dict[str, Any]], Awaitable[Any]]):
+        self.url = url
+        self.post = post
+
+    async def deliver(self, alerts: List[Dict[str, Any]]) -> None:
+        await self.post(self.url, {"alerts": alerts})
+
+
+class CallbackSink:
+    """Hands alerts to an in-process callback, e.g. the SSE hub."""
+
+    def __init__(self, callback: Callable[[List[Dict[str, Any]]], None]):
+        self.callback = callback
+
+    def deliver(self, alerts: List[Dict[str, Any]]) -> None:
+        self.callback(alerts)
+
+
+async def deliver_alerts(alerts: List[Dict[str, Any]], sinks: Iterable[Any],
+                         run_blocking: Callable[..., Awaitable[Any]]) -> None:
+    """Deliver to every sink; one failing sink does not stop the others."""
+    for sink in sinks:
+        try:
+            if isinstance(sink, FileSink):
+                await run_blocking(sink.deliver, alerts)
+            else:
+                result = sink.deliver(alerts)
+                if asyncio.iscoroutine(result):
+                    await result
+        except Exception as e:
+            print(f"[alerts] {type(sink).__name__} delivery failed: {e}")
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""On-disk daily bar store so Stooq history is downloaded incrementally."""
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from market_calendar import latest_session_close, latest_session_date
+
+
+class HistoryStore:
+    """SQLite-backed daily OHLCV bars keyed by (ticker, date).
+
+    A ticker is considered fresh once it has been synced after the latest
+    session close and holds that session's bar, so the upstream is hit once
+    per trading day. When the bar is late, the ticker stays stale (and is
+    retried) until ``late_grace_sec`` after the close, e.g. for a symbol on
+    an exchange that did not trade that day.
+    """
+
+    def __init__(self, path: Path, late_grace_sec: float = 6 * 3600):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.late_grace_sec = late_grace_sec
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS bars (
+                ticker TEXT NOT NULL,
+                date TEXT NOT NULL,
+                open REAL,
+                high REAL,
+                low REAL,
+                close REAL NOT NULL,
+                volume INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (ticker, date)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS sync_state (
+                ticker TEXT PRIMARY KEY,
+                fetched_at INTEGER NOT NULL
+            );
+        """)
+        self._conn.commit()
+
+    def last_date(self, ticker: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MAX(date) FROM bars WHERE ticker = ?", (ticker,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def fetched_at(self, ticker: str) -> int:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT fetched_at FROM sync_state WHERE ticker = ?", (ticker,)
+            ).fetchone()
+        return int(row[0]) if row else 0
+
+    def is_fresh(self, ticker: str, now: Optional[float] = None) -> bool:
+        close = latest_session_close(now)
+        fetched = self.fetched_at(ticker)
+        if fetched < close:
+            return False
+        last = self.last_date(ticker)
+        if last is not None and last >= latest_session_date(now):
+            return True
+        # 收盤後抓到的資料還沒有當日 K 棒（Stooq 較晚更新），寬限時間內繼續重試
+        return fetched >= close + self.late_grace_sec
+
+    def append(self, ticker: str, rows: Iterable[Dict[str, Any]], fetched_at: Optional[int] = None) -> int:
+        """Insert bars newer than or equal to the stored last date.
+
+        The last stored bar is rewritten as well, since the upstream may have
+        revised it after it was first seen. Returns the number of rows written.
+        """
+        last = self.last_date(ticker)
+        payload = [
+            (ticker, r["date"], r.get("open"), r.get("high"), r.get("low"), r["close"], int(r.get("volume") or 0))
+            for r in rows
+            if last is None or r["date"] >= last
+        ]
+        with self._lock:
+            if payload:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO bars (ticker, date, open, high, low, close, volume) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    payload,
+                )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sync_state (ticker, fetched_at) VALUES (?, ?)",
+                (ticker, int(fetched_at if fetched_at is not None else time.time())),
+            )
+            self._conn.commit()
+        return len(payload)
+
+    def recent(self, ticker: str, limit: int) -> List[Dict[str, Any]]:
+        """Return the latest ``limit`` bars in ascending date order."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT date, open, high, low, close, volume FROM bars "
+                "WHERE ticker = ? ORDER BY date DESC LIMIT ?",
+                (ticker, limit),
+            ).fetchall()
+        return [
+            {"date": d, "close": c, "open": o, "high": h, "low": l, "volume": v}
+            for d, o, h, l, c, v in reversed(rows)
+        ]
+
+    def extremes(self, ticker: str, since: str, before: str) -> Tuple[Optional[float], Optional[float]]:
+        """Highest high and lowest low of bars dated in [since, before)."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MAX(COALESCE(high, close)), MIN(COALESCE(low, close)) FROM bars "
+                "WHERE ticker = ? AND date >= ? AND date < ?",
+                (ticker, since, before),
+            ).fetchone()
+        return (row[0], row[1]) if row else (None, None)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""App-lifetime HTTP connection pools, one long-lived client per upstream host."""
+import threading
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+try:
+    import h2  # noqa: F401  # httpx 需要 h2 套件才能協商 HTTP/2
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+class HttpPool:
+    """Hands out shared httpx clients keyed by host.
+
+    Sync clients are used from the fetch thread pool, async clients from the
+    event loop. Each keeps its connections alive between refresh cycles so
+    only the first request to a host pays for the TCP + TLS handshake.
+    """
+
+    def __init__(
+        self,
+        user_agent: str,
+        max_connections: int = 20,
+        max_keepalive: int = 10,
+        keepalive_expiry: float = 120.0,
+        http2: bool = True,
+        timeout: float = 10.0,
+    ):
+        self.user_agent = user_agent
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.http2 = http2 and HTTP2_AVAILABLE
+        self.timeout = timeout
+        self._sync: Dict[str, httpx.Client] = {}
+        self._async: Dict[str, httpx.AsyncClient] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _host_key(url_or_host: str) -> str:
+        if "://" in url_or_host:
+            parts = urlsplit(url_or_host)
+            return f"{parts.scheme}://{parts.netloc}"
+        return f"https://{url_or_host}"
+
+    def _client_kwargs(self) -> Dict[str, object]:
+        return {
+            "timeout": self.timeout,
+            "headers": {"User-Agent": self.user_agent},
+            "follow_redirects": True,
+            "limits": self.limits,
+            "http2": self.http2,
+        }
+
+    def start(self, hosts: Optional[list] = None) -> None:
+        """Pre-create clients for known hosts so the first refresh reuses them."""
+        for host in hosts or []:
+            self.client(host)
+            self.async_client(host)
+
+    def client(self, url_or_host: str) -> httpx.Client:
+        key = self._host_key(url_or_host)
+        with self._lock:
+            client = self._sync.get(key)
+            if client is None or client.is_closed:
+                client = httpx.Client(base_url=key, **self._client_kwargs())
+                self._sync[key] = client
+            return client
+
+    def async_client(self, url_or_host: str) -> httpx.AsyncClient:
+        key = self._host_key(url_or_host)
+        with self._lock:
+            client = self._async.get(key)
+            if client is None or client.is_closed:
+                client = httpx.AsyncClient(base_url=key, **self._client_kwargs())
+                self._async[key] = client
+            return client
+
+    async def aclose(self) -> None:
+        with self._lock:
+            sync_clients = list(self._sync.values())
+            async_clients = list(self._async.values())
+            self._sync.clear()
+            self._async.clear()
+        for client in sync_clients:
+            client.close()
+        for client in async_clients:
+            await client.aclose()
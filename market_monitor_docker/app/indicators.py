@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+"""Vectorized technical indicators computed for all tickers at once.
+
+Price history is laid out as right-aligned ``(bars, tickers)`` NumPy
+matrices (shorter histories are NaN-padded on the left), so every
+indicator is one pass of array operations across all tickers. Recursive
+indicators (EMA / MACD / RSI / ATR) keep their smoothing state per ticker:
+when a refresh only appends one new bar they advance that state by a
+single step instead of replaying the whole history.
+
+A full computation seeds that state at the first bar of the ``lookback``
+window, while stepped state keeps its older seed. The seed's weight after
+``lookback`` bars is at most ``(1 - 1/14) ** lookback`` (the slowest
+smoothing, RSI / ATR), so the lookback is kept long enough for the two
+paths to agree within ``SEED_TOLERANCE`` of the seed error.
+"""
+import math
+import warnings
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+EMA_FAST = 12
+EMA_SLOW = 26
+MACD_SIGNAL = 9
+RSI_PERIOD = 14
+ATR_PERIOD = 14
+SMA_SHORT = 20
+SMA_LONG = 50
+BB_PERIOD = 20
+BB_WIDTH = 2.0
+VOL_PERIOD = 20
+CORR_PERIOD = 20
+TRADING_DAYS = 252
+SEED_TOLERANCE = 1e-3
+
+# 種子權重低於 SEED_TOLERANCE 所需的最少 K 棒數（RSI / ATR 的平滑最慢）
+MIN_LOOKBACK = math.ceil(math.log(SEED_TOLERANCE) / math.log(1.0 - 1.0 / max(RSI_PERIOD, ATR_PERIOD)))
+
+# 遞迴型指標的狀態欄位
+STATE_FIELDS = ("ema_fast", "ema_slow", "signal", "avg_gain", "avg_loss", "atr", "close")
+
+
+def _alpha_span(span: int) -> float:
+    return 2.0 / (span + 1.0)
+
+
+def _ewm_step(state: np.ndarray, x: np.ndarray, alpha: float) -> np.ndarray:
+    """One exponential-smoothing step; NaN state seeds from x, NaN x keeps state."""
+    out = state + alpha * (x - state)
+    out = np.where(np.isnan(state), x, out)
+    return np.where(np.isnan(x), state, out)
+
+
+def _columns(bars_by_ticker: Sequence[List[Dict[str, Any]]], field: str, length: int) -> np.ndarray:
+    """Right-aligned (length, n) float matrix of ``field``; missing values are NaN."""
+    mat = np.full((length, len(bars_by_ticker)), np.nan)
+    for j, bars in enumerate(bars_by_ticker):
+        tail = bars[-length:]
+        values = [row.get(field) for row in tail]
+        col = np.array([np.nan if v is None else float(v) for v in values], dtype=float)
+        if col.size:
+            mat[length - col.size:, j] = col
+    return mat
+
+
+def _advance(state: Dict[str, np.ndarray], close: np.ndarray, high: np.ndarray, low: np.ndarray) -> None:
+    """Advance every recursive indicator by one bar for all columns at once."""
+    prev_close = state["close"]
+    state["ema_fast"] = _ewm_step(state["ema_fast"], close, _alpha_span(EMA_FAST))
+    state["ema_slow"] = _ewm_step(state["ema_slow"], close, _alpha_span(EMA_SLOW))
+    macd = state["ema_fast"] - state["ema_slow"]
+    state["signal"] = _ewm_step(state["signal"], macd, _alpha_span(MACD_SIGNAL))
+
+    change = close - prev_close
+    gain = np.where(np.isnan(change), np.nan, np.maximum(change, 0.0))
+    loss = np.where(np.isnan(change), np.nan, np.maximum(-change, 0.0))
+    state["avg_gain"] = _ewm_step(state["avg_gain"], gain, 1.0 / RSI_PERIOD)
+    state["avg_loss"] = _ewm_step(state["avg_loss"], loss, 1.0 / RSI_PERIOD)
+
+    h = np.where(np.isnan(high), close, high)
+    l = np.where(np.isnan(low), close, low)
+    # fmax 會忽略 NaN：第一根 K 棒沒有前收盤時 TR 即為 high - low
+    tr = np.fmax(np.fmax(h - l, np.abs(h - prev_close)), np.abs(l - prev_close))
+    tr = np.where(np.isnan(close), np.nan, tr)
+    state["atr"] = _ewm_step(state["atr"], tr, 1.0 / ATR_PERIOD)
+    state["close"] = np.where(np.isnan(close), prev_close, close)
+
+
+def _empty_state(n: int) -> Dict[str, np.ndarray]:
+    return {name: np.full(n, np.nan) for name in STATE_FIELDS}
+
+
+def _window_mean(close: np.ndarray, period: int) -> np.ndarray:
+    window = close[-period:]
+    full = np.sum(~np.isnan(window), axis=0) >= period
+    return np.where(full, np.nanmean(window, axis=0), np.nan)
+
+
+def _rolling_stats(close: np.ndarray, bench_returns: Optional[np.ndarray]) -> Dict[str, np.ndarray]:
+    """Window indicators over the trailing rows of a right-aligned close matrix.
+
+    A value is only reported once the ticker has a full window of bars.
+    """
+    with warnings.catch_warnings(), np.errstate(invalid="ignore", divide="ignore"):
+        # 全為 NaN 的欄位（資料不足）會觸發 "Mean of empty slice" 警告，結果本來就會被遮蔽
+        warnings.simplefilter("ignore", RuntimeWarning)
+        sma_short = _window_mean(close, SMA_SHORT)
+        sma_long = _window_mean(close, SMA_LONG)
+        bb_mid = _window_mean(close, BB_PERIOD)
+        bb_std = np.nanstd(close[-BB_PERIOD:], axis=0)
+        bb_upper = bb_mid + BB_WIDTH * bb_std
+        bb_lower = bb_mid - BB_WIDTH * bb_std
+        percent_b = (close[-1] - bb_lower) / (bb_upper - bb_lower)
+
+        log_ret = np.diff(np.log(close), axis=0)
+        vol_window = log_ret[-VOL_PERIOD:]
+        volatility = np.where(
+            np.sum(~np.isnan(vol_window), axis=0) >= VOL_PERIOD,
+            np.nanstd(vol_window, axis=0, ddof=1) * math.sqrt(TRADING_DAYS) * 100.0,
+            np.nan,
+        )
+
+        corr = np.full(close.shape[1], np.nan)
+        if bench_returns is not None:
+            x = log_ret[-CORR_PERIOD:]
+            y = bench_returns[-CORR_PERIOD:]
+            valid = ~np.isnan(x) & ~np.isnan(y)
+            count = valid.sum(axis=0)
+            mean_x = np.where(valid, x, 0.0).sum(axis=0) / count
+            mean_y = np.where(valid, y, 0.0).sum(axis=0) / count
+            dx = np.where(valid, x - mean_x, 0.0)
+            dy = np.where(valid, y - mean_y, 0.0)
+            denom = np.sqrt((dx * dx).sum(axis=0) * (dy * dy).sum(axis=0))
+            corr = np.where(count >= CORR_PERIOD // 2, (dx * dy).sum(axis=0) / denom, np.nan)
+
+    return {
+        "sma_20": sma_short,
+        "sma_50": sma_long,
+        "bb_upper": bb_upper,
+        "bb_lower": bb_lower,
+        "bb_percent_b": percent_b,
+        "volatility_20d": volatility,
+        "corr_benchmark_20d": corr,
+    }
+
+
+def _clean(value: float, digits: int) -> Optional[float]:
+    if value is None or not np.isfinite(value):
+        return None
+    return round(float(value), digits)
+
+
+def _bar_key(bar: Dict[str, Any]) -> Tuple[Any, ...]:
+    """What the recursive state depends on for one bar; a revised bar changes the key."""
+    return (bar["date"], bar.get("close"), bar.get("high"), bar.get("low"))
+
+
+class IndicatorEngine:
+    """Computes indicator stats for many tickers, incrementally where possible."""
+
+    def __init__(self, benchmark: str = "QQQ", lookback: int = 120):
+        self.benchmark = benchmark
+        self.lookback = max(lookback, MIN_LOOKBACK)
+        # ticker -> 最後處理的 K 棒（日期與價格）與遞迴狀態（純量）
+        self._state: Dict[str, Dict[str, Any]] = {}
+        # 相關係數依賴基準的 K 棒；基準最後一根變動時所有股票都要重算
+        self._benchmark_bar: Optional[Tuple[Any, ...]] = None
+        self._stats: Dict[str, Dict[str, Optional[float]]] = {}
+
+    def _classify(self, ticker: str, bars: List[Dict[str, Any]]) -> str:
+        state = self._state.get(ticker)
+        if state is None or not bars:
+            return "full"
+        # 上游修正最後一根 K 棒（例如盤中暫定值變成收盤價）時日期不變但價格不同，需要重算
+        if _bar_key(bars[-1]) == state["bar"]:
+            return "same"
+        if len(bars) >= 2 and _bar_key(bars[-2]) == state["bar"]:
+            return "step"
+        return "full"
+
+    def _save_states(self, tickers: List[str], bars_by_ticker: List[List[Dict[str, Any]]],
+                     state: Dict[str, np.ndarray]) -> None:
+        for j, ticker in enumerate(tickers):
+            self._state[ticker] = {
+                "bar": _bar_key(bars_by_ticker[j][-1]),
+                **{name: float(state[name][j]) for name in STATE_FIELDS},
+            }
+
+    def _load_states(self, tickers: List[str]) -> Dict[str, np.ndarray]:
+        return {
+            name: np.array([self._state[t][name] for t in tickers], dtype=float)
+            for name in STATE_FIELDS
+        }
+
+    def update(self, series: Dict[str, List[Dict[str, Any]]]) -> Dict[str, Dict[str, Optional[float]]]:
+        """Return indicator stats for every ticker in ``series`` (bars in ascending date order)."""
+        tickers = [t for t, bars in series.items() if bars]
+        groups: Dict[str, List[str]] = {"full": [], "step": [], "same": []}
+        for ticker in tickers:
+            groups[self._classify(ticker, series[ticker])].append(ticker)
+
+        changed = groups["full"] + groups["step"]
+        bench = series.get(self.benchmark)
+        benchmark_bar = _bar_key(bench[-1]) if bench else None
+        if benchmark_bar != self._benchmark_bar:
+            self._benchmark_bar = benchmark_bar
+            changed += groups["same"]
+        if groups["full"]:
+            bars = [series[t] for t in groups["full"]]
+            close = _columns(bars, "close", self.lookback)
+            high = _columns(bars, "high", self.lookback)
+            low = _columns(bars, "low", self.lookback)
+            state = _empty_state(len(bars))
+            for i in range(close.shape[0]):
+                _advance(state, close[i], high[i], low[i])
+            self._save_states(groups["full"], bars, state)
+
+        if groups["step"]:
+            bars = [series[t] for t in groups["step"]]
+            state = self._load_states(groups["step"])
+            _advance(state, _columns(bars, "close", 1)[0], _columns(bars, "high", 1)[0], _columns(bars, "low", 1)[0])
+            self._save_states(groups["step"], bars, state)
+
+        if changed:
+            self._compute_stats(changed, series)
+        return {t: self._stats[t] for t in tickers if t in self._stats}
+
+    def _benchmark_returns(self, bars_by_ticker: List[List[Dict[str, Any]]],
+                           series: Dict[str, List[Dict[str, Any]]], length: int) -> Optional[np.ndarray]:
+        bench = series.get(self.benchmark)
+        if not bench:
+            return None
+        bench_close = {row["date"]: row["close"] for row in bench}
+        # 依各股票自己的日期對齊基準報酬，避免停牌或資料缺漏造成錯位
+        aligned = []
+        for bars in bars_by_ticker:
+            tail = bars[-length:]
+            aligned.append([{"close": bench_close.get(row["date"])} for row in tail])
+        closes = _columns(aligned, "close", length)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.diff(np.log(closes), axis=0)
+
+    def _compute_stats(self, tickers: List[str], series: Dict[str, List[Dict[str, Any]]]) -> None:
+        window = max(SMA_LONG, BB_PERIOD, VOL_PERIOD + 1, CORR_PERIOD + 1)
+        bars = [series[t] for t in tickers]
+        close = _columns(bars, "close", window)
+        rolling = _rolling_stats(close, self._benchmark_returns(bars, series, window))
+        state = self._load_states(tickers)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            macd = state["ema_fast"] - state["ema_slow"]
+            rs = state["avg_gain"] / state["avg_loss"]
+            rsi = np.where(state["avg_loss"] == 0, 100.0, 100.0 - 100.0 / (1.0 + rs))
+        for j, ticker in enumerate(tickers):
+            is_benchmark = ticker == self.benchmark
+            self._stats[ticker] = {
+                "sma_20": _clean(rolling["sma_20"][j], 4),
+                "sma_50": _clean(rolling["sma_50"][j], 4),
+                "ema_12": _clean(state["ema_fast"][j], 4),
+                "ema_26": _clean(state["ema_slow"][j], 4),
+                "macd": _clean(macd[j], 4),
+                "macd_signal": _clean(state["signal"][j], 4),
+                "macd_hist": _clean(macd[j] - state["signal"][j], 4),
+                "rsi_14": _clean(rsi[j], 2),
+                "bb_upper": _clean(rolling["bb_upper"][j], 4),
+                "bb_lower": _clean(rolling["bb_lower"][j], 4),
+                "bb_percent_b": _clean(rolling["bb_percent_b"][j], 4),
+                "atr_14": _clean(state["atr"][j], 4),
+                "volatility_20d": _clean(rolling["volatility_20d"][j], 2),
+                f"corr_{self.benchmark.lower()}_20d": None if is_benchmark else _clean(rolling["corr_benchmark_20d"][j], 4),
+            }
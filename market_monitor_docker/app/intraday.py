@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+"""Intraday ticks rolled into fixed-size 1-minute bar ring buffers.
+
+Each ticker owns preallocated NumPy arrays, so appending a tick is O(1),
+allocates nothing per tick, and memory stays bounded however long the
+process runs. Ticks come from a pluggable source: ``QuotePollSource`` polls
+the batched quote API during market sessions, ``ReplaySource`` replays a
+local CSV for testing.
+"""
+import asyncio
+import csv
+import math
+import threading
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+OPEN, HIGH, LOW, CLOSE, VOLUME = range(5)
+
+# sink(ticker, ts, price, cumulative_volume)
+TickSink = Callable[[str, float, float, Optional[float]], None]
+
+
+class MinuteBarRing:
+    """Circular buffer of the last ``capacity`` 1-minute OHLCV bars of one ticker."""
+
+    __slots__ = ("capacity", "minutes", "values", "head", "size", "last_cum_volume")
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.minutes = np.zeros(capacity, dtype=np.int64)
+        self.values = np.zeros((capacity, 5), dtype=np.float64)
+        self.head = -1
+        self.size = 0
+        self.last_cum_volume: Optional[float] = None
+
+    def add_tick(self, ts: float, price: float, cum_volume: Optional[float] = None) -> bool:
+        """Fold one tick into the current minute bar or start a new one.
+
+        ``cum_volume`` is the session's cumulative volume (as quote APIs report
+        it); the bar gets the increase since the previous tick. Ticks older
+        than the latest bar are dropped.
+        """
+        minute = int(ts) // 60 * 60
+        head = self.head
+        if self.size and minute < self.minutes[head]:
+            return False
+        volume = 0.0
+        if cum_volume is not None:
+            # 累計量變小代表換日（或資料源重設），只重設基準
+            if self.last_cum_volume is not None and cum_volume >= self.last_cum_volume:
+                volume = cum_volume - self.last_cum_volume
+            self.last_cum_volume = cum_volume
+
+        if self.size and minute == self.minutes[head]:
+            row = self.values[head]
+            if price > row[HIGH]:
+                row[HIGH] = price
+            if price < row[LOW]:
+                row[LOW] = price
+            row[CLOSE] = price
+            row[VOLUME] += volume
+            return True
+
+        head = (head + 1) % self.capacity
+        self.head = head
+        self.minutes[head] = minute
+        row = self.values[head]
+        row[OPEN] = row[HIGH] = row[LOW] = row[CLOSE] = price
+        row[VOLUME] = volume
+        if self.size < self.capacity:
+            self.size += 1
+        return True
+
+    def ordered(self, since: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """(minutes, bars) oldest first, optionally only bars at or after ``since``."""
+        if not self.size:
+            return self.minutes[:0], self.values[:0]
+        idx = (np.arange(self.head - self.size + 1, self.head + 1)) % self.capacity
+        minutes = self.minutes[idx]
+        values = self.values[idx]
+        if since is not None:
+            keep = minutes >= since
+            minutes, values = minutes[keep], values[keep]
+        return minutes, values
+
+
+class IntradayStore:
+    """Per-ticker minute-bar rings plus snapshot-ready rollups."""
+
+    def __init__(self, capacity: int = 1440):
+        self.capacity = max(1, capacity)
+        self._rings: Dict[str, MinuteBarRing] = {}
+        self._lock = threading.Lock()
+        self.ticks = 0
+
+    def add_tick(self, ticker: str, ts: float, price: float, cum_volume: Optional[float] = None) -> None:
+        if price is None or not math.isfinite(price):
+            return
+        with self._lock:
+            ring = self._rings.get(ticker)
+            if ring is None:
+                ring = self._rings[ticker] = MinuteBarRing(self.capacity)
+            if ring.add_tick(ts, price, cum_volume):
+                self.ticks += 1
+
+    def retain(self, tickers: Iterable[str]) -> None:
+        """Drop rings of tickers no longer watched."""
+        keep = set(tickers)
+        with self._lock:
+            for ticker in [t for t in self._rings if t not in keep]:
+                del self._rings[ticker]
+
+    def rollup(self, ticker: str, since: Optional[int] = None, max_points: int = 120) -> Optional[Dict[str, Any]]:
+        """OHLC summary of the bars since ``since`` and a downsampled close series for charts."""
+        with self._lock:
+            ring = self._rings.get(ticker)
+            if ring is None:
+                return None
+            minutes, values = ring.ordered(since)
+        n = len(minutes)
+        if not n:
+            return None
+        first_open = values[0, OPEN]
+        last_close = values[-1, CLOSE]
+        # 圖表最多 max_points 點：每 step 分鐘取最後一根收盤
+        step = max(1, math.ceil(n / max(1, max_points)))
+        picks = np.arange(n - 1, -1, -step)[::-1]
+        return {
+            "open": round(float(first_open), 4),
+            "high": round(float(values[:, HIGH].max()), 4),
+            "low": round(float(values[:, LOW].min()), 4),
+            "close": round(float(last_close), 4),
+            "volume": int(values[:, VOLUME].sum()),
+            "change_percent": round(float((last_close - first_open) / first_open * 100), 2) if first_open else 0.0,
+            "bars": n,
+            "step_min": step,
+            "start_unix": int(minutes[0]),
+            "end_unix": int(minutes[-1]),
+            "t": minutes[picks].tolist(),
+            "c": np.round(values[picks, CLOSE], 4).tolist(),
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "intraday_tickers": len(self._rings),
+                "intraday_ticks": self.ticks,
+                "intraday_capacity_min": self.capacity,
+            }
+
+
+class QuotePollSource:
+    """Polls quotes every ``interval`` seconds while ``active()`` is true.
+
+    The latest quote payloads are kept so a scheduled quote refresh can reuse
+    a recent poll instead of requesting the same symbols again. With
+    ``max_symbols`` set, each poll covers the next ``max_symbols`` tickers
+    round-robin instead of the whole list, so a large watchlist stays within
+    the quote budget.
+    """
+
+    def __init__(self, fetch_quotes: Callable[[List[str]], Awaitable[Dict[str, Dict[str, Any]]]],
+                 tickers: Callable[[], List[str]],
+                 to_tick: Callable[[Dict[str, Any]], Optional[Tuple[float, float, Optional[float]]]],
+                 interval: float = 15.0, active: Callable[[], bool] = lambda: True,
+                 max_symbols: Optional[int] = None):
+        self.fetch_quotes = fetch_quotes
+        self.tickers = tickers
+        self.to_tick = to_tick
+        self.interval = interval
+        self.active = active
+        self.max_symbols = max_symbols
+        self.latest: Dict[str, Dict[str, Any]] = {}
+        self.latest_at: Dict[str, float] = {}
+        self.hits = 0
+        self.misses = 0
+        self._cursor = 0
+
+    def recent_quotes(self, tickers: List[str], max_age: float) -> Optional[Dict[str, Dict[str, Any]]]:
+        """Quotes from recent polls if every ticker was polled within ``max_age`` seconds."""
+        cutoff = time.time() - max_age
+        if any(self.latest_at.get(t, 0.0) < cutoff for t in tickers):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return {t: self.latest[t] for t in tickers}
+
+    def next_batch(self) -> List[str]:
+        tickers = self.tickers()
+        if not self.max_symbols or len(tickers) <= self.max_symbols:
+            return tickers
+        # 清單超過上限時每次輪詢接續上次的位置
+        start = self._cursor % len(tickers)
+        batch = (tickers[start:] + tickers[:start])[:self.max_symbols]
+        self._cursor = start + len(batch)
+        return batch
+
+    def feed(self, quotes: Dict[str, Dict[str, Any]], sink: TickSink) -> None:
+        for ticker, quote in quotes.items():
+            tick = self.to_tick(quote)
+            if tick is not None:
+                sink(ticker, *tick)
+
+    async def run(self, sink: TickSink) -> None:
+        while True:
+            started = time.time()
+            if self.active():
+                try:
+                    quotes = await self.fetch_quotes(self.next_batch())
+                    if quotes:
+                        self.latest.update(quotes)
+                        self.latest_at.update(dict.fromkeys(quotes, started))
+                        self.feed(quotes, sink)
+                except Exception as e:
+                    print(f"[intraday] quote poll failed: {e}")
+            await asyncio.sleep(max(1.0, self.interval - (time.time() - started)))
+
+
+class ReplaySource:
+    """Replays ticks from a CSV file (``ts,ticker,price[,volume]``) for local testing.
+
+    Gaps between ticks are replayed ``speed`` times faster and every tick is
+    stamped with the wall-clock time it is emitted at, so replayed data shows
+    up as today's session. ``loop`` restarts the file when it ends.
+    """
+
+    def __init__(self, path: Path, speed: float = 1.0, loop: bool = True):
+        self.path = path
+        self.speed = max(speed, 1e-3)
+        self.loop = loop
+
+    def _rows(self) -> List[Tuple[float, str, float, Optional[float]]]:
+        rows = []
+        with open(self.path, newline="", encoding="utf-8") as fh:
+            for row in csv.DictReader(fh):
+                try:
+                    volume = row.get("volume")
+                    rows.append((
+                        float(row["ts"]),
+                        row["ticker"].strip().upper(),
+                        float(row["price"]),
+                        float(volume) if volume not in (None, "") else None,
+                    ))
+                except (KeyError, TypeError, ValueError):
+                    continue
+        rows.sort(key=lambda r: r[0])
+        return rows
+
+    async def run(self, sink: TickSink) -> None:
+        rows = self._rows()
+        if not rows:
+            print(f"[intraday] replay file has no ticks: {self.path}")
+            return
+        while True:
+            prev_ts = rows[0][0]
+            for ts, ticker, price, volume in rows:
+                if ts > prev_ts:
+                    await asyncio.sleep((ts - prev_ts) / self.speed)
+                prev_ts = ts
+                sink(ticker, time.time(), price, volume)
+            if not self.loop:
+                return
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""US equity market calendar: NYSE holidays, early closes and trading sessions."""
+import datetime
+import functools
+import time
+from typing import Dict, Optional, Set, Tuple
+
+from pytz import timezone
+
+US_EASTERN = timezone("America/New_York")
+
+PRE_OPEN = datetime.time(4, 0)
+REGULAR_OPEN = datetime.time(9, 30)
+REGULAR_CLOSE = datetime.time(16, 0)
+EARLY_CLOSE = datetime.time(13, 0)
+# 盤後交易在收盤後持續 4 小時（提早收盤日為 13:00–17:00）
+POST_HOURS = 4
+# 收盤後稍等一段時間，讓資料源完成當日 K 棒
+SETTLE_MINUTES = 30
+
+SESSIONS = ("pre", "regular", "post", "closed")
+
+
+def _easter(year: int) -> datetime.date:
+    """Gregorian Easter Sunday (anonymous Gregorian algorithm)."""
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return datetime.date(year, month, day + 1)
+
+
+def _nth_weekday(year: int, month: int, weekday: int, n: int) -> datetime.date:
+    first = datetime.date(year, month, 1)
+    offset = (weekday - first.weekday()) % 7
+    return first + datetime.timedelta(days=offset + 7 * (n - 1))
+
+
+def _last_weekday(year: int, month: int, weekday: int) -> datetime.date:
+    nxt = datetime.date(year + (month == 12), month % 12 + 1, 1)
+    last = nxt - datetime.timedelta(days=1)
+    return last - datetime.timedelta(days=(last.weekday() - weekday) % 7)
+
+
+def _observed(day: datetime.date) -> datetime.date:
+    # 週六的假日提前到週五、週日的假日順延到週一
+    if day.weekday() == 5:
+        return day - datetime.timedelta(days=1)
+    if day.weekday() == 6:
+        return day + datetime.timedelta(days=1)
+    return day
+
+
+@functools.lru_cache(maxsize=16)
+def market_holidays(year: int) -> Dict[datetime.date, str]:
+    """Full-day NYSE closures for ``year``."""
+    holidays = {
+        _nth_weekday(year, 1, 0, 3): "Martin Luther King Jr. Day",
+        _nth_weekday(year, 2, 0, 3): "Washington's Birthday",
+        _easter(year) - datetime.timedelta(days=2): "Good Friday",
+        _last_weekday(year, 5, 0): "Memorial Day",
+        _observed(datetime.date(year, 7, 4)): "Independence Day",
+        _nth_weekday(year, 9, 0, 1): "Labor Day",
+        _nth_weekday(year, 11, 3, 4): "Thanksgiving Day",
+        _observed(datetime.date(year, 12, 25)): "Christmas Day",
+    }
+    # 元旦落在週六時不提前到前一年的 12/31
+    new_year = _observed(datetime.date(year, 1, 1))
+    if new_year.year == year:
+        holidays[new_year] = "New Year's Day"
+    if year >= 2022:
+        holidays[_observed(datetime.date(year, 6, 19))] = "Juneteenth"
+    return holidays
+
+
+@functools.lru_cache(maxsize=16)
+def early_closes(year: int) -> Set[datetime.date]:
+    """Trading days that close at 13:00 ET."""
+    candidates = {
+        datetime.date(year, 7, 3),
+        _nth_weekday(year, 11, 3, 4) + datetime.timedelta(days=1),
+        datetime.date(year, 12, 24),
+    }
+    return {day for day in candidates if is_trading_day(day)}
+
+
+def is_trading_day(day: datetime.date) -> bool:
+    return day.weekday() < 5 and day not in market_holidays(day.year)
+
+
+def session_bounds(day: datetime.date) -> Optional[Tuple[datetime.datetime, ...]]:
+    """(pre open, regular open, regular close, post close) in ET, or None on non-trading days."""
+    if not is_trading_day(day):
+        return None
+    close = EARLY_CLOSE if day in early_closes(day.year) else REGULAR_CLOSE
+
+    def at(t: datetime.time) -> datetime.datetime:
+        return US_EASTERN.localize(datetime.datetime.combine(day, t))
+
+    close_dt = at(close)
+    return at(PRE_OPEN), at(REGULAR_OPEN), close_dt, close_dt + datetime.timedelta(hours=POST_HOURS)
+
+
+def _now_et(now: Optional[float]) -> datetime.datetime:
+    return datetime.datetime.fromtimestamp(now if now is not None else time.time(), US_EASTERN)
+
+
+def market_session(now: Optional[float] = None) -> str:
+    """One of ``pre``, ``regular``, ``post`` or ``closed``."""
+    now_dt = _now_et(now)
+    bounds = session_bounds(now_dt.date())
+    if bounds is None:
+        return "closed"
+    pre_open, regular_open, close, post_close = bounds
+    if pre_open <= now_dt < regular_open:
+        return "pre"
+    if regular_open <= now_dt < close:
+        return "regular"
+    if close <= now_dt < post_close:
+        return "post"
+    return "closed"
+
+
+def next_session_change(now: Optional[float] = None) -> float:
+    """Unix time of the next session boundary after ``now``."""
+    now_dt = _now_et(now)
+    day = now_dt.date()
+    for _ in range(10):
+        for boundary in session_bounds(day) or ():
+            if boundary > now_dt:
+                return boundary.timestamp()
+        day += datetime.timedelta(days=1)
+    return now_dt.timestamp() + 86400
+
+
+def _latest_settled_session(now: Optional[float]) -> Tuple[datetime.date, float]:
+    now_dt = _now_et(now)
+    day = now_dt.date()
+    while True:
+        bounds = session_bounds(day)
+        if bounds is not None:
+            close_dt = bounds[2] + datetime.timedelta(minutes=SETTLE_MINUTES)
+            if close_dt <= now_dt:
+                return day, close_dt.timestamp()
+        day -= datetime.timedelta(days=1)
+
+
+def latest_session_close(now: Optional[float] = None) -> float:
+    """Unix time after which the most recent daily bar should be available."""
+    return _latest_settled_session(now)[1]
+
+
+def latest_session_date(now: Optional[float] = None) -> str:
+    """Date (YYYY-MM-DD) of the most recent daily bar that should be available."""
+    return _latest_settled_session(now)[0].isoformat()
+
+
+def session_day_start(now: Optional[float] = None) -> float:
+    """Pre-market open of the most recent trading day that has started."""
+    now_dt = _now_et(now)
+    day = now_dt.date()
+    while True:
+        bounds = session_bounds(day)
+        if bounds is not None and bounds[0] <= now_dt:
+            return bounds[0].timestamp()
+        day -= datetime.timedelta(days=1)
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""Prometheus metrics: upstream calls, refresh stages, serving latency and event-loop lag.
+
+Everything is registered on a private ``REGISTRY`` that ``/metrics`` exposes.
+Counters that already live on other objects (cache hits, breaker state) are
+read at scrape time through ``CallbackCollector`` instead of being counted twice.
+"""
+import asyncio
+import contextlib
+import time
+from typing import Any, Awaitable, Callable, Iterable, Iterator, Optional
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client.core import Metric
+
+REGISTRY = CollectorRegistry()
+
+UPSTREAM_SECONDS = Histogram(
+    "market_monitor_upstream_request_seconds",
+    "Duration of upstream calls by source and outcome.",
+    # 不以股票為標籤：監控清單可達數千檔，會產生過多時間序列
+    ("upstream", "outcome"),
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 15, 30, 60, 90),
+    registry=REGISTRY,
+)
+UPSTREAM_ERRORS = Counter(
+    "market_monitor_upstream_errors_total",
+    "Failed or rejected upstream calls by source and reason.",
+    ("upstream", "reason"),
+    registry=REGISTRY,
+)
+STAGE_SECONDS = Histogram(
+    "market_monitor_stage_seconds",
+    "Duration of refresh stages (per ticker for price / history / news).",
+    ("stage",),
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120),
+    registry=REGISTRY,
+)
+REQUEST_SECONDS = Histogram(
+    "market_monitor_http_request_seconds",
+    "Server-side handling time of HTTP requests by path and status.",
+    ("path", "status"),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1),
+    registry=REGISTRY,
+)
+REFRESH_FAILURES = Counter(
+    "market_monitor_refresh_failures_total",
+    "Failed scheduled refreshes by kind (data / ai).",
+    ("kind",),
+    registry=REGISTRY,
+)
+AI_ANALYSES = Counter(
+    "market_monitor_ai_analyses_total",
+    "Per-ticker AI analyses by how they were produced (cache / batch / single / retry).",
+    ("source",),
+    registry=REGISTRY,
+)
+LOOP_LAG = Histogram(
+    "market_monitor_event_loop_lag_seconds",
+    "How late the event loop woke up from a short sleep.",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5),
+    registry=REGISTRY,
+)
+
+
+def error_reason(error: BaseException) -> str:
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    if isinstance(status, int):
+        return f"http_{status}"
+    return type(error).__name__
+
+
+def observe_upstream(name: str, seconds: Optional[float], error: Optional[BaseException]) -> None:
+    """``Upstream`` observer: ``seconds`` is None when the call was rejected without being made."""
+    if seconds is not None:
+        outcome = "ok" if error is None else "error"
+        UPSTREAM_SECONDS.labels(name, outcome).observe(seconds)
+    if error is not None:
+        UPSTREAM_ERRORS.labels(name, error_reason(error)).inc()
+
+
+@contextlib.contextmanager
+def stage_timer(stage: str) -> Iterator[None]:
+    """Time a block (sync or around an ``await``) into ``STAGE_SECONDS``."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(stage).observe(time.perf_counter() - started)
+
+
+async def timed(stage: str, awaitable: Awaitable[Any]) -> Any:
+    with stage_timer(stage):
+        return await awaitable
+
+
+def observe_request(path: str, status: int, seconds: float) -> None:
+    REQUEST_SECONDS.labels(path, str(status)).observe(seconds)
+
+
+async def monitor_event_loop(interval: float = 0.5) -> None:
+    """Sleep ``interval`` seconds in a loop and record how late each wake-up was."""
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        LOOP_LAG.observe(max(0.0, loop.time() - started - interval))
+
+
+class CallbackCollector:
+    """Yields the metric families returned by ``collect_fn`` on every scrape."""
+
+    def __init__(self, collect_fn: Callable[[], Iterable[Metric]]):
+        self.collect_fn = collect_fn
+
+    def collect(self) -> Iterable[Metric]:
+        try:
+            yield from self.collect_fn()
+        except Exception as e:
+            print(f"[metrics] collector failed: {e}")
+
+
+def render_latest() -> bytes:
+    return generate_latest(REGISTRY)
+
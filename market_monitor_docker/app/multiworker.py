@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""Multi-worker serving: one refresher leader, snapshot shared through an mmap'd file.
+
+The worker holding ``LeaderLock`` (a ``lockf`` lock in DATA_DIR) runs the
+collectors and writes every published snapshot into ``SharedSnapshot``;
+the other workers only poll its generation counter and copy the
+pre-encoded bodies when it changes. The lock is released by the kernel
+when the leader exits, so a follower takes over on its next retry.
+"""
+import fcntl
+import json
+import mmap
+import os
+import struct
+import threading
+import zlib
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+MAGIC = b"MMSNAP01"
+# magic, generation, payload length, payload crc32
+HEADER = struct.Struct("<8sQQI")
+HEADER_SIZE = 64
+MIN_CAPACITY = 1 << 20
+
+
+class LeaderLock:
+    """Non-blocking exclusive lock on ``path``; the holder is the refresher leader.
+
+    POSIX record locks (``lockf``) belong to the process, unlike ``flock``
+    locks, which forked children would inherit and keep
+    holding after the leader dies.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._fd: Optional[int] = None
+
+    @property
+    def held(self) -> bool:
+        return self._fd is not None
+
+    def try_acquire(self) -> bool:
+        if self._fd is not None:
+            return True
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.lockf(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, f"{os.getpid()}\n".encode())
+        self._fd = fd
+        return True
+
+    def release(self) -> None:
+        if self._fd is not None:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+
+class SharedSnapshot:
+    """Seqlock-style snapshot buffer in a memory-mapped file.
+
+    The writer bumps the generation to an odd value, copies the payload,
+    then bumps it to the next even value; a reader accepts a copy only if
+    the generation was even and unchanged around the copy and the crc32
+    matches (which also covers weakly ordered CPUs such as the Pi's ARM).
+    The file only grows; readers remap when the payload outgrows their map.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.generation = 0
+        self._fd: Optional[int] = None
+        self._map: Optional[mmap.mmap] = None
+        self._lock = threading.Lock()
+
+    def _open(self, create: bool) -> bool:
+        if self._fd is not None:
+            return True
+        flags = os.O_RDWR | (os.O_CREAT if create else 0)
+        try:
+            self._fd = os.open(self.path, flags, 0o644)
+        except FileNotFoundError:
+            return False
+        if create and os.fstat(self._fd).st_size < HEADER_SIZE + MIN_CAPACITY:
+            os.ftruncate(self._fd, HEADER_SIZE + MIN_CAPACITY)
+        self._remap()
+        return True
+
+    def _remap(self) -> None:
+        if self._map is not None:
+            self._map.close()
+        self._map = mmap.mmap(self._fd, os.fstat(self._fd).st_size)
+
+    def _header(self) -> Tuple[bytes, int, int, int]:
+        return HEADER.unpack_from(self._map, 0)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._map is not None:
+                self._map.close()
+                self._map = None
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+
+    @staticmethod
+    def encode(etag: str, bodies: Dict[str, bytes], extra: Optional[Dict[str, Any]] = None) -> bytes:
+        names = list(bodies)
+        index = json.dumps({
+            "etag": etag,
+            "parts": [[name, len(bodies[name])] for name in names],
+            "extra": extra or {},
+        }, separators=(",", ":")).encode()
+        return struct.pack("<I", len(index)) + index + b"".join(bodies[name] for name in names)
+
+    @staticmethod
+    def decode(payload: bytes) -> Tuple[str, Dict[str, bytes], Dict[str, Any]]:
+        (index_len,) = struct.unpack_from("<I", payload, 0)
+        index = json.loads(payload[4:4 + index_len])
+        bodies: Dict[str, bytes] = {}
+        offset = 4 + index_len
+        for name, length in index["parts"]:
+            bodies[name] = payload[offset:offset + length]
+            offset += length
+        return index["etag"], bodies, index.get("extra") or {}
+
+    def write(self, etag: str, bodies: Dict[str, bytes], extra: Optional[Dict[str, Any]] = None) -> int:
+        """Publish one encoded snapshot; returns the new generation."""
+        payload = self.encode(etag, bodies, extra)
+        with self._lock:
+            self._open(create=True)
+            needed = HEADER_SIZE + len(payload)
+            if needed > len(self._map):
+                capacity = max(MIN_CAPACITY, 1 << (len(payload) * 2 - 1).bit_length())
+                os.ftruncate(self._fd, HEADER_SIZE + capacity)
+                self._remap()
+            _, generation, _, _ = self._header()
+            # 接手的新 leader 從既有的世代繼續；上一個 leader 寫到一半（奇數）時直接跳過
+            writing = generation + 1 if generation % 2 == 0 else generation + 2
+            HEADER.pack_into(self._map, 0, MAGIC, writing, 0, 0)
+            self._map[HEADER_SIZE:needed] = payload
+            HEADER.pack_into(self._map, 0, MAGIC, writing + 1, len(payload), zlib.crc32(payload))
+            self.generation = writing + 1
+            return self.generation
+
+    def read_if_changed(self) -> Optional[Tuple[int, str, Dict[str, bytes], Dict[str, Any]]]:
+        """(generation, etag, bodies, extra) when a newer complete snapshot is available."""
+        with self._lock:
+            if not self._open(create=False):
+                return None
+            magic, generation, length, crc = self._header()
+            if magic != MAGIC or generation == self.generation or generation % 2 or not length:
+                return None
+            if HEADER_SIZE + length > len(self._map):
+                self._remap()
+                if HEADER_SIZE + length > len(self._map):
+                    return None
+            payload = bytes(self._map[HEADER_SIZE:HEADER_SIZE + length])
+            if self._header()[1] != generation or zlib.crc32(payload) != crc:
+                # 讀取期間被覆寫，下一輪再讀
+                return None
+            self.generation = generation
+        etag, bodies, extra = self.decode(payload)
+        return generation, etag, bodies, extra
+
+
+def default_shared_path(data_dir: Path) -> Path:
+    """Prefer tmpfs (/dev/shm) so republishing never touches the disk / SD card."""
+    shm = Path("/dev/shm")
+    if shm.is_dir() and os.access(shm, os.W_OK):
+        tag = zlib.crc32(str(data_dir.resolve()).encode())
+        return shm / f"market_monitor_{tag:08x}.snapshot"
+    return data_dir / "snapshot.shm"
+
+
+def new_items(items: List[Dict[str, Any]], seen: set, key: str = "id") -> List[Dict[str, Any]]:
+    """Items of a newest-first list whose ``key`` was not in ``seen``, oldest first.
+
+    ``seen`` is replaced by the keys of ``items`` so it stays as small as the list.
+    """
+    fresh = [item for item in items if item.get(key) not in seen]
+    seen.clear()
+    seen.update(item.get(key) for item in items)
+    return list(reversed(fresh))
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""RSS ingestion with conditional requests and off-loop feed parsing."""
+import asyncio
+import email.utils as email_utils
+import hashlib
+import time
+from concurrent.futures import Executor
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+
+from resilience import Upstream
+
+
+def parse_feed_entries(content: bytes) -> List[Dict[str, Any]]:
+    """Parse an RSS document into plain headline dicts.
+
+    Module-level so it can run in a process pool; returns only builtin types.
+    """
+    import feedparser
+
+    feed = feedparser.parse(content)
+    items: List[Dict[str, Any]] = []
+    for e in feed.entries:
+        title = e.get("title", "").strip()
+        link = e.get("link", "").strip()
+        if not title or not link:
+            continue
+        published = e.get("published", "") or e.get("updated", "")
+        published_parsed = e.get("published_parsed") or e.get("updated_parsed")
+        if published_parsed:
+            try:
+                published_ts = int(time.mktime(published_parsed))
+            except Exception:
+                published_ts = 0
+        else:
+            try:
+                published_ts = int(time.mktime(email_utils.parsedate(published))) if published else 0
+            except Exception:
+                published_ts = 0
+        source = e.get("source", {})
+        items.append({
+            "title": title,
+            "link": link,
+            "published": published,
+            "published_ts": published_ts,
+            "source": source.get("title") if isinstance(source, dict) else None,
+        })
+    return items
+
+
+class NewsFetcher:
+    """Fetches feeds with ETag / Last-Modified validators and caches parsed entries.
+
+    A 304 response, or a 200 whose body hashes the same as last time, reuses
+    the previous entries without parsing. Concurrent requests for the same
+    URL share one in-flight fetch.
+    """
+
+    def __init__(self, client_for: Callable[[str], httpx.AsyncClient],
+                 executor: Optional[Executor] = None, concurrency: int = 16,
+                 upstream: Optional[Upstream] = None):
+        self.client_for = client_for
+        self.executor = executor
+        self.upstream = upstream or Upstream("news", rate=10, burst=20, deadline=15)
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._feeds: Dict[str, Dict[str, Any]] = {}
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.stats = {"requests": 0, "not_modified": 0, "unchanged": 0, "parsed": 0}
+
+    async def fetch(self, url: str) -> List[Dict[str, Any]]:
+        inflight = self._inflight.get(url)
+        if inflight is not None:
+            return await asyncio.shield(inflight)
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[url] = future
+        try:
+            items = await self._fetch(url)
+            future.set_result(items)
+            return items
+        except Exception as e:
+            future.set_exception(e)
+            # 避免沒有其他等待者時出現 "exception was never retrieved"
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(url, None)
+            if not future.done():
+                # 發起的 task 被取消（CancelledError 不是 Exception）；讓共用這次請求的等待者收到一般錯誤而不是永遠等待
+                future.set_exception(RuntimeError(f"news fetch cancelled: {url}"))
+                future.exception()
+
+    async def _get(self, url: str, headers: Dict[str, str], timeout: float) -> httpx.Response:
+        r = await self.client_for(url).get(url, headers=headers, timeout=timeout)
+        if r.status_code != 304:
+            r.raise_for_status()
+        return r
+
+    async def _fetch(self, url: str) -> List[Dict[str, Any]]:
+        cached = self._feeds.get(url)
+        headers: Dict[str, str] = {}
+        if cached:
+            if cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+
+        async with self._semaphore:
+            self.stats["requests"] += 1
+            r = await self.upstream.acall(self._get, url, headers)
+        if r.status_code == 304 and cached:
+            self.stats["not_modified"] += 1
+            return cached["items"]
+
+        content = r.content
+        digest = hashlib.sha1(content).hexdigest()
+        if cached and cached.get("digest") == digest:
+            self.stats["unchanged"] += 1
+            items = cached["items"]
+        else:
+            loop = asyncio.get_running_loop()
+            items = await loop.run_in_executor(self.executor, parse_feed_entries, content)
+            self.stats["parsed"] += 1
+
+        self._feeds[url] = {
+            "etag": r.headers.get("etag"),
+            "last_modified": r.headers.get("last-modified"),
+            "digest": digest,
+            "items": items,
+        }
+        return items
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""Persistent, deduplicated headline index shared across refresh cycles."""
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+_SPACES = re.compile(r"\s+")
+_TRACKING_PARAMS = ("utm_", "oc", "ved", "usg")
+
+
+def normalize_url(url: str) -> str:
+    parts = urlsplit(url.strip())
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+             if not k.lower().startswith(_TRACKING_PARAMS)]
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, urlencode(sorted(query)), ""))
+
+
+def normalize_title(title: str) -> str:
+    return _SPACES.sub(" ", title).strip().casefold()
+
+
+def article_id(title: str, link: str) -> str:
+    """Stable id for a headline.
+
+    Keyed on the normalized title when present, so the same story returned by
+    several queries (or for several tickers) under different links is stored
+    once; falls back to the normalized URL.
+    """
+    basis = normalize_title(title) or normalize_url(link)
+    return hashlib.sha1(basis.encode("utf-8")).hexdigest()
+
+
+class NewsIndex:
+    """SQLite-backed headlines with first-seen times and ticker associations.
+
+    ``ingest`` only writes items not seen before for that ticker, and
+    ``top`` reads the newest headlines per ticker from an ordered index.
+    """
+
+    def __init__(self, path: Path, retention_days: int = 30):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.retention_sec = max(1, retention_days) * 86400
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS articles (
+                id TEXT PRIMARY KEY,
+                title TEXT NOT NULL,
+                link TEXT NOT NULL,
+                published TEXT,
+                published_ts INTEGER NOT NULL DEFAULT 0,
+                source TEXT,
+                first_seen INTEGER NOT NULL
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS article_tickers (
+                ticker TEXT NOT NULL,
+                article_id TEXT NOT NULL,
+                published_ts INTEGER NOT NULL DEFAULT 0,
+                first_seen INTEGER NOT NULL,
+                PRIMARY KEY (ticker, article_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_article_tickers_recent
+                ON article_tickers (ticker, published_ts DESC);
+            CREATE INDEX IF NOT EXISTS idx_article_tickers_seen
+                ON article_tickers (first_seen);
+        """)
+        self._conn.commit()
+        self._known: Set[Tuple[str, str]] = set(
+            self._conn.execute("SELECT ticker, article_id FROM article_tickers").fetchall()
+        )
+        self._last_evicted = 0.0
+
+    def ingest(self, ticker: str, items: Iterable[Dict[str, Any]], now: Optional[int] = None) -> int:
+        """Store headlines not yet associated with ``ticker``; returns how many were new."""
+        now = int(now if now is not None else time.time())
+        articles = []
+        links = []
+        new_keys: Set[Tuple[str, str]] = set()
+        for item in items:
+            title = (item.get("title") or "").strip()
+            link = (item.get("link") or "").strip()
+            if not title or not link:
+                continue
+            aid = article_id(title, link)
+            key = (ticker, aid)
+            if key in self._known or key in new_keys:
+                continue
+            new_keys.add(key)
+            published_ts = int(item.get("published_ts") or 0)
+            articles.append((aid, title, link, item.get("published") or "", published_ts, item.get("source"), now))
+            links.append((ticker, aid, published_ts, now))
+        if not articles:
+            return 0
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO articles (id, title, link, published, published_ts, source, first_seen) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                articles,
+            )
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO article_tickers (ticker, article_id, published_ts, first_seen) "
+                "VALUES (?, ?, ?, ?)",
+                links,
+            )
+            self._conn.commit()
+            self._known.update(new_keys)
+        return len(new_keys)
+
+    def top(self, ticker: str, limit: int) -> List[Dict[str, Any]]:
+        return self.query(ticker, limit=limit)
+
+    def query(self, ticker: str, limit: int = 50, since: Optional[int] = None,
+              until: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Headlines for ``ticker`` newest first, optionally bounded by published time."""
+        sql = (
+            "SELECT a.title, a.link, a.published, a.published_ts, a.source, t.first_seen "
+            "FROM article_tickers t JOIN articles a ON a.id = t.article_id "
+            "WHERE t.ticker = ?"
+        )
+        params: List[Any] = [ticker]
+        if since is not None:
+            sql += " AND t.published_ts >= ?"
+            params.append(int(since))
+        if until is not None:
+            sql += " AND t.published_ts < ?"
+            params.append(int(until))
+        sql += " ORDER BY t.published_ts DESC LIMIT ?"
+        params.append(int(limit))
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [
+            {
+                "title": title,
+                "link": link,
+                "published": published,
+                "published_ts": published_ts,
+                "source": source,
+                "first_seen": first_seen,
+            }
+            for title, link, published, published_ts, source, first_seen in rows
+        ]
+
+    def evict(self, now: Optional[float] = None, min_interval_sec: int = 3600) -> int:
+        """Drop associations first seen before the retention window (at most hourly)."""
+        now = now if now is not None else time.time()
+        if now - self._last_evicted < min_interval_sec:
+            return 0
+        self._last_evicted = now
+        cutoff = int(now - self.retention_sec)
+        with self._lock:
+            expired = self._conn.execute(
+                "SELECT ticker, article_id FROM article_tickers WHERE first_seen < ?", (cutoff,)
+            ).fetchall()
+            if not expired:
+                return 0
+            self._conn.execute("DELETE FROM article_tickers WHERE first_seen < ?", (cutoff,))
+            self._conn.execute(
+                "DELETE FROM articles WHERE id NOT IN (SELECT DISTINCT article_id FROM article_tickers)"
+            )
+            self._conn.commit()
+            self._known.difference_update(expired)
+        return len(expired)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""Crash-safe JSON persistence: fast encoding, atomic replace, skip unchanged writes."""
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+
+def dumps_json(data: Any) -> bytes:
+    """Compact UTF-8 JSON, using orjson when it is installed."""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def atomic_write_bytes(path: Path, raw: bytes) -> None:
+    """Write ``raw`` to a temp file, fsync it, then rename it over ``path``.
+
+    Readers see either the old or the new file, never a truncated one.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with open(tmp, "wb") as fh:
+            fh.write(raw)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp, path)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+    try:
+        dir_fd = os.open(str(path.parent), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(dir_fd)
+    except OSError:
+        pass
+    finally:
+        os.close(dir_fd)
+
+
+def atomic_write_json(path: Path, data: Any) -> None:
+    atomic_write_bytes(path, dumps_json(data))
+
+
+class SnapshotWriter:
+    """Persists snapshots atomically, skipping writes whose content did not change.
+
+    The content hash ignores ``volatile_keys`` (e.g. the generation
+    timestamps), so an unchanged market state does not rewrite the file on
+    every refresh.
+    """
+
+    def __init__(self, path: Path, volatile_keys: Iterable[str] = ()):
+        self.path = path
+        self.volatile_keys = tuple(volatile_keys)
+        self._lock = threading.Lock()
+        self._last_hash: Optional[str] = None
+        self.writes = 0
+        self.skipped = 0
+
+    def content_hash(self, data: Dict[str, Any]) -> str:
+        stable = {k: v for k, v in data.items() if k not in self.volatile_keys}
+        return hashlib.sha256(dumps_json(stable)).hexdigest()
+
+    def prime(self, data: Dict[str, Any]) -> None:
+        """Remember the hash of the snapshot already on disk."""
+        with self._lock:
+            self._last_hash = self.content_hash(data)
+
+    def write(self, raw: bytes, data: Dict[str, Any]) -> bool:
+        """Persist ``raw`` unless ``data`` hashes the same as the last write."""
+        digest = self.content_hash(data)
+        with self._lock:
+            if digest == self._last_hash and self.path.exists():
+                self.skipped += 1
+                return False
+            atomic_write_bytes(self.path, raw)
+            self._last_hash = digest
+            self.writes += 1
+            return True
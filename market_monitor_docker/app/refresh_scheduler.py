@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""Market-hours-aware refresh cadence for each data class."""
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+from market_calendar import latest_session_close, market_session, next_session_change
+
+# 每次刷新可以只更新其中幾類資料
+DATA_CLASSES = ("quotes", "bars", "news")
+
+
+class RefreshScheduler:
+    """Decides which data classes are due at a given time.
+
+    ``quotes`` and ``news`` run on per-session intervals (``cadences[kind][session]``)
+    and also refresh right after the session changes; ``bars`` run once per
+    trading day after the close has settled; ``ai`` runs every
+    ``ai_interval`` seconds regardless of the session. A failed ``bars`` or
+    ``ai`` run is retried after ``bars_retry_sec`` / ``ai_retry_sec``.
+
+    When a watchlist is split into ``n`` shards (``set_shards``), ``quotes``
+    and ``news`` come due every ``interval / n`` seconds so that one full
+    rotation still takes one interval.
+    """
+
+    def __init__(self, cadences: Dict[str, Dict[str, float]], ai_interval: float,
+                 bars_retry_sec: float = 600, max_sleep_sec: float = 300, ai_retry_sec: float = 600):
+        self.cadences = cadences
+        self.ai_interval = ai_interval
+        self.bars_retry_sec = bars_retry_sec
+        self.ai_retry_sec = ai_retry_sec
+        self.max_sleep_sec = max_sleep_sec
+        self.last_run: Dict[str, float] = {}
+        self.last_session: Dict[str, str] = {}
+        self.shards: Dict[str, int] = {}
+        self._bars_retry_at = 0.0
+        self._ai_retry_at = 0.0
+
+    def interval(self, kind: str, session: Optional[str] = None) -> float:
+        return self.cadences[kind][session or market_session()]
+
+    def set_shards(self, kind: str, count: int) -> None:
+        self.shards[kind] = max(1, count)
+
+    def _next_due(self, kind: str, now: float, session: str) -> float:
+        if kind == "ai":
+            return max(self.last_run.get("ai", 0.0) + self.ai_interval, self._ai_retry_at)
+        if kind == "bars":
+            if self.last_run.get("bars", 0.0) >= latest_session_close(now):
+                # 已同步到最近一次收盤；下次收盤後才會再到期（max_sleep_sec 會定期重新檢查）
+                return float("inf")
+            return self._bars_retry_at
+        if kind not in self.last_run or self.last_session.get(kind) != session:
+            return now
+        return self.last_run[kind] + self.interval(kind, session) / self.shards.get(kind, 1)
+
+    def due(self, now: Optional[float] = None, skip: Iterable[str] = ()) -> List[str]:
+        """Data classes (plus ``ai``) that should be refreshed now; ``skip`` lists kinds still running."""
+        now = now if now is not None else time.time()
+        session = market_session(now)
+        return [kind for kind in (*DATA_CLASSES, "ai")
+                if kind not in skip and self._next_due(kind, now, session) <= now]
+
+    def mark(self, kinds: Iterable[str], now: Optional[float] = None, ok: bool = True) -> None:
+        now = now if now is not None else time.time()
+        session = market_session(now)
+        for kind in kinds:
+            if kind == "bars" and not ok:
+                self._bars_retry_at = now + self.bars_retry_sec
+                continue
+            if kind == "ai" and not ok:
+                # 失敗後不更新 last_run，ai_retry_sec 後再試
+                self._ai_retry_at = now + self.ai_retry_sec
+                continue
+            self.last_run[kind] = now
+            self.last_session[kind] = session
+
+    def sleep_for(self, now: Optional[float] = None, skip: Iterable[str] = ()) -> float:
+        """Seconds until the next data class is due or the session changes, ignoring ``skip``."""
+        now = now if now is not None else time.time()
+        session = market_session(now)
+        wake = min(
+            next_session_change(now),
+            now + self.max_sleep_sec,
+            *(self._next_due(kind, now, session) for kind in (*DATA_CLASSES, "ai") if kind not in skip),
+        )
+        return max(1.0, wake - now)
+
+    @staticmethod
+    def prioritize(tickers: List[str], previous: Dict[str, Any]) -> List[str]:
+        """Order tickers most volatile first so they are collected ahead of quieter ones."""
+        def volatility(ticker: str) -> float:
+            entry = previous.get(ticker) or {}
+            stats = (entry.get("history") or {}).get("stats") or {}
+            vol = stats.get("volatility_20d")
+            move = abs(stats.get("change_percent") or 0.0)
+            return (vol if isinstance(vol, (int, float)) else 0.0) + move
+        return sorted(tickers, key=volatility, reverse=True)
+
+    def stats(self, now: Optional[float] = None) -> Dict[str, Any]:
+        now = now if now is not None else time.time()
+        session = market_session(now)
+        return {
+            "market_session": session,
+            "quote_interval_sec": self.interval("quotes", session),
+            "news_interval_sec": self.interval("news", session),
+            "quote_shards": self.shards.get("quotes", 1),
+            "news_shards": self.shards.get("news", 1),
+            "next_session_change_unix": int(next_session_change(now)),
+        }
@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+"""Per-upstream circuit breakers, request budgets and deadlines.
+
+Every outbound call goes through an ``Upstream`` guard. An open circuit or
+an exhausted budget raises immediately, so callers fall through to their
+next data source instead of waiting out another timeout.
+"""
+import asyncio
+import random
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+# observer(upstream name, call seconds or None when rejected, error or None)
+CallObserver = Callable[[str, Optional[float], Optional[BaseException]], None]
+
+
+class UpstreamUnavailable(Exception):
+    """Raised instead of calling an upstream that should not be hit right now."""
+
+
+class CircuitOpen(UpstreamUnavailable):
+    pass
+
+
+class BudgetExhausted(UpstreamUnavailable):
+    pass
+
+
+def _status_code(exc: BaseException) -> Optional[int]:
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def _retry_after(exc: BaseException) -> Optional[float]:
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def is_upstream_failure(exc: BaseException) -> bool:
+    """Timeouts, connection errors, 429 and 5xx count against the breaker; other 4xx do not."""
+    status = _status_code(exc)
+    if status is None:
+        return True
+    return status == 429 or status >= 500
+
+
+class TokenBucket:
+    """Request budget: ``rate`` requests per second with bursts up to ``burst``."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = max(rate, 1e-6)
+        self.burst = max(burst, 1.0)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, max_wait: float) -> Optional[float]:
+        """Take one token; returns how long to wait for it, or None if that exceeds ``max_wait``."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            wait = max(0.0, (1.0 - self._tokens) / self.rate)
+            if wait > max_wait:
+                return None
+            # 允許預支（tokens 變負數），後到的請求自然排在後面
+            self._tokens -= 1.0
+            return wait
+
+
+class CircuitBreaker:
+    """Closed -> open after ``failure_threshold`` consecutive failures.
+
+    While open every call is rejected. After the cooldown one probe is let
+    through (half-open); success closes the circuit, failure re-opens it with
+    an exponentially longer, jittered cooldown.
+    """
+
+    def __init__(self, failure_threshold: int = 3, base_cooldown: float = 30.0, max_cooldown: float = 600.0):
+        self.failure_threshold = max(1, failure_threshold)
+        self.base_cooldown = base_cooldown
+        self.max_cooldown = max_cooldown
+        self.state = "closed"
+        self.failures = 0
+        self.trips = 0
+        self.opened_until = 0.0
+        self.last_error: Optional[str] = None
+        self._probe_inflight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.time() >= self.opened_until:
+                self.state = "half_open"
+                self._probe_inflight = False
+            if self.state == "half_open" and not self._probe_inflight:
+                self._probe_inflight = True
+                return True
+            return False
+
+    def release_probe(self) -> None:
+        with self._lock:
+            self._probe_inflight = False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self.trips = 0
+            self._probe_inflight = False
+
+    def record_failure(self, error: BaseException) -> None:
+        with self._lock:
+            self.failures += 1
+            self.last_error = f"{type(error).__name__}: {str(error).splitlines()[0] if str(error) else ''}"[:200]
+            if self.state == "open":
+                # 開路前就已送出的請求陸續失敗，不再重複延長冷卻
+                return
+            retry_after = _retry_after(error) if _status_code(error) == 429 else None
+            if self.state == "half_open" or self.failures >= self.failure_threshold or retry_after is not None:
+                cooldown = min(self.max_cooldown, self.base_cooldown * (2 ** self.trips))
+                # 抖動避免多個來源在同一時間一起恢復重試
+                cooldown *= random.uniform(0.5, 1.0)
+                if retry_after is not None:
+                    cooldown = max(cooldown, retry_after)
+                self.state = "open"
+                self.trips += 1
+                self.opened_until = time.time() + cooldown
+            self._probe_inflight = False
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "state": self.state,
+                "failures": self.failures,
+                "trips": self.trips,
+                "open_until_unix": int(self.opened_until) if self.state == "open" else None,
+                "last_error": self.last_error,
+            }
+
+
+class Upstream:
+    """Breaker + budget + deadline for one upstream host or provider.
+
+    The guarded function receives ``timeout=<seconds left>`` so the deadline
+    covers both the wait for a budget token and the request itself. The
+    optional ``observer`` is told about every call and rejection (metrics).
+    """
+
+    def __init__(self, name: str, rate: float, burst: float, deadline: float,
+                 failure_threshold: int = 3, base_cooldown: float = 30.0, max_cooldown: float = 600.0,
+                 observer: Optional[CallObserver] = None):
+        self.name = name
+        self.observer = observer
+        self.deadline = deadline
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = CircuitBreaker(failure_threshold, base_cooldown, max_cooldown)
+        self.calls = 0
+        self.rejected = 0
+
+    def _observe(self, seconds: Optional[float], error: Optional[BaseException]) -> None:
+        if self.observer is not None:
+            self.observer(self.name, seconds, error)
+
+    def _admit(self) -> float:
+        if not self.breaker.allow():
+            self.rejected += 1
+            error: UpstreamUnavailable = CircuitOpen(f"{self.name} circuit open")
+            self._observe(None, error)
+            raise error
+        wait = self.bucket.reserve(max_wait=self.deadline / 2)
+        if wait is None:
+            self.rejected += 1
+            # 沒有實際呼叫，不影響斷路器；但半開的探測名額要釋放
+            self.breaker.release_probe()
+            error = BudgetExhausted(f"{self.name} request budget exhausted")
+            self._observe(None, error)
+            raise error
+        self.calls += 1
+        return wait
+
+    def _record(self, error: Optional[BaseException], started: float) -> None:
+        if error is None or not is_upstream_failure(error):
+            self.breaker.record_success()
+        else:
+            self.breaker.record_failure(error)
+        self._observe(time.perf_counter() - started, error)
+
+    def call(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run a blocking upstream call under this guard."""
+        wait = self._admit()
+        if wait:
+            time.sleep(wait)
+        started = time.perf_counter()
+        try:
+            result = func(*args, timeout=self.deadline - wait, **kwargs)
+        except Exception as e:
+            self._record(e, started)
+            raise
+        self._record(None, started)
+        return result
+
+    async def acall(self, func: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        """Await an upstream coroutine under this guard, cancelling it at the deadline."""
+        wait = self._admit()
+        if wait:
+            await asyncio.sleep(wait)
+        remaining = self.deadline - wait
+        started = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(func(*args, timeout=remaining, **kwargs), timeout=remaining)
+        except asyncio.CancelledError:
+            self.breaker.release_probe()
+            raise
+        except Exception as e:
+            self._record(e, started)
+            raise
+        self._record(None, started)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.breaker.snapshot(), "calls": self.calls, "rejected": self.rejected}
+
+
+class UpstreamRegistry:
+    """Named upstream guards; ``stats()`` is what the snapshot meta exposes.
+
+    ``rate_scale`` multiplies every budget (rate and burst), e.g. when the
+    upstreams are local stand-ins for a benchmark.
+    """
+
+    def __init__(self, failure_threshold: int = 3, base_cooldown: float = 30.0, max_cooldown: float = 600.0,
+                 observer: Optional[CallObserver] = None, rate_scale: float = 1.0):
+        self.failure_threshold = failure_threshold
+        self.base_cooldown = base_cooldown
+        self.max_cooldown = max_cooldown
+        self.observer = observer
+        self.rate_scale = rate_scale
+        self._upstreams: Dict[str, Upstream] = {}
+
+    def add(self, name: str, rate: float, burst: float, deadline: float) -> Upstream:
+        upstream = Upstream(name, rate * self.rate_scale, burst * self.rate_scale, deadline,
+                            self.failure_threshold, self.base_cooldown, self.max_cooldown, self.observer)
+        self._upstreams[name] = upstream
+        return upstream
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {name: upstream.stats() for name, upstream in self._upstreams.items()}
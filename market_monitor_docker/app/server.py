@@ -1,34 +1,52 @@
 \
 # -*- coding: utf-8 -*-
-import os, json, time, asyncio, datetime, math, csv, io
-import email.utils as email_utils
+import os, json, time, asyncio, datetime, math, csv, io, functools, uuid, contextvars, importlib.util
+# 啟動計時的起點：模組開始載入的時間
+MODULE_STARTED = time.perf_counter()
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from pathlib import Path
-from typing import Dict, Any, List, Optional
-from fastapi import FastAPI
-from fastapi.responses import HTMLResponse, JSONResponse
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+from fastapi import FastAPI, Request
+from fastapi.responses import HTMLResponse, JSONResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from jinja2 import Environment, FileSystemLoader, select_autoescape
-import httpx
-import feedparser
-import yfinance as yf
 from pytz import timezone
 from urllib.parse import quote_plus
 from contextlib import redirect_stdout, redirect_stderr
+from http_pool import HttpPool
+from history_store import HistoryStore
+from snapshot_cache import SnapshotCache
+from snapshot_stream import StreamHub
+from snapshot_archive import SnapshotArchive
+from ai_response_cache import AIResponseCache
+from ai_batch import (
+    BATCH_SCHEMA, BATCH_TOOL, SYSTEM_PROMPT, StubProvider, build_batch_prompt, extract_json,
+    normalize_analysis, parse_batch, validate_analysis,
+)
+from news_feed import NewsFetcher, parse_feed_entries
+from news_index import NewsIndex
+from indicators import MIN_LOOKBACK, IndicatorEngine
+from persistence import SnapshotWriter, atomic_write_json, dumps_json
+from resilience import UpstreamRegistry
+from refresh_scheduler import DATA_CLASSES, RefreshScheduler
+from market_calendar import US_EASTERN, market_session, session_day_start
+from intraday import IntradayStore, QuotePollSource, ReplaySource
+from watchlist import ShardRotation, Watchlist
+from alerts import AlertEngine, CallbackSink, FileSink, WebhookSink, deliver_alerts
+from metrics import (
+    AI_ANALYSES, CONTENT_TYPE_LATEST, REFRESH_FAILURES, REGISTRY, CallbackCollector,
+    monitor_event_loop, observe_request, observe_upstream, render_latest, stage_timer, timed,
+)
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from multiworker import LeaderLock, SharedSnapshot, default_shared_path, new_items
 
-try:
-    import anthropic
-    ANTHROPIC_AVAILABLE = True
-except ImportError:
-    ANTHROPIC_AVAILABLE = False
-
-try:
-    from openai import OpenAI
-    OPENAI_AVAILABLE = True
-except ImportError:
-    OPENAI_AVAILABLE = False
+# yfinance（連帶 pandas）與 AI SDK 載入很慢，只檢查是否安裝，實際用到時才匯入（見 lazy_import）
+ANTHROPIC_AVAILABLE = importlib.util.find_spec("anthropic") is not None
+OPENAI_AVAILABLE = importlib.util.find_spec("openai") is not None
 
 APP_DIR = Path(__file__).resolve().parent
-DATA_DIR = APP_DIR / "data"
+DATA_DIR = Path(os.getenv("DATA_DIR", str(APP_DIR / "data")))
 TEMPLATE_DIR = APP_DIR / "templates"
 STATIC_DIR = APP_DIR / "static"
 
@@ -41,16 +59,213 @@ else:
     DATA_UPDATE_INTERVAL_SEC = max(15, int(os.getenv("UPDATE_INTERVAL_MIN", "1")) * 60)
 
 AI_UPDATE_INTERVAL_SEC = max(3600, int(float(os.getenv("AI_UPDATE_INTERVAL_HOURS", "24")) * 3600))
-
+# 美股交易時段外放慢報價與新聞更新；DATA_UPDATE_INTERVAL_SEC 為盤中報價頻率
+QUOTE_EXTENDED_INTERVAL_SEC = max(DATA_UPDATE_INTERVAL_SEC, int(os.getenv("QUOTE_EXTENDED_INTERVAL_SEC", "300")))
+QUOTE_CLOSED_INTERVAL_SEC = max(QUOTE_EXTENDED_INTERVAL_SEC, int(os.getenv("QUOTE_CLOSED_INTERVAL_SEC", "3600")))
+NEWS_INTERVAL_SEC = max(60, int(os.getenv("NEWS_INTERVAL_SEC", "600")))
+NEWS_CLOSED_INTERVAL_SEC = max(NEWS_INTERVAL_SEC, int(os.getenv("NEWS_CLOSED_INTERVAL_SEC", "3600")))
+# 同時進行的 AI 分析請求數
+AI_CONCURRENCY = max(1, int(os.getenv("AI_CONCURRENCY", "3")))
+# 排程的 AI 分析失敗後重試前的等待秒數
+AI_RETRY_SEC = max(60, int(os.getenv("AI_RETRY_SEC", "600")))
+
+# 未提供 WATCHLIST_PATH 檔案時的監控清單
 TICKERS = [t.strip() for t in os.getenv("TICKERS", "NVDA,SMCI,QQQ").split(",") if t.strip()]
+# 大型清單切成每片 REFRESH_SHARD_SIZE 檔，報價與新聞每次只刷新一片，一個週期內輪完
+REFRESH_SHARD_SIZE = max(1, int(os.getenv("REFRESH_SHARD_SIZE", "200")))
 NEWS_PER_TICKER = int(os.getenv("NEWS_PER_TICKER", "12"))
+NEWS_RETENTION_DAYS = max(1, int(os.getenv("NEWS_RETENTION_DAYS", "30")))
 HISTORY_DAYS = int(os.getenv("HISTORY_DAYS", "30"))
+# 盤中分鐘 K：poll（交易時段輪詢報價）、replay（重播本機 CSV，測試用）或 off
+INTRADAY_SOURCE = os.getenv("INTRADAY_SOURCE", "poll").strip().lower()
+INTRADAY_POLL_SEC = max(5, int(os.getenv("INTRADAY_POLL_SEC", "15")))
+# 每次輪詢的股票數上限；0 表示依 Yahoo quote 請求預算自動計算（保留一半給排程的報價更新）
+INTRADAY_POLL_MAX_SYMBOLS = max(0, int(os.getenv("INTRADAY_POLL_MAX_SYMBOLS", "0")))
+INTRADAY_CAPACITY_MIN = max(60, int(os.getenv("INTRADAY_CAPACITY_MIN", "1440")))
+INTRADAY_CHART_POINTS = max(10, int(os.getenv("INTRADAY_CHART_POINTS", "120")))
+INTRADAY_REPLAY_PATH = os.getenv("INTRADAY_REPLAY_PATH", "")
+INTRADAY_REPLAY_SPEED = max(0.01, float(os.getenv("INTRADAY_REPLAY_SPEED", "1")))
+# 技術指標使用的 K 棒數與相關係數基準
+INDICATOR_LOOKBACK = max(HISTORY_DAYS, MIN_LOOKBACK, int(os.getenv("INDICATOR_LOOKBACK", "120")))
+INDICATOR_BENCHMARK = os.getenv("INDICATOR_BENCHMARK", "QQQ").strip().upper()
+# 首次建立歷史資料庫時向 Stooq 回補的日曆天數
+HISTORY_BACKFILL_DAYS = max(INDICATOR_LOOKBACK * 2, int(os.getenv("HISTORY_BACKFILL_DAYS", "400")))
+# 同時收集的股票數上限，以及阻塞式資料源（Yahoo / Stooq / yfinance）使用的執行緒數
+REFRESH_CONCURRENCY = max(1, int(os.getenv("REFRESH_CONCURRENCY", "8")))
+FETCH_WORKERS = max(1, int(os.getenv("FETCH_WORKERS", str(REFRESH_CONCURRENCY * 2))))
+# 新聞 RSS 同時請求數，以及解析 RSS 的行程數（0 表示改用執行緒）
+NEWS_CONCURRENCY = max(1, int(os.getenv("NEWS_CONCURRENCY", "16")))
+NEWS_PARSE_WORKERS = max(0, int(os.getenv("NEWS_PARSE_WORKERS", "2")))
+# Yahoo quote API 單次請求的股票數
+QUOTE_BATCH_SIZE = max(1, int(os.getenv("QUOTE_BATCH_SIZE", "50")))
 TZ = os.getenv("TZ", "Asia/Taipei")
 UA = "Mozilla/5.0 (compatible; MarketMonitorBot/1.0)"
+# 每個上游主機共用的連線池設定
+HTTP_MAX_CONNECTIONS = max(1, int(os.getenv("HTTP_MAX_CONNECTIONS", "20")))
+HTTP_MAX_KEEPALIVE = max(0, int(os.getenv("HTTP_MAX_KEEPALIVE", "10")))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY_SEC", "120"))
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "1").lower() not in ("0", "false", "no")
+# 上游位址可改指向本機替身（見 bench/），預設為正式服務
+YAHOO_QUOTE_BASE_URL = os.getenv("YAHOO_QUOTE_BASE_URL", "https://query1.finance.yahoo.com").rstrip("/")
+STOOQ_BASE_URL = os.getenv("STOOQ_BASE_URL", "https://stooq.com").rstrip("/")
+GOOGLE_NEWS_BASE_URL = os.getenv("GOOGLE_NEWS_BASE_URL", "https://news.google.com").rstrip("/")
+UPSTREAM_HOSTS = [YAHOO_QUOTE_BASE_URL, STOOQ_BASE_URL, GOOGLE_NEWS_BASE_URL]
+# yfinance 無法改指向替身；設為 0 時不使用這個最後備援
+YFINANCE_ENABLED = os.getenv("YFINANCE_ENABLED", "1").lower() not in ("0", "false", "no")
+# 放大每個上游的請求預算（例如壓測本機替身時），1 為正式設定
+UPSTREAM_RATE_SCALE = max(0.01, float(os.getenv("UPSTREAM_RATE_SCALE", "1")))
+# 斷路器：連續失敗次數門檻與開路冷卻時間（每次重新開路加倍，含隨機抖動）
+UPSTREAM_FAILURE_THRESHOLD = max(1, int(os.getenv("UPSTREAM_FAILURE_THRESHOLD", "3")))
+UPSTREAM_COOLDOWN_SEC = max(1.0, float(os.getenv("UPSTREAM_COOLDOWN_SEC", "30")))
+UPSTREAM_MAX_COOLDOWN_SEC = max(UPSTREAM_COOLDOWN_SEC, float(os.getenv("UPSTREAM_MAX_COOLDOWN_SEC", "600")))
+# 多 worker：SERVER_WORKERS > 1 時以 DATA_DIR 中的檔案鎖選出唯一執行刷新的 leader，
+# 其餘 worker 透過共享記憶體讀取 leader 發佈的快照
+SERVER_WORKERS = max(1, int(os.getenv("SERVER_WORKERS", "1")))
+MULTI_WORKER = SERVER_WORKERS > 1
+LEADER_RETRY_SEC = max(1.0, float(os.getenv("LEADER_RETRY_SEC", "5")))
+SHARED_POLL_SEC = max(0.05, float(os.getenv("SHARED_POLL_SEC", "0.25")))
+SHARED_SNAPSHOT_PATH = Path(os.getenv("SHARED_SNAPSHOT_PATH", "") or default_shared_path(DATA_DIR))
+LEADER_LOCK = LeaderLock(DATA_DIR / "refresher.lock")
+SHARED_SNAPSHOT = SharedSnapshot(SHARED_SNAPSHOT_PATH)
+SHARED_ALERTS_KEEP = 20
+AI_TRIGGER_PATH = DATA_DIR / "ai_trigger.json"
+AI_JOBS_PATH = DATA_DIR / "ai_jobs.json"
 JSON_PATH = DATA_DIR / "dashboard.json"
+SNAPSHOT = SnapshotCache()
+# 產生時間與 meta 統計每次都不同，不列入內容雜湊；內容未變時不重寫檔案以減少 SD 卡寫入
+SNAPSHOT_WRITER = SnapshotWriter(JSON_PATH, volatile_keys=("generated_at_unix", "generated_at_local", "meta"))
+REFRESH_STATUS_PATH = DATA_DIR / "refresh_status.json"
+REFRESH_STATUS: Dict[str, Any] = {"consecutive_failures": 0}
+STREAM_HUB = StreamHub()
 STOOQ_CACHE: Dict[str, List[Dict[str, Any]]] = {}
+HISTORY_DB_PATH = Path(os.getenv("HISTORY_DB_PATH", str(DATA_DIR / "history.sqlite3")))
+HISTORY_STORE = HistoryStore(HISTORY_DB_PATH)
+INDICATOR_ENGINE = IndicatorEngine(benchmark=INDICATOR_BENCHMARK, lookback=INDICATOR_LOOKBACK)
+NEWS_DB_PATH = Path(os.getenv("NEWS_DB_PATH", str(DATA_DIR / "news.sqlite3")))
+NEWS_INDEX = NewsIndex(NEWS_DB_PATH, retention_days=NEWS_RETENTION_DAYS)
+INTRADAY = IntradayStore(capacity=INTRADAY_CAPACITY_MIN)
+# 告警規則（JSON，修改後下一次刷新自動重新載入）與輸出目的地
+ALERT_RULES_PATH = Path(os.getenv("ALERT_RULES_PATH", str(DATA_DIR / "alert_rules.json")))
+ALERT_LOG_PATH = Path(os.getenv("ALERT_LOG_PATH", str(DATA_DIR / "alerts.jsonl")))
+ALERT_WEBHOOK_URL = os.getenv("ALERT_WEBHOOK_URL", "").strip()
+ALERT_COOLDOWN_SEC = max(0, int(os.getenv("ALERT_COOLDOWN_SEC", "900")))
+ALERTS = AlertEngine(ALERT_RULES_PATH, cooldown_sec=ALERT_COOLDOWN_SEC)
+# 監控清單（JSON：群組、新聞查詢樣板、優先度、Stooq 交易所；修改後下一次刷新自動重新載入）
+WATCHLIST_PATH = Path(os.getenv("WATCHLIST_PATH", str(DATA_DIR / "watchlist.json")))
+WATCHLIST = Watchlist(WATCHLIST_PATH, TICKERS)
+SHARDED_CLASSES = ("quotes", "news")
+SHARD_ROTATIONS = {kind: ShardRotation(REFRESH_SHARD_SIZE) for kind in SHARDED_CLASSES}
+# 快照封存：每次發佈的快照以差分形式附加到 DATA_DIR/archive，可用 /api/snapshot?at= 回查
+ARCHIVE_ENABLED = os.getenv("ARCHIVE_ENABLED", "1").strip().lower() not in ("0", "false", "no")
+SNAPSHOT_ARCHIVE = SnapshotArchive(
+    Path(os.getenv("ARCHIVE_DIR", str(DATA_DIR / "archive"))),
+    keyframe_every=max(1, int(os.getenv("ARCHIVE_KEYFRAME_EVERY", "60"))),
+    segment_sec=max(1.0, float(os.getenv("ARCHIVE_SEGMENT_HOURS", "24"))) * 3600,
+    retention_sec=max(1.0, float(os.getenv("ARCHIVE_RETENTION_DAYS", "90"))) * 86400,
+    compact_after_sec=max(1.0, float(os.getenv("ARCHIVE_COMPACT_AFTER_DAYS", "7"))) * 86400,
+    compact_interval_sec=max(1.0, float(os.getenv("ARCHIVE_COMPACT_INTERVAL_MIN", "15"))) * 60,
+) if ARCHIVE_ENABLED else None
+ARCHIVE_MAINTENANCE_SEC = 3600
 AI_CACHE_PATH = DATA_DIR / "ai_analysis.json"
+# 以輸入內容雜湊為鍵的 AI 回應快取，與 ai_analysis.json 放在一起
+AI_RESPONSE_CACHE = AIResponseCache(
+    DATA_DIR / "ai_responses.json",
+    ttl_sec=int(float(os.getenv("AI_RESPONSE_CACHE_TTL_HOURS", "72")) * 3600),
+    max_entries=max(1, int(os.getenv("AI_RESPONSE_CACHE_MAX", "500"))),
+)
+SCHEDULER = RefreshScheduler(
+    cadences={
+        "quotes": {
+            "pre": QUOTE_EXTENDED_INTERVAL_SEC,
+            "regular": DATA_UPDATE_INTERVAL_SEC,
+            "post": QUOTE_EXTENDED_INTERVAL_SEC,
+            "closed": QUOTE_CLOSED_INTERVAL_SEC,
+        },
+        "news": {
+            "pre": NEWS_INTERVAL_SEC,
+            "regular": NEWS_INTERVAL_SEC,
+            "post": NEWS_INTERVAL_SEC,
+            "closed": NEWS_CLOSED_INTERVAL_SEC,
+        },
+    },
+    ai_interval=AI_UPDATE_INTERVAL_SEC,
+    ai_retry_sec=AI_RETRY_SEC,
+)
+
+
+def reload_watchlist() -> bool:
+    """Pick up watchlist file changes and re-split the refresh shards."""
+    if not WATCHLIST.reload_if_changed():
+        return False
+    items = list(WATCHLIST.items.values())
+    for kind, rotation in SHARD_ROTATIONS.items():
+        rotation.rebuild(items)
+        SCHEDULER.set_shards(kind, rotation.count)
+    print(f"[watchlist] {len(items)} tickers in {len(WATCHLIST.groups)} groups, "
+          f"{SHARD_ROTATIONS['quotes'].count} refresh shards")
+    return True
+
+
+reload_watchlist()
 DATA_LOCK = asyncio.Lock()
+# 背景執行中的日 K 同步（見 run_bars_stage）
+BARS_TASK: Dict[str, Optional[asyncio.Task]] = {"task": None}
+AI_LOCK = asyncio.Lock()
+AI_JOBS: Dict[str, Dict[str, Any]] = {}
+AI_JOBS_KEEP = 20
+_AI_CLIENTS: Dict[str, Any] = {}
+# 啟動各階段（import / ready / first_snapshot / first_refresh）距模組載入的秒數，以及延遲匯入的耗時
+STARTUP_SECONDS: Dict[str, float] = {}
+LAZY_IMPORT_SECONDS: Dict[str, float] = {}
+FETCH_EXECUTOR = ThreadPoolExecutor(max_workers=FETCH_WORKERS, thread_name_prefix="fetch")
+HTTP_POOL = HttpPool(
+    user_agent=UA,
+    max_connections=HTTP_MAX_CONNECTIONS,
+    max_keepalive=HTTP_MAX_KEEPALIVE,
+    keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+    http2=HTTP2_ENABLED,
+)
+def news_parse_context():
+    """Start method for the RSS parse processes.
+
+    ``forkserver`` forks workers from a clean single-threaded server process,
+    so a pool started late (e.g. when a follower takes over as leader, with
+    thread pools already running) never inherits locks held by other
+    threads. Only ``news_feed`` is preloaded there, not this module.
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload(["news_feed"])
+        return context
+    return multiprocessing.get_context("spawn")
+
+
+# RSS 解析是 CPU 密集工作，放到獨立行程避免佔住 event loop 與 GIL
+NEWS_PARSE_EXECUTOR = (
+    ProcessPoolExecutor(max_workers=NEWS_PARSE_WORKERS, mp_context=news_parse_context())
+    if NEWS_PARSE_WORKERS > 0 else FETCH_EXECUTOR
+)
+UPSTREAMS = UpstreamRegistry(
+    failure_threshold=UPSTREAM_FAILURE_THRESHOLD,
+    base_cooldown=UPSTREAM_COOLDOWN_SEC,
+    max_cooldown=UPSTREAM_MAX_COOLDOWN_SEC,
+    observer=observe_upstream,
+    rate_scale=UPSTREAM_RATE_SCALE,
+)
+# 每個來源的請求預算（每秒請求數、突發上限）與單次呼叫期限（秒）
+YAHOO_QUOTE = UPSTREAMS.add("yahoo_quote", rate=2, burst=5, deadline=10)
+STOOQ = UPSTREAMS.add("stooq", rate=5, burst=10, deadline=10)
+YFINANCE = UPSTREAMS.add("yfinance", rate=1, burst=3, deadline=15)
+GOOGLE_NEWS = UPSTREAMS.add("google_news", rate=5, burst=20, deadline=15)
+OPENAI_UPSTREAM = UPSTREAMS.add("openai", rate=1, burst=3, deadline=90)
+ANTHROPIC_UPSTREAM = UPSTREAMS.add("anthropic", rate=1, burst=3, deadline=90)
+ALERT_WEBHOOK = UPSTREAMS.add("alert_webhook", rate=1, burst=5, deadline=10)
+NEWS_FETCHER = NewsFetcher(
+    client_for=lambda url: HTTP_POOL.async_client(url),
+    upstream=GOOGLE_NEWS,
+    executor=NEWS_PARSE_EXECUTOR,
+    concurrency=NEWS_CONCURRENCY,
+)
 
 
 def load_ai_cache() -> Dict[str, Any]:
@@ -73,8 +288,7 @@ def load_ai_cache() -> Dict[str, Any]:
 
 
 def save_ai_cache(cache: Dict[str, Any]) -> None:
-    AI_CACHE_PATH.parent.mkdir(exist_ok=True, parents=True)
-    AI_CACHE_PATH.write_text(json.dumps(cache, ensure_ascii=False, indent=2), encoding="utf-8")
+    atomic_write_json(AI_CACHE_PATH, cache)
 
 
 def default_ai_analysis() -> Dict[str, Any]:
@@ -88,9 +302,18 @@ def default_ai_analysis() -> Dict[str, Any]:
     }
 
 # AI Provider Configuration
-AI_PROVIDER = os.getenv("AI_PROVIDER", "openai").lower()  # openai, anthropic, or none
+AI_PROVIDER = os.getenv("AI_PROVIDER", "openai").lower()  # openai, anthropic, stub (offline), or none
 ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY", "")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+ANTHROPIC_MODEL = os.getenv("ANTHROPIC_MODEL", "claude-sonnet-4-5")
+# 空字串使用 SDK 預設位址
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "").strip() or None
+ANTHROPIC_BASE_URL = os.getenv("ANTHROPIC_BASE_URL", "").strip() or None
+# 每次 AI 請求合併分析的股票數；1 則每檔各自送出
+AI_BATCH_SIZE = max(1, int(os.getenv("AI_BATCH_SIZE", "5")))
+# stub provider 在批次回應中故意略過的股票比例，用來測試逐檔重試
+AI_STUB = StubProvider(drop_rate=min(1.0, max(0.0, float(os.getenv("AI_STUB_DROP_RATE", "0")))))
 
 env = Environment(
     loader=FileSystemLoader(str(TEMPLATE_DIR)),
@@ -100,6 +323,22 @@ env = Environment(
 app = FastAPI(title="Market Monitor")
 app.mount("/static", StaticFiles(directory=str(STATIC_DIR)), name="static")
 
+@functools.lru_cache(maxsize=None)
+def lazy_import(name: str):
+    """Import a heavy optional module on first use and record how long it took."""
+    started = time.perf_counter()
+    module = importlib.import_module(name)
+    LAZY_IMPORT_SECONDS[name] = time.perf_counter() - started
+    print(f"[startup] lazily imported {name} in {LAZY_IMPORT_SECONDS[name]:.2f}s")
+    return module
+
+
+def mark_startup(phase: str) -> None:
+    """Record the first time ``phase`` is reached, in seconds since the module started loading."""
+    if phase not in STARTUP_SECONDS:
+        STARTUP_SECONDS[phase] = time.perf_counter() - MODULE_STARTED
+
+
 def now_ts():
     return int(time.time())
 
@@ -107,34 +346,145 @@ def now_iso_tz(tz=TZ):
     tzobj = timezone(tz)
     return datetime.datetime.now(tzobj).strftime("%Y-%m-%d %H:%M:%S %Z")
 
-def _fetch_quote_via_http(ticker: str) -> Optional[Dict[str, Any]]:
-    """Use Yahoo quote API directly to reduce yfinance rate-limit errors."""
-    url = f"https://query1.finance.yahoo.com/v7/finance/quote?symbols={quote_plus(ticker)}"
+def _get_checked(url: str, headers: Dict[str, str], timeout: float):
+    resp = HTTP_POOL.client(url).get(url, headers=headers, timeout=timeout)
+    resp.raise_for_status()
+    return resp
+
+
+def _fetch_quotes_via_http(tickers: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Fetch several symbols from the Yahoo quote API in one request."""
+    symbols = ",".join(quote_plus(t) for t in tickers)
+    url = f"{YAHOO_QUOTE_BASE_URL}/v7/finance/quote?symbols={symbols}"
     headers = {
-        "User-Agent": UA,
         "Accept": "application/json",
         "Accept-Language": "en-US,en;q=0.9",
     }
-    with httpx.Client(timeout=10.0, headers=headers, follow_redirects=True) as client:
-        resp = client.get(url)
-        resp.raise_for_status()
-        data = resp.json()
-    results = data.get("quoteResponse", {}).get("result", [])
-    return results[0] if results else None
-
-
-def _fetch_stooq_series(ticker: str) -> List[Dict[str, Any]]:
-    """Fetch daily OHLCV data from Stooq to use as a fallback data source."""
-    symbol = f"{ticker.lower()}.us"
-    url = f"https://stooq.com/q/d/l/?s={symbol}&i=d"
+    resp = YAHOO_QUOTE.call(_get_checked, url, headers)
+    data = resp.json()
+    results = data.get("quoteResponse", {}).get("result", []) or []
+    wanted = {t.upper(): t for t in tickers}
+    quotes: Dict[str, Dict[str, Any]] = {}
+    for item in results:
+        symbol = str(item.get("symbol") or "").upper()
+        if symbol in wanted:
+            quotes[wanted[symbol]] = item
+    return quotes
+
+
+async def fetch_quotes_batched(tickers: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Fetch quotes for all tickers in QUOTE_BATCH_SIZE chunks, concurrently.
+
+    A failed chunk simply leaves its symbols out of the result so that
+    ``fetch_price_summary`` can fall back to Stooq / yfinance for them.
+    """
+    chunks = [tickers[i:i + QUOTE_BATCH_SIZE] for i in range(0, len(tickers), QUOTE_BATCH_SIZE)]
+    results = await asyncio.gather(
+        *(run_blocking(_fetch_quotes_via_http, chunk) for chunk in chunks),
+        return_exceptions=True,
+    )
+    quotes: Dict[str, Dict[str, Any]] = {}
+    for result in results:
+        if isinstance(result, dict):
+            quotes.update(result)
+    return quotes
+
+
+def _price_from_quote(quote_data: Dict[str, Any]) -> Optional[float]:
+    price_candidates = [
+        quote_data.get("regularMarketPrice"),
+        quote_data.get("postMarketPrice"),
+        quote_data.get("preMarketPrice"),
+        quote_data.get("regularMarketPreviousClose"),
+        quote_data.get("previousClose"),
+    ]
+    for candidate in price_candidates:
+        if isinstance(candidate, (int, float)):
+            value = float(candidate)
+            if not math.isnan(value):
+                return value
+    return None
+
+
+def _tick_from_quote(quote_data: Dict[str, Any]) -> Optional[Tuple[float, float, Optional[float]]]:
+    """(timestamp, price, cumulative volume) of the quote's latest trade for the intraday bars."""
+    keys = [("regularMarketPrice", "regularMarketTime")]
+    session = market_session()
+    # 盤前 / 盤後時段優先採用延長交易的價格與時間
+    if session == "pre":
+        keys.insert(0, ("preMarketPrice", "preMarketTime"))
+    elif session == "post":
+        keys.insert(0, ("postMarketPrice", "postMarketTime"))
+    for price_key, time_key in keys:
+        price = quote_data.get(price_key)
+        if isinstance(price, (int, float)) and not math.isnan(price):
+            ts = quote_data.get(time_key)
+            volume = quote_data.get("regularMarketVolume")
+            return (
+                float(ts) if isinstance(ts, (int, float)) else time.time(),
+                float(price),
+                float(volume) if isinstance(volume, (int, float)) else None,
+            )
+    return None
+
+
+def intraday_poll_limit() -> int:
+    """Symbols per intraday poll: INTRADAY_POLL_MAX_SYMBOLS, or what half the quote budget allows."""
+    if INTRADAY_POLL_MAX_SYMBOLS:
+        return INTRADAY_POLL_MAX_SYMBOLS
+    requests = max(1, int(YAHOO_QUOTE.bucket.rate * INTRADAY_POLL_SEC / 2))
+    return requests * QUOTE_BATCH_SIZE
+
+
+def make_intraday_source():
+    if INTRADAY_SOURCE == "poll":
+        return QuotePollSource(
+            fetch_quotes=fetch_quotes_batched,
+            tickers=lambda: WATCHLIST.symbols,
+            to_tick=_tick_from_quote,
+            interval=INTRADAY_POLL_SEC,
+            active=lambda: market_session() != "closed",
+            max_symbols=intraday_poll_limit(),
+        )
+    if INTRADAY_SOURCE == "replay" and INTRADAY_REPLAY_PATH:
+        return ReplaySource(Path(INTRADAY_REPLAY_PATH), speed=INTRADAY_REPLAY_SPEED)
+    return None
+
+
+INTRADAY_FEED = make_intraday_source()
+
+
+async def current_quotes(tickers: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Batched quotes for a scheduled refresh, reusing a recent intraday poll when there is one."""
+    polling = isinstance(INTRADAY_FEED, QuotePollSource)
+    if polling:
+        recent = INTRADAY_FEED.recent_quotes(tickers, max_age=INTRADAY_POLL_SEC * 2)
+        if recent is not None:
+            return recent
+    quotes = await fetch_quotes_batched(tickers)
+    if polling:
+        INTRADAY_FEED.feed(quotes, INTRADAY.add_tick)
+    return quotes
+
+
+def _fetch_stooq_series(ticker: str, since: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Fetch daily OHLCV data from Stooq to use as a fallback data source.
+
+    ``since`` (YYYY-MM-DD) limits the download to bars on or after that date;
+    without it only the last HISTORY_BACKFILL_DAYS calendar days are requested.
+    """
+    symbol = WATCHLIST.stooq_symbol(ticker)
+    if since:
+        start = datetime.date.fromisoformat(since)
+    else:
+        start = datetime.date.today() - datetime.timedelta(days=HISTORY_BACKFILL_DAYS)
+    end = datetime.date.today() + datetime.timedelta(days=1)
+    url = f"{STOOQ_BASE_URL}/q/d/l/?s={symbol}&i=d&d1={start:%Y%m%d}&d2={end:%Y%m%d}"
     headers = {
-        "User-Agent": UA,
         "Accept": "text/csv",
     }
-    with httpx.Client(timeout=10.0, headers=headers, follow_redirects=True) as client:
-        resp = client.get(url)
-        resp.raise_for_status()
-        text = resp.text.strip()
+    resp = STOOQ.call(_get_checked, url, headers)
+    text = resp.text.strip()
 
     if not text:
         return []
@@ -180,38 +530,72 @@ def _fetch_stooq_series(ticker: str) -> List[Dict[str, Any]]:
     return rows
 
 
+def sync_stooq_history(ticker: str) -> bool:
+    """Append new Stooq bars to the history store; True once the latest session's bar is in."""
+    if HISTORY_STORE.is_fresh(ticker):
+        return True
+    fetched_at = now_ts()
+    rows = _fetch_stooq_series(ticker, since=HISTORY_STORE.last_date(ticker))
+    HISTORY_STORE.append(ticker, rows, fetched_at=fetched_at)
+    return HISTORY_STORE.is_fresh(ticker)
+
+
+async def sync_all_history(tickers: List[str]) -> bool:
+    """Daily-bar stage: sync every ticker (and the benchmark); True when all are up to date.
+
+    Tickers are synced concurrently on the fetch executor, bounded by
+    REFRESH_CONCURRENCY; the Stooq budget still paces the requests.
+    """
+    semaphore = asyncio.Semaphore(REFRESH_CONCURRENCY)
+
+    async def sync(ticker: str) -> bool:
+        async with semaphore:
+            return await run_blocking(sync_stooq_history, ticker)
+
+    results = await asyncio.gather(
+        *(sync(ticker) for ticker in dict.fromkeys([*tickers, INDICATOR_BENCHMARK])),
+        return_exceptions=True,
+    )
+    # 有股票還沒拿到當日 K 棒時回傳 False，由排程在 bars_retry_sec 後重試（已更新的股票會略過）
+    return all(result is True for result in results)
+
+
 def get_stooq_series(ticker: str) -> List[Dict[str, Any]]:
     if ticker not in STOOQ_CACHE:
-        STOOQ_CACHE[ticker] = _fetch_stooq_series(ticker)
+        # 日 K 由排程的 bars 階段同步；這裡只在資料庫完全沒有資料時（新加入的股票）補抓
+        if HISTORY_STORE.last_date(ticker) is None:
+            sync_stooq_history(ticker)
+        STOOQ_CACHE[ticker] = HISTORY_STORE.recent(ticker, INDICATOR_LOOKBACK)
     return STOOQ_CACHE[ticker]
 
 
-def fetch_price_summary(ticker: str) -> Dict[str, Any]:
+def fetch_price_summary(ticker: str, quote_data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Resolve the latest price for ``ticker``.
+
+    ``quote_data`` is the ticker's entry from the batched quote request
+    (``fetch_quotes_batched``); when it is missing or has no usable price,
+    Stooq and then yfinance are used as fallbacks.
+    """
     price = None
     currency = "USD"
     exchange = None
 
     try:
-        quote_data = _fetch_quote_via_http(ticker)
         if quote_data:
-            price_candidates = [
-                quote_data.get("regularMarketPrice"),
-                quote_data.get("postMarketPrice"),
-                quote_data.get("preMarketPrice"),
-                quote_data.get("regularMarketPreviousClose"),
-                quote_data.get("previousClose"),
-            ]
-            for candidate in price_candidates:
-                if isinstance(candidate, (int, float)):
-                    value = float(candidate)
-                    if not math.isnan(value):
-                        price = value
-                        break
+            price = _price_from_quote(quote_data)
             currency = quote_data.get("currency") or currency
             exchange = quote_data.get("fullExchangeName") or quote_data.get("exchange") or exchange
     except Exception:
         pass
 
+    if price is not None:
+        return {
+            "ticker": ticker,
+            "price": price,
+            "currency": currency,
+            "exchange": exchange,
+        }
+
     try:
         stooq_series = get_stooq_series(ticker)
         if stooq_series:
@@ -220,40 +604,11 @@ def fetch_price_summary(ticker: str) -> Dict[str, Any]:
     except Exception:
         pass
 
+    if price is None and not YFINANCE_ENABLED:
+        return {"ticker": ticker, "error": "price_fetch_failed: no quote or Stooq data"}
     if price is None:
         try:
-            buf_out, buf_err = io.StringIO(), io.StringIO()
-            with redirect_stdout(buf_out), redirect_stderr(buf_err):
-                tk = yf.Ticker(ticker)
-                info = tk.fast_info
-                def safe_get(key: str):
-                    if not info:
-                        return None
-                    try:
-                        return info.get(key)
-                    except Exception:
-                        try:
-                            return getattr(info, key)
-                        except Exception:
-                            return None
-                for candidate in ("lastPrice", "last_price", "regularMarketPrice", "regularMarketPreviousClose", "previousClose"):
-                    val = safe_get(candidate)
-                    if val is None:
-                        continue
-                    try:
-                        num = float(val)
-                    except (TypeError, ValueError):
-                        continue
-                    if math.isnan(num):
-                        continue
-                    price = num
-                    break
-                if price is None:
-                    hist = tk.history(period="5d")
-                    if not hist.empty:
-                        price = float(hist["Close"].dropna().iloc[-1])
-                currency = safe_get('currency') or currency
-                exchange = safe_get('exchange') or exchange
+            price, currency, exchange = YFINANCE.call(_fetch_yfinance_price, ticker, currency, exchange)
         except Exception as e:
             return {"ticker": ticker, "error": f"price_fetch_failed: {e}"}
 
@@ -264,6 +619,68 @@ def fetch_price_summary(ticker: str) -> Dict[str, Any]:
         "exchange": exchange,
     }
 
+
+def _fetch_yfinance_price(ticker: str, currency: str, exchange: Optional[str],
+                          timeout: float) -> Tuple[Optional[float], str, Optional[str]]:
+    """Last-resort price lookup through yfinance ``fast_info`` / 5-day history."""
+    price = None
+    yf = lazy_import("yfinance")
+    buf_out, buf_err = io.StringIO(), io.StringIO()
+    with redirect_stdout(buf_out), redirect_stderr(buf_err):
+        tk = yf.Ticker(ticker)
+        info = tk.fast_info
+        def safe_get(key: str):
+            if not info:
+                return None
+            try:
+                return info.get(key)
+            except Exception:
+                try:
+                    return getattr(info, key)
+                except Exception:
+                    return None
+        for candidate in ("lastPrice", "last_price", "regularMarketPrice", "regularMarketPreviousClose", "previousClose"):
+            val = safe_get(candidate)
+            if val is None:
+                continue
+            try:
+                num = float(val)
+            except (TypeError, ValueError):
+                continue
+            if math.isnan(num):
+                continue
+            price = num
+            break
+        if price is None:
+            # fast_info 無法指定逾時；history 則以剩餘期限為上限
+            hist = tk.history(period="5d", timeout=timeout, raise_errors=True)
+            if not hist.empty:
+                price = float(hist["Close"].dropna().iloc[-1])
+        currency = safe_get('currency') or currency
+        exchange = safe_get('exchange') or exchange
+    return price, currency, exchange
+
+def compute_indicator_stats(tickers: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Run the indicator engine over every ticker's cached series in one batch.
+
+    Also adds the 52-week high / low of the bars before today (for breakout alerts).
+    """
+    series: Dict[str, List[Dict[str, Any]]] = {}
+    for ticker in dict.fromkeys([*tickers, INDICATOR_BENCHMARK]):
+        try:
+            series[ticker] = get_stooq_series(ticker)
+        except Exception:
+            continue
+    indicators = INDICATOR_ENGINE.update(series)
+    today = datetime.datetime.now(US_EASTERN).date()
+    since = (today - datetime.timedelta(days=365)).isoformat()
+    stats: Dict[str, Dict[str, Any]] = {}
+    for ticker in tickers:
+        high, low = HISTORY_STORE.extremes(ticker, since, today.isoformat())
+        stats[ticker] = {**indicators.get(ticker, {}), "high_52w": high, "low_52w": low}
+    return stats
+
+
 def fetch_price_history(ticker: str, days: int = 30) -> Dict[str, Any]:
     """獲取歷史價格數據用於圖表"""
     try:
@@ -302,80 +719,84 @@ def fetch_price_history(ticker: str, days: int = 30) -> Dict[str, Any]:
     except Exception as e:
         return {"ticker": ticker, "error": f"history_fetch_failed: {e}"}
 
-async def fetch_rss(url: str) -> feedparser.FeedParserDict:
-    headers = {"User-Agent": UA}
-    async with httpx.AsyncClient(timeout=15.0, headers=headers, follow_redirects=True) as client:
-        r = await client.get(url)
-        r.raise_for_status()
-        return feedparser.parse(r.content)
-
 def google_news_rss_query(query: str, hl="zh-TW", gl="TW", ceid="TW:zh-Hant") -> str:
     q = quote_plus(query)
-    return f"https://news.google.com/rss/search?q={q}&hl={hl}&gl={gl}&ceid={ceid}"
+    return f"{GOOGLE_NEWS_BASE_URL}/rss/search?q={q}&hl={hl}&gl={gl}&ceid={ceid}"
 
 async def collect_headlines_for(ticker: str) -> List[Dict[str, Any]]:
-    queries = {
-        "NVDA": ["NVIDIA NVDA", "NVIDIA earnings", "NVIDIA data center AI"],
-        "SMCI": ["Super Micro Computer SMCI", "SMCI earnings", "SMCI server AI"],
-        "QQQ":  ["Invesco QQQ Nasdaq-100", "QQQ ETF flows", "Nasdaq-100 AI megacap"],
+    urls = [google_news_rss_query(q) for q in WATCHLIST.queries(ticker)]
+    results = await asyncio.gather(*(NEWS_FETCHER.fetch(url) for url in urls), return_exceptions=True)
+    entries = [entry for result in results if not isinstance(result, Exception) for entry in result]
+    # 只寫入新出現的新聞，再從索引讀取該股票最新的 NEWS_PER_TICKER 則
+    return await run_blocking(ingest_and_read_news, ticker, entries)
+
+
+def ingest_and_read_news(ticker: str, entries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    NEWS_INDEX.ingest(ticker, entries)
+    return NEWS_INDEX.top(ticker, NEWS_PER_TICKER)
+
+def get_openai_client() -> "openai.AsyncOpenAI":
+    if "openai" not in _AI_CLIENTS:
+        openai = lazy_import("openai")
+        _AI_CLIENTS["openai"] = openai.AsyncOpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL)
+    return _AI_CLIENTS["openai"]
+
+
+def get_anthropic_client() -> "anthropic.AsyncAnthropic":
+    if "anthropic" not in _AI_CLIENTS:
+        anthropic = lazy_import("anthropic")
+        _AI_CLIENTS["anthropic"] = anthropic.AsyncAnthropic(api_key=ANTHROPIC_API_KEY, base_url=ANTHROPIC_BASE_URL)
+    return _AI_CLIENTS["anthropic"]
+
+
+# 納入 AI 提示的技術指標（stats 欄位, 顯示名稱）
+AI_INDICATOR_LABELS = [
+    ("sma_20", "SMA20"),
+    ("sma_50", "SMA50"),
+    ("rsi_14", "RSI(14)"),
+    ("macd", "MACD"),
+    ("macd_signal", "MACD 訊號線"),
+    ("bb_percent_b", "布林 %B"),
+    ("atr_14", "ATR(14)"),
+    ("volatility_20d", "20日年化波動率(%)"),
+    (f"corr_{INDICATOR_BENCHMARK.lower()}_20d", f"與 {INDICATOR_BENCHMARK} 20日相關係數"),
+]
+
+
+def build_ai_inputs(ticker: str, history_data: Dict[str, Any], news_items: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Normalized prompt inputs for one ticker; also the AI_RESPONSE_CACHE key material."""
+    stats = history_data.get('stats', {})
+    inputs = {
+        "ticker": ticker,
+        "current": stats.get('current', 'N/A'),
+        "change_percent": stats.get('change_percent', 0),
+        "high_30d": stats.get('high_30d', 'N/A'),
+        "low_30d": stats.get('low_30d', 'N/A'),
+        "headlines": [item['title'].strip() for item in news_items[:5]],
     }
-    seen = set()
-    items: List[Dict[str, Any]] = []
-    for q in queries.get(ticker, [ticker]):
-        url = google_news_rss_query(q)
-        try:
-            feed = await fetch_rss(url)
-        except Exception:
-            continue
-        for e in feed.entries:
-            title = e.get("title", "").strip()
-            link = e.get("link", "").strip()
-            published = e.get("published", "") or e.get("updated", "")
-            published_parsed = e.get("published_parsed") or e.get("updated_parsed")
-            if published_parsed:
-                try:
-                    published_ts = int(time.mktime(published_parsed))
-                except Exception:
-                    published_ts = 0
-            else:
-                try:
-                    published_ts = int(time.mktime(email_utils.parsedate(published))) if published else 0
-                except Exception:
-                    published_ts = 0
-            if not title or not link:
-                continue
-            key = (title, link)
-            if key in seen:
-                continue
-            seen.add(key)
-            items.append({
-                "title": title,
-                "link": link,
-                "published": published,
-                "published_ts": published_ts,
-                "source": e.get("source", {}).get("title") if isinstance(e.get("source", {}), dict) else None
-            })
-    items.sort(key=lambda x: x.get("published_ts", 0), reverse=True)
-    return items[:NEWS_PER_TICKER]
+    for key, _ in AI_INDICATOR_LABELS:
+        if stats.get(key) is not None:
+            inputs[key] = stats[key]
+    return inputs
 
-async def generate_ai_analysis(ticker: str, history_data: Dict[str, Any], news_items: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
-    """使用 AI 生成市場分析（支援 OpenAI GPT 和 Anthropic Claude）"""
 
-    # 準備分析上下文
-    stats = history_data.get('stats', {})
-    current_price = stats.get('current', 'N/A')
-    change_pct = stats.get('change_percent', 0)
-    high_30d = stats.get('high_30d', 'N/A')
-    low_30d = stats.get('low_30d', 'N/A')
-    news_summary = "\n".join([f"- {item['title']}" for item in news_items[:5]])
+def build_ai_prompt(ticker: str, history_data: Dict[str, Any], news_items: List[Dict[str, Any]]) -> Tuple[str, Dict[str, Any]]:
+    """Build the single-ticker analysis prompt plus the normalized inputs it was built from."""
+    inputs = build_ai_inputs(ticker, history_data, news_items)
+    indicator_lines = [f"- {label}: {inputs[key]}" for key, label in AI_INDICATOR_LABELS if key in inputs]
+    news_summary = "\n".join([f"- {title}" for title in inputs["headlines"]])
+    indicator_summary = "\n".join(indicator_lines) or "- 無"
 
     prompt = f"""分析 {ticker} 股票的市場狀況：
 
 **當前數據：**
-- 當前價格: ${current_price}
-- 日變化: {change_pct}%
-- 30天高點: ${high_30d}
-- 30天低點: ${low_30d}
+- 當前價格: ${inputs["current"]}
+- 日變化: {inputs["change_percent"]}%
+- 30天高點: ${inputs["high_30d"]}
+- 30天低點: ${inputs["low_30d"]}
+
+**技術指標：**
+{indicator_summary}
 
 **最新新聞：**
 {news_summary}
@@ -391,65 +812,85 @@ async def generate_ai_analysis(ticker: str, history_data: Dict[str, Any], news_i
   "summary": "簡短總結",
   "key_points": ["要點1", "要點2", "要點3"]
 }}"""
+    return prompt, inputs
+
+
+def parse_ai_response(response_text: str) -> Dict[str, Any]:
+    # 取出第一個 JSON 物件並檢查欄位，不符合時以原文作為摘要
+    try:
+        analysis = extract_json(response_text)
+    except ValueError:
+        analysis = None
+    if validate_analysis(analysis, require_ticker=False) is None:
+        return normalize_analysis(analysis)
+    return {
+        "summary": response_text[:200],
+        "trend": "neutral",
+        "key_points": [response_text[:100]]
+    }
+
+
+async def generate_ai_analysis(ticker: str, history_data: Dict[str, Any], news_items: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """使用 AI 生成市場分析（支援 OpenAI GPT 和 Anthropic Claude）
+
+    相同 provider / model 與相同輸入的結果會從 AI_RESPONSE_CACHE 取用，不重複呼叫 API。
+    """
+    prompt, inputs = build_ai_prompt(ticker, history_data, news_items)
 
     # OpenAI Provider
     if AI_PROVIDER == "openai" and OPENAI_AVAILABLE and OPENAI_API_KEY:
+        cache_key = AI_RESPONSE_CACHE.key_for("openai", OPENAI_MODEL, inputs)
+        cached = AI_RESPONSE_CACHE.get(cache_key)
+        if cached is not None:
+            return cached
         try:
-            client = OpenAI(api_key=OPENAI_API_KEY)
-            response = client.chat.completions.create(
-                model="gpt-4o-mini",
+            response = await OPENAI_UPSTREAM.acall(
+                get_openai_client().chat.completions.create,
+                model=OPENAI_MODEL,
                 messages=[
-                    {"role": "system", "content": "你是專業的股市分析師，提供繁體中文的市場分析。"},
+                    {"role": "system", "content": SYSTEM_PROMPT},
                     {"role": "user", "content": prompt}
                 ],
                 temperature=0.7,
                 max_tokens=1000
             )
-            response_text = response.choices[0].message.content
-
-            # 嘗試解析 JSON
-            import re
-            json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-            if json_match:
-                analysis = json.loads(json_match.group())
-                return analysis
-            else:
-                return {
-                    "summary": response_text[:200],
-                    "trend": "neutral",
-                    "key_points": [response_text[:100]]
-                }
+            analysis = parse_ai_response(response.choices[0].message.content)
+            AI_RESPONSE_CACHE.put(cache_key, analysis)
+            return analysis
 
         except Exception as e:
             return {"summary": f"OpenAI 分析失敗: {str(e)}", "trend": "neutral", "key_points": []}
 
     # Anthropic Provider
     elif AI_PROVIDER == "anthropic" and ANTHROPIC_AVAILABLE and ANTHROPIC_API_KEY:
+        cache_key = AI_RESPONSE_CACHE.key_for("anthropic", ANTHROPIC_MODEL, inputs)
+        cached = AI_RESPONSE_CACHE.get(cache_key)
+        if cached is not None:
+            return cached
         try:
-            client = anthropic.Anthropic(api_key=ANTHROPIC_API_KEY)
-            message = client.messages.create(
-                model="claude-sonnet-4-5",
+            message = await ANTHROPIC_UPSTREAM.acall(
+                get_anthropic_client().messages.create,
+                model=ANTHROPIC_MODEL,
                 max_tokens=1000,
                 messages=[{"role": "user", "content": prompt}]
             )
-            response_text = message.content[0].text
-
-            # 嘗試解析 JSON
-            import re
-            json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-            if json_match:
-                analysis = json.loads(json_match.group())
-                return analysis
-            else:
-                return {
-                    "summary": response_text[:200],
-                    "trend": "neutral",
-                    "key_points": [response_text[:100]]
-                }
+            analysis = parse_ai_response(message.content[0].text)
+            AI_RESPONSE_CACHE.put(cache_key, analysis)
+            return analysis
 
         except Exception as e:
             return {"summary": f"Anthropic 分析失敗: {str(e)}", "trend": "neutral", "key_points": []}
 
+    # 離線 stub：由輸入直接產生確定性的結果
+    elif AI_PROVIDER == "stub":
+        cache_key = AI_RESPONSE_CACHE.key_for("stub", "stub", inputs)
+        cached = AI_RESPONSE_CACHE.get(cache_key)
+        if cached is not None:
+            return cached
+        analysis = AI_STUB.analyse(inputs)
+        AI_RESPONSE_CACHE.put(cache_key, analysis)
+        return analysis
+
     # No AI Provider
     else:
         provider_status = AI_PROVIDER if AI_PROVIDER != "none" else "未設定"
@@ -459,13 +900,305 @@ async def generate_ai_analysis(ticker: str, history_data: Dict[str, Any], news_i
             "key_points": []
         }
 
-async def build_snapshot(run_ai: bool = False) -> Dict[str, Any]:
-    STOOQ_CACHE.clear()
-    ai_cache = load_ai_cache()
-    tickers_ai = ai_cache.setdefault("tickers", {})
 
-    current_total_runs = int(ai_cache.get("total_runs", 0))
-    next_total_runs = current_total_runs + 1 if run_ai else current_total_runs
+def active_ai_model() -> Optional[Tuple[str, str]]:
+    """(provider, model) of the configured AI provider when it can be called, else None."""
+    if AI_PROVIDER == "openai" and OPENAI_AVAILABLE and OPENAI_API_KEY:
+        return "openai", OPENAI_MODEL
+    if AI_PROVIDER == "anthropic" and ANTHROPIC_AVAILABLE and ANTHROPIC_API_KEY:
+        return "anthropic", ANTHROPIC_MODEL
+    if AI_PROVIDER == "stub":
+        return "stub", "stub"
+    return None
+
+
+async def request_ai_batch(provider: str, inputs: List[Dict[str, Any]]) -> Any:
+    """One structured-output request covering every ticker in ``inputs``; returns the raw answer."""
+    prompt = build_batch_prompt(inputs, AI_INDICATOR_LABELS)
+    # 每檔約需數百 tokens 的輸出
+    max_tokens = 200 + 400 * len(inputs)
+    if provider == "openai":
+        response = await OPENAI_UPSTREAM.acall(
+            get_openai_client().chat.completions.create,
+            model=OPENAI_MODEL,
+            messages=[
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": prompt},
+            ],
+            temperature=0.7,
+            max_tokens=max_tokens,
+            response_format={
+                "type": "json_schema",
+                "json_schema": {"name": "market_analyses", "strict": True, "schema": BATCH_SCHEMA},
+            },
+        )
+        return response.choices[0].message.content
+    if provider == "anthropic":
+        # 強制使用以 schema 為輸入的工具，回應即為結構化資料
+        message = await ANTHROPIC_UPSTREAM.acall(
+            get_anthropic_client().messages.create,
+            model=ANTHROPIC_MODEL,
+            max_tokens=max_tokens,
+            system=SYSTEM_PROMPT,
+            messages=[{"role": "user", "content": prompt}],
+            tools=[{
+                "name": BATCH_TOOL,
+                "description": "Record the analysis of every ticker in the request.",
+                "input_schema": BATCH_SCHEMA,
+            }],
+            tool_choice={"type": "tool", "name": BATCH_TOOL},
+        )
+        for block in message.content:
+            if getattr(block, "type", None) == "tool_use":
+                return block.input
+        raise ValueError("Anthropic answer has no tool_use block")
+    return AI_STUB.batch(inputs)
+
+
+async def generate_ai_analyses(entries: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """AI analysis for every ticker in ``entries`` (snapshot ticker entries).
+
+    Cached results are reused; the rest are sent AI_BATCH_SIZE tickers per
+    request, at most AI_CONCURRENCY requests at a time. Tickers missing from
+    a batch answer, failing validation, or in a failed request are retried
+    one at a time through ``generate_ai_analysis``.
+    """
+    semaphore = asyncio.Semaphore(AI_CONCURRENCY)
+    results: Dict[str, Any] = {}
+
+    async def analyse(ticker: str, source: str) -> None:
+        entry = entries[ticker]
+        async with semaphore:
+            try:
+                results[ticker] = await generate_ai_analysis(ticker, entry.get("history") or {}, entry.get("news") or [])
+            except Exception as e:
+                results[ticker] = e
+        AI_ANALYSES.labels(source).inc()
+
+    model = active_ai_model()
+    if model is None or AI_BATCH_SIZE <= 1:
+        await asyncio.gather(*(analyse(t, "single") for t in entries))
+        return results
+
+    provider, model_name = model
+    pending: List[Tuple[str, Dict[str, Any], str]] = []
+    for ticker, entry in entries.items():
+        inputs = build_ai_inputs(ticker, entry.get("history") or {}, entry.get("news") or [])
+        cache_key = AI_RESPONSE_CACHE.key_for(provider, model_name, inputs)
+        cached = AI_RESPONSE_CACHE.get(cache_key)
+        if cached is not None:
+            results[ticker] = cached
+            AI_ANALYSES.labels("cache").inc()
+        else:
+            pending.append((ticker, inputs, cache_key))
+
+    retry: List[str] = []
+
+    async def run_batch(batch: List[Tuple[str, Dict[str, Any], str]]) -> None:
+        tickers = [ticker for ticker, _, _ in batch]
+        async with semaphore:
+            try:
+                answer = await request_ai_batch(provider, [inputs for _, inputs, _ in batch])
+                parsed, errors = parse_batch(answer, tickers)
+            except Exception as e:
+                parsed, errors = {}, {ticker: str(e) for ticker in tickers}
+        for ticker, _, cache_key in batch:
+            if ticker in parsed:
+                AI_RESPONSE_CACHE.put(cache_key, parsed[ticker])
+                results[ticker] = parsed[ticker]
+                AI_ANALYSES.labels("batch").inc()
+            else:
+                retry.append(ticker)
+        if errors:
+            print(f"[ai] batch of {len(batch)}: retrying {', '.join(f'{t} ({e})' for t, e in errors.items())}")
+
+    batches = [pending[i:i + AI_BATCH_SIZE] for i in range(0, len(pending), AI_BATCH_SIZE)]
+    await asyncio.gather(*(run_batch(batch) for batch in batches))
+    # 逐檔重試使用單檔的提示與解析
+    await asyncio.gather(*(analyse(t, "retry") for t in retry))
+    return results
+
+async def run_blocking(func, *args, **kwargs):
+    """Run a blocking data-source call on the fetch thread pool."""
+    loop = asyncio.get_running_loop()
+    # 與 asyncio.to_thread 相同，把 contextvars 帶進執行緒
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(FETCH_EXECUTOR, functools.partial(ctx.run, func, *args, **kwargs))
+
+
+def fetch_price_bundle(ticker: str, days: int, quote_data: Optional[Dict[str, Any]] = None,
+                       previous_price: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Price and history for one ticker; ``previous_price`` is reused when quotes are not due."""
+    # 價格與歷史共用同一份 Stooq 資料，放在同一個執行緒依序執行避免重複讀取
+    price = previous_price
+    if price is None:
+        with stage_timer("price"):
+            price = fetch_price_summary(ticker, quote_data=quote_data)
+    with stage_timer("history"):
+        history = fetch_price_history(ticker, days)
+    return {"price": price, "history": history}
+
+
+async def collect_ticker(ticker: str, semaphore: asyncio.Semaphore,
+                         quote_data: Optional[Dict[str, Any]] = None,
+                         refresh: frozenset = frozenset(DATA_CLASSES),
+                         previous: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Fetch price, history and news for one ticker concurrently.
+
+    Data classes not in ``refresh`` are not fetched from upstream: the
+    previous price is reused and headlines are read from the news index.
+    """
+    previous_price = (previous or {}).get("price")
+    if "quotes" in refresh or not previous_price or "error" in previous_price:
+        previous_price = None
+    if "news" in refresh:
+        news_task = timed("news", collect_headlines_for(ticker))
+    else:
+        news_task = run_blocking(NEWS_INDEX.top, ticker, NEWS_PER_TICKER)
+    async with semaphore:
+        bundle, news_items = await asyncio.gather(
+            run_blocking(fetch_price_bundle, ticker, HISTORY_DAYS, quote_data, previous_price),
+            news_task,
+        )
+    return {
+        "price": bundle["price"],
+        "history": bundle["history"],
+        "news": news_items,
+    }
+
+
+async def collect_all(tickers: List[str], refresh: frozenset = frozenset(DATA_CLASSES),
+                      previous: Optional[Dict[str, Any]] = None,
+                      plan: Optional[Dict[str, frozenset]] = None) -> Dict[str, Dict[str, Any]]:
+    """Fan out collection across all tickers, bounded by REFRESH_CONCURRENCY.
+
+    ``plan`` narrows ``refresh`` per ticker (see ``refresh_plan``).
+    """
+    previous = previous or {}
+    plan = plan or {}
+    quotes: Dict[str, Dict[str, Any]] = {}
+    quote_tickers = [t for t in tickers if "quotes" in plan.get(t, refresh)]
+    if quote_tickers:
+        with stage_timer("quotes"):
+            quotes = await current_quotes(quote_tickers)
+    semaphore = asyncio.Semaphore(REFRESH_CONCURRENCY)
+    results = await asyncio.gather(
+        *(collect_ticker(ticker, semaphore, quotes.get(ticker), plan.get(ticker, refresh), previous.get(ticker))
+          for ticker in tickers),
+        return_exceptions=True,
+    )
+    collected: Dict[str, Dict[str, Any]] = {}
+    for ticker, result in zip(tickers, results):
+        if isinstance(result, Exception):
+            collected[ticker] = {
+                "price": {"ticker": ticker, "error": f"collect_failed: {result}"},
+                "history": {"ticker": ticker, "error": f"collect_failed: {result}"},
+                "news": [],
+            }
+        else:
+            collected[ticker] = result
+    return collected
+
+def ai_meta(ai_cache: Dict[str, Any]) -> Dict[str, Any]:
+    tickers_ai = ai_cache.get("tickers", {})
+    return {
+        "ai_last_generated_local": ai_cache.get("generated_at_local"),
+        "ai_last_generated_unix": ai_cache.get("generated_at_unix"),
+        "ai_total_runs": int(ai_cache.get("total_runs", 0)),
+        "ai_total_ticker_runs": sum(int(details.get("run_count", 0)) for details in tickers_ai.values()),
+        **AI_RESPONSE_CACHE.stats(),
+    }
+
+
+def attach_ai_analysis(data: Dict[str, Any], ai_cache: Dict[str, Any]) -> None:
+    """Fill each ticker's ``ai_analysis`` and the AI fields of ``meta`` from the cache."""
+    tickers_ai = ai_cache.get("tickers", {})
+    for ticker, entry in (data.get("tickers") or {}).items():
+        ai_details = tickers_ai.get(ticker)
+        if not ai_details:
+            ai_details = default_ai_analysis()
+        else:
+            ai_details.setdefault("run_count", 0)
+        entry["ai_analysis"] = ai_details
+    data.setdefault("meta", {}).update(ai_meta(ai_cache))
+
+
+def store_snapshot(data: Dict[str, Any]) -> None:
+    """Encode once, publish the bytes in memory and persist them atomically."""
+    with stage_timer("serialize"):
+        raw = dumps_json(data)
+    with stage_timer("compress"):
+        SNAPSHOT.publish_bytes(raw, data)
+    with stage_timer("write"):
+        SNAPSHOT_WRITER.write(raw, data)
+    publish_shared()
+    if SNAPSHOT_ARCHIVE is not None:
+        try:
+            with stage_timer("archive"):
+                SNAPSHOT_ARCHIVE.append(data)
+        except OSError as e:
+            # 封存失敗不影響快照發佈
+            print(f"[archive] append failed: {e}")
+
+
+def is_leader() -> bool:
+    return not MULTI_WORKER or LEADER_LOCK.held
+
+
+def publish_shared() -> None:
+    """Leader: hand the encoded snapshot (and recent alerts) to the serving workers."""
+    if not MULTI_WORKER or not LEADER_LOCK.held:
+        return
+    etag, bodies = SNAPSHOT.encoded()
+    if etag is not None:
+        SHARED_SNAPSHOT.write(etag, bodies, {"alerts": list(ALERTS.recent)[:SHARED_ALERTS_KEEP]})
+
+
+async def write_snapshot(data: Dict[str, Any]) -> None:
+    # 序列化、壓縮與 fsync 都在執行緒中進行，不佔用 event loop
+    await run_blocking(store_snapshot, data)
+    STREAM_HUB.publish_snapshot(data)
+
+
+def refresh_plan(tickers: List[str], refresh: frozenset, shards: Optional[Dict[str, List[str]]],
+                 previous: Dict[str, Any]) -> Dict[str, frozenset]:
+    """Data classes to fetch per ticker; tickers with nothing to fetch are left out.
+
+    A data class listed in ``shards`` is only fetched for the tickers of that
+    shard. Tickers missing from the previous snapshot (newly added to the
+    watchlist) are collected right away.
+    """
+    members = {kind: set(symbols) for kind, symbols in (shards or {}).items()}
+    plan: Dict[str, frozenset] = {}
+    for ticker in tickers:
+        if ticker not in previous:
+            plan[ticker] = refresh
+            continue
+        kinds = frozenset(kind for kind in refresh if kind not in members or ticker in members[kind])
+        if kinds:
+            plan[ticker] = kinds
+    return plan
+
+
+async def build_snapshot(refresh: Iterable[str] = DATA_CLASSES,
+                         shards: Optional[Dict[str, List[str]]] = None) -> Dict[str, Any]:
+    """Collect market data for the watchlist and publish it as the new snapshot.
+
+    Only the data classes in ``refresh`` are fetched from upstream (see
+    ``collect_ticker``), and for a sharded class only for the tickers in
+    ``shards[kind]``; the other tickers keep their previous entry. AI analysis
+    is not generated here; the latest cached results are attached as-is and
+    refreshed separately by ``run_ai_stage``.
+    """
+    with stage_timer("build"):
+        return await _build_snapshot(frozenset(refresh), shards)
+
+
+async def _build_snapshot(refresh: frozenset, shards: Optional[Dict[str, List[str]]] = None) -> Dict[str, Any]:
+    previous = (SNAPSHOT.data or {}).get("tickers") or {}
+    STOOQ_CACHE.clear()
+    if "news" in refresh:
+        await run_blocking(NEWS_INDEX.evict)
 
     generated_at_unix = now_ts()
     generated_at_local = now_iso_tz()
@@ -475,96 +1208,459 @@ async def build_snapshot(run_ai: bool = False) -> Dict[str, Any]:
         "generated_at_local": generated_at_local,
         "tickers": {},
         "meta": {
-            "interval_min": round(DATA_UPDATE_INTERVAL_SEC / 60, 2),
-            "data_interval_sec": DATA_UPDATE_INTERVAL_SEC,
+            "interval_min": round(SCHEDULER.interval("quotes") / 60, 2),
+            "data_interval_sec": SCHEDULER.interval("quotes"),
             "ai_interval_hours": round(AI_UPDATE_INTERVAL_SEC / 3600, 2),
             "tz": TZ,
             "history_days": HISTORY_DAYS,
-            "ai_last_generated_local": ai_cache.get("generated_at_local"),
-            "ai_last_generated_unix": ai_cache.get("generated_at_unix"),
-            "ai_total_runs": next_total_runs,
-            "ai_total_ticker_runs": 0,  # will update after loop
+            "refreshed": sorted(refresh),
+            **SCHEDULER.stats(),
         }
     }
 
-    for ticker in TICKERS:
-        price_summary = fetch_price_summary(ticker)
-        price_history = fetch_price_history(ticker, HISTORY_DAYS)
-        news_items = await collect_headlines_for(ticker)
+    tickers = WATCHLIST.symbols
+    plan = refresh_plan(tickers, refresh, shards, previous)
+    collected = await collect_all(SCHEDULER.prioritize(list(plan), previous), refresh, previous, plan)
+    with stage_timer("indicators"):
+        indicator_stats = await run_blocking(compute_indicator_stats, list(collected))
+    data["meta"]["upstreams"] = UPSTREAMS.stats()
+    data["meta"].update(WATCHLIST.stats())
+    data["meta"]["refreshed_tickers"] = len(collected)
+
+    INTRADAY.retain(tickers)
+    intraday_since = int(session_day_start())
+    data["meta"].update(INTRADAY.stats())
+    for ticker in tickers:
+        if ticker not in collected:
+            # 不在這一片的股票沿用上一份快照（複製外層 dict，不改動已發佈的快照）
+            entry = previous[ticker]
+            data["tickers"][ticker] = {key: entry[key] for key in ("price", "history", "news") if key in entry}
+        else:
+            history = collected[ticker]["history"]
+            if "stats" in history:
+                history["stats"].update(indicator_stats.get(ticker, {}))
+            data["tickers"][ticker] = {
+                "price": collected[ticker]["price"],
+                "history": history,
+                "news": collected[ticker]["news"],
+            }
+        intraday = INTRADAY.rollup(ticker, since=intraday_since, max_points=INTRADAY_CHART_POINTS)
+        if intraday is not None:
+            data["tickers"][ticker]["intraday"] = intraday
+
+    data["meta"].update(ALERTS.stats())
+
+    # 在收集完成後才讀取 AI 快取，避免覆蓋期間完成的 AI 分析
+    attach_ai_analysis(data, load_ai_cache())
+    # 先評估警報，其他 worker 才能隨這份快照一起收到
+    await evaluate_alerts(data)
+    await write_snapshot(data)
+    await record_refresh_success()
+    return data
 
-        ai_details = tickers_ai.get(ticker)
 
-        if run_ai:
-            analysis = await generate_ai_analysis(ticker, price_history, news_items) or {}
-            previous_runs = int((ai_details or {}).get("run_count", 0))
-            ai_details = {
-                **default_ai_analysis(),
-                **analysis,
-                "generated_at_unix": generated_at_unix,
-                "generated_at_local": generated_at_local,
-                "run_count": previous_runs + 1,
+async def _post_alert_webhook(url: str, payload: Dict[str, Any]) -> None:
+    async def post(timeout: float):
+        r = await HTTP_POOL.async_client(url).post(url, json=payload, timeout=timeout)
+        r.raise_for_status()
+    await ALERT_WEBHOOK.acall(post)
+
+
+ALERT_SINKS: List[Any] = [
+    FileSink(ALERT_LOG_PATH),
+    CallbackSink(lambda alerts: STREAM_HUB.publish_event("alert", alerts)),
+]
+if ALERT_WEBHOOK_URL:
+    ALERT_SINKS.append(WebhookSink(ALERT_WEBHOOK_URL, _post_alert_webhook))
+
+
+async def evaluate_alerts(data: Dict[str, Any]) -> None:
+    """Run the alert rules against the new snapshot and deliver what fired in the background."""
+    await run_blocking(ALERTS.reload_if_changed)
+    fired = ALERTS.evaluate(data.get("tickers") or {})
+    if not fired:
+        return
+    for alert in fired:
+        alert["fired_at_local"] = now_iso_tz()
+    # 送出（特別是 webhook）不阻塞刷新流程
+    asyncio.create_task(deliver_alerts(fired, ALERT_SINKS, run_blocking))
+
+
+async def run_ai_stage() -> Dict[str, Any]:
+    """Generate AI analysis from the latest published snapshot.
+
+    The LLM calls (batched, see ``generate_ai_analyses``) run without holding
+    DATA_LOCK, bounded by AI_CONCURRENCY. Only the final cache update and
+    merge into the current snapshot take the lock, so price refreshes and
+    HTTP requests are never blocked.
+    """
+    async with AI_LOCK:
+        base = SNAPSHOT.data
+        if not base or not base.get("tickers"):
+            raise RuntimeError("snapshot_unavailable")
+
+        generated_at_unix = now_ts()
+        generated_at_local = now_iso_tz()
+        tickers = list(base["tickers"].keys())
+
+        if (AI_PROVIDER == "openai" and OPENAI_AVAILABLE) or (AI_PROVIDER == "anthropic" and ANTHROPIC_AVAILABLE):
+            # 首次匯入 SDK 需時，放到執行緒中進行，不阻塞 event loop
+            await run_blocking(lazy_import, AI_PROVIDER)
+
+        with stage_timer("ai"):
+            results = await generate_ai_analyses(base["tickers"])
+
+        async with DATA_LOCK:
+            ai_cache = load_ai_cache()
+            tickers_ai = ai_cache.setdefault("tickers", {})
+            for ticker in tickers:
+                analysis = results.get(ticker)
+                if isinstance(analysis, Exception):
+                    analysis = {"summary": f"AI 分析失敗: {analysis}", "trend": "neutral", "key_points": []}
+                previous_runs = int((tickers_ai.get(ticker) or {}).get("run_count", 0))
+                tickers_ai[ticker] = {
+                    **default_ai_analysis(),
+                    **(analysis or {}),
+                    "generated_at_unix": generated_at_unix,
+                    "generated_at_local": generated_at_local,
+                    "run_count": previous_runs + 1,
+                }
+            ai_cache["generated_at_unix"] = generated_at_unix
+            ai_cache["generated_at_local"] = generated_at_local
+            ai_cache["total_runs"] = int(ai_cache.get("total_runs", 0)) + 1
+            await run_blocking(save_ai_cache, ai_cache)
+            await run_blocking(AI_RESPONSE_CACHE.save)
+
+            # 以最新的快照為底（期間可能已有價格更新），複製後再合併，不修改已發佈的物件
+            latest = SNAPSHOT.data or base
+            data = {
+                **latest,
+                "tickers": {t: dict(entry) for t, entry in (latest.get("tickers") or {}).items()},
+                "meta": dict(latest.get("meta") or {}),
             }
-            tickers_ai[ticker] = ai_details
-        else:
-            if not ai_details:
-                ai_details = default_ai_analysis()
-            else:
-                ai_details.setdefault("run_count", 0)
+            attach_ai_analysis(data, ai_cache)
+            await write_snapshot(data)
+        return data
 
-        data["tickers"][ticker] = {
-            "price": price_summary,
-            "history": price_history,
-            "news": news_items,
-            "ai_analysis": ai_details
-        }
 
-    total_ticker_runs = sum(int(details.get("run_count", 0)) for details in tickers_ai.values())
-    data["meta"]["ai_total_ticker_runs"] = total_ticker_runs
+def ai_job_record(source: str) -> Dict[str, Any]:
+    return {
+        "job_id": uuid.uuid4().hex[:12],
+        "source": source,
+        "status": "queued",
+        "created_at_unix": now_ts(),
+        "started_at_unix": None,
+        "finished_at_unix": None,
+        "error": None,
+    }
+
 
-    if run_ai:
-        ai_cache["generated_at_unix"] = generated_at_unix
-        ai_cache["generated_at_local"] = generated_at_local
-        ai_cache["total_runs"] = next_total_runs
-        save_ai_cache(ai_cache)
+def remember_ai_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    AI_JOBS[job["job_id"]] = job
+    while len(AI_JOBS) > AI_JOBS_KEEP:
+        AI_JOBS.pop(next(iter(AI_JOBS)))
+    return job
+
+
+def new_ai_job(source: str) -> Dict[str, Any]:
+    return remember_ai_job(ai_job_record(source))
+
+
+def save_ai_jobs() -> None:
+    """Leader: publish job states so /trigger/ai/{job_id} works on every worker."""
+    if MULTI_WORKER:
+        atomic_write_json(AI_JOBS_PATH, AI_JOBS)
+
+
+def read_ai_jobs() -> Dict[str, Dict[str, Any]]:
+    try:
+        return json.loads(AI_JOBS_PATH.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def read_ai_trigger() -> Optional[Dict[str, Any]]:
+    try:
+        return json.loads(AI_TRIGGER_PATH.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+def request_ai_from_leader() -> Dict[str, Any]:
+    """Follower: queue an AI run for the leader (reusing an active or pending one)."""
+    for job in read_ai_jobs().values():
+        if job.get("status") in ("queued", "running"):
+            return job
+    pending = read_ai_trigger()
+    if pending is not None:
+        return pending
+    job = ai_job_record("manual")
+    atomic_write_json(AI_TRIGGER_PATH, job)
+    return job
+
+
+def active_ai_job() -> Optional[Dict[str, Any]]:
+    for job in AI_JOBS.values():
+        if job["status"] in ("queued", "running"):
+            return job
+    return None
+
+
+async def run_ai_job(job: Dict[str, Any]) -> None:
+    job["status"] = "running"
+    job["started_at_unix"] = now_ts()
+    await run_blocking(save_ai_jobs)
+    try:
+        data = await run_ai_stage()
+        job["status"] = "done"
+        SCHEDULER.mark(["ai"])
+        job.update({key: data["meta"].get(key) for key in ai_meta({})})
+    except Exception as e:
+        job["status"] = "failed"
+        job["error"] = str(e)
+        REFRESH_FAILURES.labels("ai").inc()
+        SCHEDULER.mark(["ai"], ok=False)
+        print(f"[ai] {job['source']} job {job['job_id']} failed: {e}")
+    finally:
+        job["finished_at_unix"] = now_ts()
+        await run_blocking(save_ai_jobs)
+
+
+async def record_refresh_success() -> None:
+    REFRESH_STATUS["last_success_unix"] = now_ts()
+    REFRESH_STATUS["last_success_local"] = now_iso_tz()
+    if "first_refresh" not in STARTUP_SECONDS:
+        mark_startup("first_snapshot")
+        mark_startup("first_refresh")
+        print(f"[startup] first refresh done {STARTUP_SECONDS['first_refresh']:.2f}s after start", flush=True)
+    if REFRESH_STATUS.get("consecutive_failures"):
+        # 只在狀態轉換時寫檔（失敗 -> 恢復），平常不額外寫入
+        REFRESH_STATUS["consecutive_failures"] = 0
+        await run_blocking(atomic_write_json, REFRESH_STATUS_PATH, REFRESH_STATUS)
+
+
+async def record_refresh_error(error: Exception) -> None:
+    """Keep the last good snapshot and attach the failure to its metadata.
+
+    The error is persisted to refresh_status.json next to dashboard.json;
+    dashboard.json itself is left untouched.
+    """
+    REFRESH_FAILURES.labels("data").inc()
+    REFRESH_STATUS["consecutive_failures"] = int(REFRESH_STATUS.get("consecutive_failures", 0)) + 1
+    REFRESH_STATUS["last_error"] = f"data_refresh_failed: {error}"
+    REFRESH_STATUS["last_error_unix"] = now_ts()
+    REFRESH_STATUS["last_error_local"] = now_iso_tz()
+    await run_blocking(atomic_write_json, REFRESH_STATUS_PATH, REFRESH_STATUS)
+
+    current = SNAPSHOT.data
+    if current and current.get("tickers"):
+        data = {**current, "meta": {**(current.get("meta") or {}), "refresh_error": dict(REFRESH_STATUS)}}
+    else:
+        data = {
+            "generated_at_unix": REFRESH_STATUS["last_error_unix"],
+            "generated_at_local": REFRESH_STATUS["last_error_local"],
+            "error": REFRESH_STATUS["last_error"],
+        }
+    # 只更新記憶體中的快照，不覆寫最後一份成功的 dashboard.json
+    await run_blocking(SNAPSHOT.publish, data)
+    await run_blocking(publish_shared)
+    STREAM_HUB.publish_snapshot(data)
+
+def busy_stages() -> Tuple[str, ...]:
+    """Stages still running in the background, left out of the scheduler's due list."""
+    return tuple(kind for kind, running in (("ai", active_ai_job()), ("bars", bars_running())) if running)
 
-    JSON_PATH.parent.mkdir(parents=True, exist_ok=True)
-    JSON_PATH.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
-    return data
 
-async def data_refresher_loop():
+async def refresh_scheduler_loop():
+    """Refresh each data class on its market-session cadence (see RefreshScheduler)."""
     while True:
+        try:
+            await refresh_scheduler_tick()
+        except Exception as e:
+            # 這是唯一的刷新任務，任何未預期的錯誤都只記錄，下一輪繼續
+            print(f"[refresh] scheduler tick failed: {e!r}")
+        # AI 與日 K 仍在背景執行時不列入到期項目，避免每秒醒來
+        await asyncio.sleep(SCHEDULER.sleep_for(skip=busy_stages()))
+
+
+async def refresh_scheduler_tick() -> None:
+    await run_blocking(reload_watchlist)
+    due = SCHEDULER.due(skip=busy_stages())
+    refresh = frozenset(kind for kind in due if kind in DATA_CLASSES and kind != "bars")
+    if refresh:
+        # 報價與新聞每次輪到下一片
+        shards = {kind: SHARD_ROTATIONS[kind].next() for kind in SHARDED_CLASSES if kind in refresh}
         try:
             async with DATA_LOCK:
-                await build_snapshot(run_ai=False)
+                await build_snapshot(refresh, shards)
         except Exception as e:
-            err = {
-                "generated_at_unix": now_ts(),
-                "generated_at_local": now_iso_tz(),
-                "error": f"data_refresh_failed: {e}"
-            }
-            JSON_PATH.write_text(json.dumps(err, ensure_ascii=False, indent=2), encoding="utf-8")
-        await asyncio.sleep(DATA_UPDATE_INTERVAL_SEC)
+            await record_refresh_error(e)
+        finally:
+            # 失敗時同樣記錄（即使記錄錯誤本身失敗），等下一個週期再試，避免連續重試
+            SCHEDULER.mark(refresh)
+
+    if "bars" in due:
+        # 整份清單的日 K 同步可能很久，在背景進行，不佔用 DATA_LOCK
+        BARS_TASK["task"] = asyncio.create_task(run_bars_stage())
+
+    if "ai" in due and not active_ai_job():
+        # AI 在背景執行，不阻塞價格更新；run_ai_job 依成功或失敗更新排程時間
+        asyncio.create_task(run_ai_job(new_ai_job("schedule")))
+
+def bars_running() -> bool:
+    task = BARS_TASK.get("task")
+    return task is not None and not task.done()
+
+
+async def run_bars_stage() -> None:
+    """Sync daily bars outside DATA_LOCK, then take the lock only to publish them."""
+    bars_ok = False
+    try:
+        with stage_timer("bars"):
+            bars_ok = await sync_all_history(WATCHLIST.symbols)
+        async with DATA_LOCK:
+            await build_snapshot(["bars"])
+    except Exception as e:
+        bars_ok = False
+        try:
+            await record_refresh_error(e)
+        except Exception as report_error:
+            print(f"[refresh] recording bars failure failed: {report_error!r}")
+    finally:
+        # 日 K 失敗則稍後重試（見 RefreshScheduler.bars_retry_sec）
+        SCHEDULER.mark(["bars"], ok=bars_ok)
+
+
+async def ai_trigger_loop():
+    """Leader: run AI jobs that follower workers queued in AI_TRIGGER_PATH."""
+    while True:
+        await asyncio.sleep(1.0)
+        job = await run_blocking(read_ai_trigger)
+        if job is None:
+            continue
+        if active_ai_job() is None:
+            remember_ai_job(job)
+            # 先寫入 job 狀態再移除請求檔，follower 查詢時不會出現空窗
+            await run_blocking(save_ai_jobs)
+            asyncio.create_task(run_ai_job(job))
+        AI_TRIGGER_PATH.unlink(missing_ok=True)
+
+
+async def archive_maintenance_loop():
+    """Leader: apply archive retention and compaction once an hour."""
+    while True:
+        try:
+            result = await run_blocking(SNAPSHOT_ARCHIVE.maintain)
+            if any(result.values()):
+                print(f"[archive] removed {result['removed']}, compacted {result['compacted']} segments")
+        except Exception as e:
+            print(f"[archive] maintenance failed: {e}")
+        await asyncio.sleep(ARCHIVE_MAINTENANCE_SEC)
 
 
-async def ai_refresher_loop():
+async def follow_shared_snapshot():
+    """Follower: serve whatever the leader publishes and take over if the leader goes away."""
+    seen_alerts: Optional[set] = None
+    next_attempt = time.time() + LEADER_RETRY_SEC
     while True:
+        update = SHARED_SNAPSHOT.read_if_changed()
+        if update is not None:
+            _, etag, bodies, extra = update
+            data = await run_blocking(json.loads, bodies["identity"])
+            SNAPSHOT.publish_encoded(etag, bodies, data)
+            STREAM_HUB.publish_snapshot(data)
+            mark_startup("first_snapshot")
+            alerts = extra.get("alerts") or []
+            if seen_alerts is None:
+                # 第一次讀取只建立基準，不重播已經推送過的警報
+                seen_alerts = {a.get("id") for a in alerts}
+                ALERTS.recent.extend(alerts)
+            else:
+                fresh = new_items(alerts, seen_alerts)
+                for alert in fresh:
+                    ALERTS.recent.appendleft(alert)
+                if fresh:
+                    STREAM_HUB.publish_event("alert", fresh)
+        if time.time() >= next_attempt:
+            next_attempt = time.time() + LEADER_RETRY_SEC
+            if LEADER_LOCK.try_acquire():
+                print(f"[workers] pid {os.getpid()} took over as refresher leader", flush=True)
+                await start_leader()
+                return
+        await asyncio.sleep(SHARED_POLL_SEC)
+
+
+def load_stale_snapshot() -> bool:
+    """Serve the last persisted snapshot at once, flagged ``meta.stale`` until a refresh replaces it."""
+    try:
+        data = json.loads(JSON_PATH.read_bytes())
+    except (OSError, ValueError):
+        return False
+    data["meta"] = {**(data.get("meta") or {}), "stale": True}
+    SNAPSHOT.publish(data)
+    STREAM_HUB.publish_snapshot(data)
+    mark_startup("first_snapshot")
+    return True
+
+
+async def start_refreshing(initial: bool) -> None:
+    """Background refresh: a first full build when nothing could be served, then the scheduler."""
+    if initial:
         try:
-            cache = load_ai_cache()
-            last_ts = cache.get("generated_at_unix") or 0
-            if last_ts == 0 or (now_ts() - last_ts) >= AI_UPDATE_INTERVAL_SEC:
-                async with DATA_LOCK:
-                    await build_snapshot(run_ai=True)
+            async with DATA_LOCK:
+                await build_snapshot()
+            SCHEDULER.mark(["quotes", "news"])
         except Exception as e:
-            print(f"[ai_refresher_loop] AI refresh failed: {e}")
-        await asyncio.sleep(max(60, DATA_UPDATE_INTERVAL_SEC))
+            await record_refresh_error(e)
+    await refresh_scheduler_loop()
+
+
+async def start_leader():
+    """Run the collectors in this process (always the case with a single worker)."""
+    # 送出即啟動解析行程；子行程匯入 feedparser 不阻塞啟動
+    asyncio.get_running_loop().run_in_executor(NEWS_PARSE_EXECUTOR, parse_feed_entries, b"")
+    SCHEDULER.mark(["ai"], now=load_ai_cache().get("generated_at_unix") or 0)
+    async with DATA_LOCK:
+        # 從 follower 接手時沿用記憶體中的快照
+        serving = SNAPSHOT.data is not None or load_stale_snapshot()
+        if serving:
+            SNAPSHOT_WRITER.prime(SNAPSHOT.data)
+            await run_blocking(publish_shared)
+    # 第一次刷新一律在背景進行，啟動不必等待所有上游回應
+    asyncio.create_task(start_refreshing(initial=not serving))
+    if INTRADAY_FEED is not None:
+        asyncio.create_task(INTRADAY_FEED.run(INTRADAY.add_tick))
+    if MULTI_WORKER:
+        asyncio.create_task(ai_trigger_loop())
+    if SNAPSHOT_ARCHIVE is not None:
+        asyncio.create_task(archive_maintenance_loop())
+
 
 @app.on_event("startup")
 async def on_start():
-    async with DATA_LOCK:
-        if not JSON_PATH.exists():
-            await build_snapshot(run_ai=False)
-    asyncio.create_task(data_refresher_loop())
-    asyncio.create_task(ai_refresher_loop())
+    HTTP_POOL.start(UPSTREAM_HOSTS)
+    asyncio.create_task(monitor_event_loop())
+    if not MULTI_WORKER or LEADER_LOCK.try_acquire():
+        await start_leader()
+    else:
+        # follower：leader 尚未發佈時先用磁碟上的最後一份快照回應
+        load_stale_snapshot()
+        asyncio.create_task(follow_shared_snapshot())
+    mark_startup("ready")
+    print(f"[startup] serving after {STARTUP_SECONDS['ready']:.2f}s (import {STARTUP_SECONDS['import']:.2f}s, "
+          f"{'stale snapshot' if SNAPSHOT.data is not None else 'no snapshot yet'})", flush=True)
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await HTTP_POOL.aclose()
+    HISTORY_STORE.close()
+    NEWS_INDEX.close()
+    FETCH_EXECUTOR.shutdown(wait=False)
+    NEWS_PARSE_EXECUTOR.shutdown(wait=False)
+    SHARED_SNAPSHOT.close()
+    if SNAPSHOT_ARCHIVE is not None:
+        SNAPSHOT_ARCHIVE.close()
+    LEADER_LOCK.release()
 
 @app.get("/", response_class=HTMLResponse)
 def index():
@@ -572,25 +1668,196 @@ def index():
     return tpl.render()
 
 @app.get("/data/dashboard.json")
-def data_json():
-    if JSON_PATH.exists():
-        return JSONResponse(content=json.loads(JSON_PATH.read_text(encoding="utf-8")))
-    return JSONResponse(content={"status":"initializing"}, status_code=202)
+def data_json(request: Request):
+    started = time.perf_counter()
+    response = SNAPSHOT.response(request)
+    if response is None:
+        response = JSONResponse(content={"status":"initializing"}, status_code=202)
+    observe_request("/data/dashboard.json", response.status_code, time.perf_counter() - started)
+    return response
+
+
+def runtime_metrics():
+    """Scrape-time metrics read from state the app already keeps (no double counting)."""
+    now = time.time()
+    meta = (SNAPSHOT.data or {}).get("meta") or {}
+    generated_at = (SNAPSHOT.data or {}).get("generated_at_unix")
+    age = GaugeMetricFamily("market_monitor_snapshot_age_seconds", "Seconds since the served snapshot was generated.")
+    if generated_at:
+        age.add_metric([], now - generated_at)
+    yield age
+    ai_age = GaugeMetricFamily("market_monitor_ai_analysis_age_seconds", "Seconds since AI analysis last completed.")
+    if meta.get("ai_last_generated_unix"):
+        ai_age.add_metric([], now - meta["ai_last_generated_unix"])
+    yield ai_age
+    yield GaugeMetricFamily(
+        "market_monitor_refresh_consecutive_failures", "Consecutive failed data refreshes.",
+        value=int(REFRESH_STATUS.get("consecutive_failures", 0)),
+    )
+    yield GaugeMetricFamily(
+        "market_monitor_snapshot_stale", "1 while the snapshot loaded from disk at startup is being served.",
+        value=1 if meta.get("stale") else 0,
+    )
+    if SNAPSHOT_ARCHIVE is not None:
+        archive = SNAPSHOT_ARCHIVE.stats()
+        yield GaugeMetricFamily("market_monitor_archive_bytes", "Disk space used by the snapshot archive.", value=archive["bytes"])
+        yield GaugeMetricFamily("market_monitor_archive_segments", "Segment files in the snapshot archive.", value=archive["segments"])
+    startup = GaugeMetricFamily("market_monitor_startup_seconds", "Seconds from module load to each startup phase.", labels=["phase"])
+    for phase, seconds in STARTUP_SECONDS.items():
+        startup.add_metric([phase], seconds)
+    yield startup
+    imports = GaugeMetricFamily("market_monitor_lazy_import_seconds", "Time spent importing modules loaded on first use.", labels=["module"])
+    for module, seconds in LAZY_IMPORT_SECONDS.items():
+        imports.add_metric([module], seconds)
+    yield imports
+    # 多 worker 時每個 worker 各自回報，以 pid 區分
+    leader = GaugeMetricFamily("market_monitor_refresher_leader", "1 if this worker runs the collectors.", labels=["pid"])
+    leader.add_metric([str(os.getpid())], 1 if is_leader() else 0)
+    yield leader
+    subscribers = GaugeMetricFamily("market_monitor_stream_subscribers", "Open /stream (SSE) connections on this worker.", labels=["pid"])
+    subscribers.add_metric([str(os.getpid())], STREAM_HUB.subscriber_count)
+    yield subscribers
+    if MULTI_WORKER:
+        yield GaugeMetricFamily(
+            "market_monitor_shared_snapshot_generation", "Generation of the shared snapshot this worker last wrote or read.",
+            value=SHARED_SNAPSHOT.generation,
+        )
+
+    caches = {
+        "snapshot_http": (SNAPSHOT.hits, SNAPSHOT.misses),
+        "snapshot_write": (SNAPSHOT_WRITER.skipped, SNAPSHOT_WRITER.writes),
+        "ai_response": (AI_RESPONSE_CACHE.hits, AI_RESPONSE_CACHE.misses),
+        "news_feed": (NEWS_FETCHER.stats["not_modified"] + NEWS_FETCHER.stats["unchanged"], NEWS_FETCHER.stats["parsed"]),
+    }
+    if isinstance(INTRADAY_FEED, QuotePollSource):
+        caches["quote_poll"] = (INTRADAY_FEED.hits, INTRADAY_FEED.misses)
+    requests = CounterMetricFamily("market_monitor_cache_requests", "Cache lookups by cache and result.", labels=["cache", "result"])
+    ratio = GaugeMetricFamily("market_monitor_cache_hit_ratio", "Cache hit ratio since start.", labels=["cache"])
+    for name, (hits, misses) in caches.items():
+        requests.add_metric([name, "hit"], hits)
+        requests.add_metric([name, "miss"], misses)
+        if hits + misses:
+            ratio.add_metric([name], hits / (hits + misses))
+    yield requests
+    yield ratio
+
+    state = GaugeMetricFamily("market_monitor_upstream_circuit_state", "1 for the current breaker state of each upstream.", labels=["upstream", "state"])
+    calls = CounterMetricFamily("market_monitor_upstream_calls", "Upstream calls admitted by the guard.", labels=["upstream"])
+    rejected = CounterMetricFamily("market_monitor_upstream_rejected", "Upstream calls rejected by breaker or budget.", labels=["upstream"])
+    for name, stats in UPSTREAMS.stats().items():
+        for option in ("closed", "half_open", "open"):
+            state.add_metric([name, option], 1 if stats["state"] == option else 0)
+        calls.add_metric([name], stats["calls"])
+        rejected.add_metric([name], stats["rejected"])
+    yield state
+    yield calls
+    yield rejected
+
+
+REGISTRY.register(CallbackCollector(runtime_metrics))
+
+
+@app.get("/metrics")
+def metrics():
+    """Prometheus text exposition."""
+    return Response(content=render_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
+@app.get("/api/news")
+async def news_history(ticker: str, limit: int = 50, since: Optional[int] = None, until: Optional[int] = None):
+    """Query the persistent news index; ``since`` / ``until`` are unix seconds on publish time."""
+    items = await run_blocking(NEWS_INDEX.query, ticker.upper(), max(1, min(limit, 500)), since, until)
+    return JSONResponse(content={"ticker": ticker.upper(), "count": len(items), "items": items})
+
+
+def parse_time_param(value: str) -> float:
+    """Unix seconds, or an ISO 8601 time (without an offset it is taken in TZ)."""
+    try:
+        seconds = float(value)
+    except ValueError:
+        pass
+    else:
+        # nan / inf 無法對應到時間點，也無法放進 JSON 回應
+        if not math.isfinite(seconds):
+            raise ValueError(f"not a finite time: {value}")
+        return seconds
+    moment = datetime.datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    if moment.tzinfo is None:
+        moment = timezone(TZ).localize(moment)
+    return moment.timestamp()
+
+
+@app.get("/api/snapshot")
+async def archived_snapshot(at: str, ticker: Optional[str] = None):
+    """The snapshot the dashboard was showing at ``at`` (unix seconds or ISO 8601), from the archive."""
+    if SNAPSHOT_ARCHIVE is None:
+        return JSONResponse(content={"error": "archive_disabled"}, status_code=404)
+    try:
+        when = parse_time_param(at)
+    except ValueError:
+        return JSONResponse(content={"error": "invalid_time", "at": at}, status_code=400)
+    found = await run_blocking(SNAPSHOT_ARCHIVE.at, when)
+    if found is None:
+        return JSONResponse(content={"error": "not_archived", "at_unix": when}, status_code=404)
+    archived_at, data = found
+    if ticker:
+        tickers = data.get("tickers") or {}
+        data = {**data, "tickers": {t: e for t, e in tickers.items() if t == ticker.upper()}}
+    return JSONResponse(content={
+        "at_unix": when,
+        "archived_at_unix": archived_at,
+        "archived_at_local": datetime.datetime.fromtimestamp(archived_at, timezone(TZ)).strftime("%Y-%m-%d %H:%M:%S %Z"),
+        "snapshot": data,
+    })
+
+
+@app.get("/api/alerts")
+def recent_alerts(limit: int = 50):
+    """Most recently fired alerts, newest first."""
+    items = list(ALERTS.recent)[:max(1, min(limit, 100))]
+    return JSONResponse(content={"count": len(items), "items": items, **ALERTS.stats()})
+
+
+@app.get("/stream")
+async def stream(request: Request):
+    """Server-Sent Events: a full ``snapshot`` on connect, then per-ticker ``delta`` events."""
+    async def events():
+        async for chunk in STREAM_HUB.subscribe():
+            if await request.is_disconnected():
+                break
+            yield chunk
+    return StreamingResponse(events(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
 
 
 @app.post("/trigger/ai")
 async def trigger_ai_refresh():
-    async with DATA_LOCK:
-        data = await build_snapshot(run_ai=True)
-    meta = data.get("meta", {})
-    return JSONResponse(content={
-        "status": "ok",
-        "ai_generated_at_local": meta.get("ai_last_generated_local"),
-        "ai_generated_at_unix": meta.get("ai_last_generated_unix"),
-        "ai_total_runs": meta.get("ai_total_runs"),
-        "ai_total_ticker_runs": meta.get("ai_total_ticker_runs"),
-    })
+    """Queue an AI run and return its job id immediately (reuses a running job)."""
+    if not is_leader():
+        return JSONResponse(content=await run_blocking(request_ai_from_leader), status_code=202)
+    job = active_ai_job()
+    if job is None:
+        job = new_ai_job("manual")
+        asyncio.create_task(run_ai_job(job))
+    return JSONResponse(content=job, status_code=202)
+
+
+@app.get("/trigger/ai/{job_id}")
+def ai_job_status(job_id: str):
+    job = AI_JOBS.get(job_id)
+    if job is None and not is_leader():
+        job = read_ai_jobs().get(job_id)
+        pending = read_ai_trigger()
+        if job is None and pending is not None and pending.get("job_id") == job_id:
+            job = pending
+    if job is None:
+        return JSONResponse(content={"status": "not_found", "job_id": job_id}, status_code=404)
+    return JSONResponse(content=job)
+
+mark_startup("import")
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run("server:app", host="0.0.0.0", port=8088, workers=1)
+    uvicorn.run("server:app", host="0.0.0.0", port=8088, workers=SERVER_WORKERS)
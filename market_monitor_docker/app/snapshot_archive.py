@@ -0,0 +1,333 @@
+# -*- coding: utf-8 -*-
+"""Append-only, segment-rotated archive of published snapshots.
+
+Each segment file (``<start_ms>.seg``) is a sequence of records: a full
+keyframe every ``keyframe_every`` records and, in between, a JSON delta
+against the previous snapshot, each zlib-compressed with a crc32. A
+sidecar ``.idx`` holds (timestamp, offset) of every keyframe, so the state
+at any time is rebuilt from the nearest earlier keyframe plus at most
+``keyframe_every - 1`` deltas.
+
+Segments are append-only and never rewritten in place: a restart starts a
+new segment, a torn tail record fails its crc and is ignored, and
+compaction writes a thinned copy (``<start_ms>.c<interval>.seg``) before
+deleting the original.
+"""
+import bisect
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from persistence import dumps_json
+
+# payload length, timestamp, kind, payload crc32
+RECORD = struct.Struct("<IdBI")
+INDEX_ENTRY = struct.Struct("<dQ")
+KEYFRAME, DELTA = 0, 1
+
+
+def diff(old: Any, new: Any) -> Optional[Dict[str, Any]]:
+    """Patch turning dict ``old`` into dict ``new``; None when they are equal.
+
+    ``s``: keys set to a new value, ``d``: deleted keys, ``p``: nested
+    patches for dicts and for lists that slid forward (see ``_list_patch``).
+    """
+    patch: Dict[str, Any] = {}
+    for key, value in new.items():
+        if key not in old:
+            patch.setdefault("s", {})[key] = value
+            continue
+        before = old[key]
+        if before == value:
+            continue
+        sub = None
+        if isinstance(before, dict) and isinstance(value, dict):
+            sub = diff(before, value)
+        elif isinstance(before, list) and isinstance(value, list):
+            sub = _list_patch(before, value)
+        if sub is not None:
+            patch.setdefault("p", {})[key] = sub
+        else:
+            patch.setdefault("s", {})[key] = value
+    deleted = [key for key in old if key not in new]
+    if deleted:
+        patch["d"] = deleted
+    return patch or None
+
+
+def _list_patch(old: List[Any], new: List[Any]) -> Optional[Dict[str, Any]]:
+    """``{"l": [k, m, tail]}`` meaning ``old[k:k + m] + tail``, for rolling windows such as intraday bars."""
+    if not new or not old:
+        return None
+    try:
+        k = old.index(new[0])
+    except ValueError:
+        return None
+    m = 0
+    limit = min(len(old) - k, len(new))
+    while m < limit and old[k + m] == new[m]:
+        m += 1
+    # 只有保留下來的元素夠多時才划算
+    if m < max(2, len(new) // 4):
+        return None
+    return {"l": [k, m, new[m:]]}
+
+
+def apply(state: Dict[str, Any], patch: Dict[str, Any]) -> Dict[str, Any]:
+    """Apply a ``diff`` patch to ``state`` in place and return it."""
+    for key, value in (patch.get("s") or {}).items():
+        state[key] = value
+    for key in patch.get("d") or ():
+        state.pop(key, None)
+    for key, sub in (patch.get("p") or {}).items():
+        if "l" in sub:
+            k, m, tail = sub["l"]
+            state[key] = state[key][k:k + m] + tail
+        else:
+            apply(state[key], sub)
+    return state
+
+
+def _segment_start(path: Path) -> int:
+    return int(path.name.split(".", 1)[0])
+
+
+def _index_path(path: Path) -> Path:
+    return path.with_suffix(".idx")
+
+
+def read_records(path: Path, offset: int = 0) -> Iterator[Tuple[int, float, int, Any]]:
+    """(offset, timestamp, kind, decoded payload) from ``offset`` to the first torn or corrupt record."""
+    with open(path, "rb") as fh:
+        fh.seek(offset)
+        while True:
+            header = fh.read(RECORD.size)
+            if len(header) < RECORD.size:
+                return
+            length, ts, kind, crc = RECORD.unpack(header)
+            payload = fh.read(length)
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                return
+            yield offset, ts, kind, json.loads(zlib.decompress(payload))
+            offset += RECORD.size + length
+
+
+def replay(path: Path, offset: int = 0, until: Optional[float] = None) -> Iterator[Tuple[float, Dict[str, Any]]]:
+    """Full snapshots of a segment from the keyframe at ``offset``, stopping after ``until``."""
+    state: Optional[Dict[str, Any]] = None
+    for _, ts, kind, payload in read_records(path, offset):
+        if until is not None and ts > until:
+            return
+        if kind == KEYFRAME:
+            state = payload
+        elif state is not None:
+            state = apply(state, payload)
+        else:
+            continue
+        yield ts, state
+
+
+class SnapshotArchive:
+    """Writes every published snapshot and rebuilds the one shown at a given time."""
+
+    def __init__(self, root: Path, keyframe_every: int = 60, segment_sec: float = 86400,
+                 retention_sec: float = 90 * 86400, compact_after_sec: float = 7 * 86400,
+                 compact_interval_sec: float = 900):
+        self.root = root
+        self.keyframe_every = max(1, keyframe_every)
+        self.segment_sec = segment_sec
+        self.retention_sec = retention_sec
+        self.compact_after_sec = compact_after_sec
+        self.compact_interval_sec = max(60, int(compact_interval_sec))
+        self.records = 0
+        self.bytes_written = 0
+        self._lock = threading.Lock()
+        self._fh = None
+        self._index = None
+        self._path: Optional[Path] = None
+        self._segment_start = 0.0
+        self._since_keyframe = 0
+        self._last: Optional[Dict[str, Any]] = None
+        self._last_ts = 0.0
+
+    # ------------------------------------------------------------------ writing
+
+    def _open_segment(self, ts: float) -> None:
+        self._close_segment()
+        self.root.mkdir(parents=True, exist_ok=True)
+        start = int(ts * 1000)
+        while (self.root / f"{start}.seg").exists():
+            start += 1
+        self._path = self.root / f"{start}.seg"
+        self._fh = open(self._path, "ab")
+        self._index = open(_index_path(self._path), "ab")
+        self._segment_start = ts
+        self._since_keyframe = 0
+        self._last = None
+
+    def _close_segment(self) -> None:
+        for fh in (self._fh, self._index):
+            if fh is not None:
+                fh.flush()
+                os.fsync(fh.fileno())
+                fh.close()
+        self._fh = self._index = None
+
+    def append(self, data: Dict[str, Any], ts: Optional[float] = None) -> bool:
+        """Archive ``data`` as published at ``ts``; returns False when nothing changed."""
+        ts = max(ts if ts is not None else time.time(), self._last_ts)
+        with self._lock:
+            if self._fh is None or ts - self._segment_start >= self.segment_sec:
+                self._open_segment(ts)
+            if self._last is not None and self._since_keyframe < self.keyframe_every:
+                patch = diff(self._last, data)
+                if patch is None:
+                    return False
+                kind, body = DELTA, patch
+            else:
+                kind, body = KEYFRAME, data
+            payload = zlib.compress(dumps_json(body), 6)
+            offset = self._fh.tell()
+            # 只 flush 不 fsync：當機時最多遺失尾端幾筆，殘缺的紀錄讀取時以 crc 排除
+            self._fh.write(RECORD.pack(len(payload), ts, kind, zlib.crc32(payload)) + payload)
+            self._fh.flush()
+            if kind == KEYFRAME:
+                self._index.write(INDEX_ENTRY.pack(ts, offset))
+                self._index.flush()
+                self._since_keyframe = 0
+            self._since_keyframe += 1
+            self._last = data
+            self._last_ts = ts
+            self.records += 1
+            self.bytes_written += RECORD.size + len(payload)
+            return True
+
+    def close(self) -> None:
+        with self._lock:
+            self._close_segment()
+
+    # ------------------------------------------------------------------ reading
+
+    def segments(self) -> List[Path]:
+        return sorted(self.root.glob("*.seg"), key=_segment_start)
+
+    @staticmethod
+    def _keyframes(path: Path) -> List[Tuple[float, int]]:
+        try:
+            raw = _index_path(path).read_bytes()
+        except OSError:
+            raw = b""
+        entries = [INDEX_ENTRY.unpack_from(raw, i) for i in range(0, len(raw) - INDEX_ENTRY.size + 1, INDEX_ENTRY.size)]
+        if not entries:
+            # 索引遺失時掃描整個 segment 重建
+            entries = [(ts, offset) for offset, ts, kind, _ in read_records(path) if kind == KEYFRAME]
+        return entries
+
+    def _state_in(self, path: Path, at: Optional[float]) -> Optional[Tuple[float, Dict[str, Any]]]:
+        keyframes = self._keyframes(path)
+        if not keyframes:
+            return None
+        if at is None:
+            offset = keyframes[-1][1]
+        else:
+            i = bisect.bisect_right([ts for ts, _ in keyframes], at) - 1
+            if i < 0:
+                return None
+            offset = keyframes[i][1]
+        found = None
+        for ts, state in replay(path, offset, until=at):
+            found = (ts, state)
+        return found
+
+    def at(self, ts: float) -> Optional[Tuple[float, Dict[str, Any]]]:
+        """(archived_at, snapshot) of the last snapshot published at or before ``ts``."""
+        for _ in range(2):
+            try:
+                segments = [p for p in self.segments() if _segment_start(p) <= ts * 1000]
+                # 壓縮後的 segment 第一筆可能晚於檔名的起點，找不到時退回前一個 segment 的最後狀態
+                for i, path in enumerate(reversed(segments)):
+                    found = self._state_in(path, ts if i == 0 else None)
+                    if found is not None:
+                        return found
+                return None
+            except FileNotFoundError:
+                # 讀取期間 segment 被壓縮或刪除，重新列出一次
+                continue
+        return None
+
+    # --------------------------------------------------------------- maintenance
+
+    def maintain(self, now: Optional[float] = None) -> Dict[str, int]:
+        """Drop segments past retention and thin out old ones to one snapshot per compact interval."""
+        now = now if now is not None else time.time()
+        removed = compacted = 0
+        with self._lock:
+            active = self._path
+        segments = self.segments()
+        for i, path in enumerate(segments):
+            if path == active:
+                continue
+            # segment 的結束時間視為下一個 segment 的起點
+            end = _segment_start(segments[i + 1]) / 1000 if i + 1 < len(segments) else now
+            if now - end > self.retention_sec:
+                path.unlink(missing_ok=True)
+                _index_path(path).unlink(missing_ok=True)
+                removed += 1
+            elif now - end > self.compact_after_sec and ".c" not in path.name:
+                self._compact(path)
+                compacted += 1
+        return {"removed": removed, "compacted": compacted}
+
+    def _compact(self, path: Path) -> None:
+        interval = self.compact_interval_sec
+        target = path.with_name(f"{_segment_start(path)}.c{interval}.seg")
+        tmp_seg, tmp_idx = target.with_suffix(".seg.tmp"), target.with_suffix(".idx.tmp")
+        kept: Optional[Tuple[float, Dict[str, Any]]] = None
+        previous: Optional[Dict[str, Any]] = None
+        count = 0
+        with open(tmp_seg, "wb") as seg, open(tmp_idx, "wb") as idx:
+            def write(ts: float, state: Dict[str, Any]) -> None:
+                nonlocal previous, count
+                if previous is None or count % self.keyframe_every == 0:
+                    kind, body = KEYFRAME, state
+                else:
+                    body = diff(previous, state)
+                    if body is None:
+                        return
+                    kind = DELTA
+                payload = zlib.compress(dumps_json(body), 9)
+                if kind == KEYFRAME:
+                    idx.write(INDEX_ENTRY.pack(ts, seg.tell()))
+                seg.write(RECORD.pack(len(payload), ts, kind, zlib.crc32(payload)) + payload)
+                previous = state
+                count += 1
+
+            # 每個時間區間保留最後一份快照（即該區間結束時畫面上的內容）
+            for ts, state in replay(path):
+                if kept is not None and int(kept[0] // interval) != int(ts // interval):
+                    write(*kept)
+                kept = (ts, json.loads(dumps_json(state)))
+            if kept is not None:
+                write(*kept)
+            for fh in (seg, idx):
+                fh.flush()
+                os.fsync(fh.fileno())
+        os.replace(tmp_idx, _index_path(target))
+        os.replace(tmp_seg, target)
+        path.unlink(missing_ok=True)
+        _index_path(path).unlink(missing_ok=True)
+
+    def stats(self) -> Dict[str, Any]:
+        segments = self.segments()
+        size = 0
+        for path in segments:
+            try:
+                size += path.stat().st_size + _index_path(path).stat().st_size
+            except OSError:
+                pass
+        return {"segments": len(segments), "bytes": size, "records_written": self.records}
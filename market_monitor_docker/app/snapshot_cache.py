@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""In-memory, pre-encoded dashboard snapshot served with ETag / 304 support."""
+import gzip
+import hashlib
+import json
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import Response
+
+from persistence import dumps_json
+
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
+
+class SnapshotCache:
+    """Holds the latest snapshot as JSON bytes plus gzip / brotli variants.
+
+    Encoding happens once per publish, so each poll costs a header
+    comparison (304) or a memory copy of an already-compressed body.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.data: Optional[Dict[str, Any]] = None
+        self.etag: Optional[str] = None
+        self._bodies: Dict[str, bytes] = {}
+        # 304 視為命中，回傳完整內容視為未命中
+        self.hits = 0
+        self.misses = 0
+
+    def publish(self, data: Dict[str, Any]) -> None:
+        self.publish_bytes(dumps_json(data), data)
+
+    def publish_bytes(self, raw: bytes, data: Optional[Dict[str, Any]] = None) -> None:
+        bodies = {
+            "identity": raw,
+            "gzip": gzip.compress(raw, compresslevel=6),
+        }
+        if BROTLI_AVAILABLE:
+            bodies["br"] = brotli.compress(raw, quality=8)
+        etag = hashlib.sha256(raw).hexdigest()[:32]
+        if data is None:
+            data = json.loads(raw)
+        self.publish_encoded(etag, bodies, data)
+
+    def publish_encoded(self, etag: str, bodies: Dict[str, bytes], data: Dict[str, Any]) -> None:
+        """Publish bodies that were already encoded elsewhere (e.g. by the refresher leader)."""
+        with self._lock:
+            self.data = data
+            self.etag = etag
+            self._bodies = bodies
+
+    def encoded(self) -> Tuple[Optional[str], Dict[str, bytes]]:
+        with self._lock:
+            return self.etag, self._bodies
+
+    @staticmethod
+    def _pick_encoding(accept_encoding: str, available: Dict[str, bytes]) -> str:
+        accepted = {part.split(";")[0].strip().lower() for part in accept_encoding.split(",")}
+        if "br" in accepted and "br" in available:
+            return "br"
+        if "gzip" in accepted:
+            return "gzip"
+        return "identity"
+
+    def response(self, request: Request) -> Optional[Response]:
+        """Build the response for ``request``, or None when nothing is published."""
+        with self._lock:
+            etag, bodies = self.etag, self._bodies
+        if etag is None:
+            return None
+
+        headers = {
+            "Cache-Control": "no-cache",
+            "Vary": "Accept-Encoding",
+        }
+        encoding = self._pick_encoding(request.headers.get("accept-encoding", ""), bodies)
+        # 不同壓縮格式的內容不同，強 ETag 需要帶上編碼後綴
+        tag = f'"{etag}"' if encoding == "identity" else f'"{etag}-{encoding}"'
+        headers["ETag"] = tag
+
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match:
+            candidates = {c.strip().removeprefix("W/").strip('"').split("-")[0] for c in if_none_match.split(",")}
+            if "*" in candidates or etag in candidates:
+                self.hits += 1
+                return Response(status_code=304, headers=headers)
+
+        self.misses += 1
+
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        return Response(content=bodies[encoding], media_type="application/json", headers=headers)
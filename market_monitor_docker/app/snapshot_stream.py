@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""Server-Sent Events hub that pushes per-ticker snapshot deltas to browsers."""
+import asyncio
+import json
+from typing import Any, AsyncIterator, Dict, Optional, Set
+
+TICKER_FIELDS = ("price", "history", "intraday", "ai_analysis")
+
+
+def _news_key(item: Dict[str, Any]) -> str:
+    return item.get("link") or item.get("title") or ""
+
+
+def diff_snapshots(prev: Optional[Dict[str, Any]], curr: Dict[str, Any]) -> Dict[str, Any]:
+    """Compute the changes from ``prev`` to ``curr``.
+
+    Per ticker only changed ``price`` / ``history`` / ``intraday`` / ``ai_analysis`` blocks
+    and newly seen headlines are included, plus the current headline keys
+    whenever the list changed; unchanged tickers are omitted.
+    """
+    prev = prev or {}
+    prev_tickers = prev.get("tickers") or {}
+    curr_tickers = curr.get("tickers") or {}
+
+    delta: Dict[str, Any] = {
+        "generated_at_unix": curr.get("generated_at_unix"),
+        "generated_at_local": curr.get("generated_at_local"),
+        "tickers": {},
+    }
+    if curr.get("meta") != prev.get("meta"):
+        delta["meta"] = curr.get("meta")
+
+    for ticker, entry in curr_tickers.items():
+        before = prev_tickers.get(ticker) or {}
+        changes: Dict[str, Any] = {}
+        for field in TICKER_FIELDS:
+            if (field in entry or field in before) and entry.get(field) != before.get(field):
+                changes[field] = entry.get(field)
+        before_keys = [_news_key(n) for n in before.get("news") or []]
+        keys = [_news_key(n) for n in entry.get("news") or []]
+        if keys != before_keys:
+            # 新聞被移除或重新排序時也要送出清單，瀏覽器才能同步
+            known = set(before_keys)
+            changes["news_added"] = [n for n in entry.get("news") or [] if _news_key(n) not in known]
+            changes["news_keep"] = keys
+        if changes:
+            delta["tickers"][ticker] = changes
+
+    removed = [t for t in prev_tickers if t not in curr_tickers]
+    if removed:
+        delta["removed"] = removed
+    return delta
+
+
+def format_sse(event: str, data: Any) -> bytes:
+    payload = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+    return f"event: {event}\ndata: {payload}\n\n".encode("utf-8")
+
+
+class StreamHub:
+    """Fan-out of snapshot events to connected SSE subscribers.
+
+    Each subscriber owns a bounded queue. A subscriber that falls too far
+    behind is resynchronised with a full snapshot instead of the backlog.
+    """
+
+    RESYNC = object()
+
+    def __init__(self, queue_size: int = 16, heartbeat_sec: float = 15.0):
+        self.queue_size = queue_size
+        self.heartbeat_sec = heartbeat_sec
+        self.latest: Optional[Dict[str, Any]] = None
+        self._subscribers: Set[asyncio.Queue] = set()
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def _offer(self, queue: asyncio.Queue, item: Any) -> None:
+        try:
+            queue.put_nowait(item)
+        except asyncio.QueueFull:
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(self.RESYNC)
+
+    def publish_snapshot(self, data: Dict[str, Any]) -> None:
+        """Diff ``data`` against the previous snapshot and push the delta."""
+        previous, self.latest = self.latest, data
+        if previous is None:
+            message = format_sse("snapshot", data)
+        else:
+            # 即使沒有股票變動也送出，讓前端更新「最後更新」時間
+            message = format_sse("delta", diff_snapshots(previous, data))
+        for queue in list(self._subscribers):
+            self._offer(queue, message)
+
+    def publish_event(self, event: str, data: Any) -> None:
+        """Push a standalone event (e.g. ``alert``) to every subscriber."""
+        message = format_sse(event, data)
+        for queue in list(self._subscribers):
+            self._offer(queue, message)
+
+    async def subscribe(self) -> AsyncIterator[bytes]:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.add(queue)
+        try:
+            if self.latest is not None:
+                yield format_sse("snapshot", self.latest)
+            while True:
+                try:
+                    item = await asyncio.wait_for(queue.get(), timeout=self.heartbeat_sec)
+                except asyncio.TimeoutError:
+                    yield b": keep-alive\n\n"
+                    continue
+                if item is self.RESYNC:
+                    if self.latest is not None:
+                        yield format_sse("snapshot", self.latest)
+                    continue
+                yield item
+        finally:
+            self._subscribers.discard(queue)
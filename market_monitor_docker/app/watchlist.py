@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""Config-driven watchlist: groups, news query templates, Stooq symbols and refresh shards.
+
+The watchlist file (JSON, see ``watchlist.example.json``) lists groups of
+tickers. Group settings (``queries``, ``exchange``, ``priority``) apply to
+every ticker in the group unless the ticker overrides them. Without a file
+the ``TICKERS`` list is used with the default settings.
+
+``ShardRotation`` splits the watchlist into fixed-size shards that the
+refresher walks round-robin, one shard per tick, so a list of thousands of
+symbols is refreshed once per interval without bursts. A ticker with
+priority ``p`` appears ``p`` times per rotation.
+"""
+import json
+import math
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+DEFAULT_QUERIES = ["{symbol}"]
+DEFAULT_EXCHANGE = "us"
+MAX_PRIORITY = 10
+
+# 未設定查詢字串時沿用原本內建的新聞關鍵字
+BUILTIN_QUERIES = {
+    "NVDA": ["NVIDIA NVDA", "NVIDIA earnings", "NVIDIA data center AI"],
+    "SMCI": ["Super Micro Computer SMCI", "SMCI earnings", "SMCI server AI"],
+    "QQQ": ["Invesco QQQ Nasdaq-100", "QQQ ETF flows", "Nasdaq-100 AI megacap"],
+}
+
+
+class WatchItem:
+    """One ticker with its group settings resolved."""
+
+    def __init__(self, symbol: str, group: str, name: Optional[str] = None,
+                 queries: Optional[Sequence[str]] = None, exchange: str = DEFAULT_EXCHANGE,
+                 stooq: Optional[str] = None, priority: int = 1):
+        self.symbol = symbol.strip().upper()
+        self.group = group
+        self.name = name or self.symbol
+        self.exchange = exchange.strip().lower().lstrip(".")
+        self.stooq = (stooq or f"{self.symbol.lower()}.{self.exchange}").lower()
+        self.priority = min(MAX_PRIORITY, max(1, int(priority)))
+        templates = list(queries) if queries else BUILTIN_QUERIES.get(self.symbol, DEFAULT_QUERIES)
+        fields = {"symbol": self.symbol, "name": self.name, "group": group}
+        try:
+            # 未設定名稱時 "{name} {symbol}" 會重複代碼，去掉查詢內重複的字
+            self.queries = list(dict.fromkeys(" ".join(dict.fromkeys(t.format(**fields).split())) for t in templates))
+        except (KeyError, IndexError) as e:
+            raise ValueError(f"bad query template for {self.symbol}: unknown field {e}")
+
+
+def parse_watchlist(config: Dict[str, Any]) -> Tuple[List[WatchItem], List[str]]:
+    """Items in file order (first occurrence wins, highest priority kept) plus config errors."""
+    defaults = config.get("defaults") or {}
+    groups = config.get("groups") or {}
+    if isinstance(groups, list):
+        groups = {str(g.get("name") or f"group{i}"): g for i, g in enumerate(groups)}
+    items: Dict[str, WatchItem] = {}
+    errors: List[str] = []
+    for group_name, group in groups.items():
+        settings = {**defaults, **{k: v for k, v in group.items() if k != "tickers"}}
+        for entry in group.get("tickers") or []:
+            spec = {"symbol": entry} if isinstance(entry, str) else dict(entry)
+            merged = {**settings, **spec}
+            try:
+                item = WatchItem(
+                    merged["symbol"], group_name,
+                    name=merged.get("name"),
+                    queries=merged.get("queries"),
+                    exchange=str(merged.get("exchange", DEFAULT_EXCHANGE)),
+                    stooq=merged.get("stooq"),
+                    priority=merged.get("priority", 1),
+                )
+            except (KeyError, TypeError, ValueError) as e:
+                errors.append(f"{group_name}: {e}")
+                continue
+            known = items.get(item.symbol)
+            if known is None:
+                items[item.symbol] = item
+            else:
+                known.priority = max(known.priority, item.priority)
+    return list(items.values()), errors
+
+
+class Watchlist:
+    """The current watchlist, reloaded from ``path`` when the file changes."""
+
+    def __init__(self, path: Path, fallback: Sequence[str]):
+        self.path = path
+        self.fallback = list(fallback)
+        self.items: Dict[str, WatchItem] = {}
+        self.symbols: List[str] = []
+        self.groups: List[str] = []
+        self.errors: List[str] = []
+        self._mtime: Optional[float] = -1.0
+        self._lock = threading.Lock()
+
+    def reload_if_changed(self) -> bool:
+        try:
+            mtime = self.path.stat().st_mtime
+        except OSError:
+            mtime = None
+        if mtime == self._mtime:
+            return False
+        self._mtime = mtime
+        errors: List[str] = []
+        items: List[WatchItem] = []
+        if mtime is not None:
+            try:
+                items, errors = parse_watchlist(json.loads(self.path.read_text(encoding="utf-8")))
+            except (OSError, ValueError, AttributeError) as e:
+                errors = [f"watchlist unreadable: {e}"]
+        if not items:
+            # 沒有檔案（或檔案無效）時使用 TICKERS
+            items = [WatchItem(symbol, "default") for symbol in self.fallback]
+        with self._lock:
+            self.items = {item.symbol: item for item in items}
+            self.symbols = [item.symbol for item in items]
+            self.groups = list(dict.fromkeys(item.group for item in items))
+            self.errors = errors
+        for error in errors:
+            print(f"[watchlist] {error}")
+        return True
+
+    def queries(self, symbol: str) -> List[str]:
+        item = self.items.get(symbol)
+        if item is None:
+            return list(BUILTIN_QUERIES.get(symbol, [symbol]))
+        return item.queries
+
+    def stooq_symbol(self, symbol: str) -> str:
+        item = self.items.get(symbol)
+        return item.stooq if item is not None else f"{symbol.lower()}.{DEFAULT_EXCHANGE}"
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "watchlist_size": len(self.symbols),
+            "watchlist_groups": self.groups,
+            "watchlist_errors": self.errors,
+        }
+
+
+class ShardRotation:
+    """Round-robin over fixed-size shards of a priority-weighted ticker sequence."""
+
+    def __init__(self, shard_size: int):
+        self.shard_size = max(1, shard_size)
+        self.shards: List[List[str]] = [[]]
+        self._cursor = 0
+
+    def rebuild(self, items: Sequence[WatchItem]) -> None:
+        # 優先度 p 的股票在一輪中出現 p 次，平均分散在整個序列
+        slots = []
+        for order, item in enumerate(items):
+            offset = order / max(1, len(items))
+            slots.extend(((k + offset) / item.priority, order, item.symbol) for k in range(item.priority))
+        sequence = [symbol for _, _, symbol in sorted(slots)]
+        count = max(1, math.ceil(len(sequence) / self.shard_size))
+        if count == 1:
+            shards = [[item.symbol for item in items]]
+        else:
+            # 平均分配，避免最後一片特別小
+            bounds = [len(sequence) * i // count for i in range(count + 1)]
+            shards = [list(dict.fromkeys(sequence[bounds[i]:bounds[i + 1]])) for i in range(count)]
+        self.shards = shards
+        self._cursor %= len(shards)
+
+    @property
+    def count(self) -> int:
+        return len(self.shards)
+
+    def next(self) -> List[str]:
+        shard = self.shards[self._cursor]
+        self._cursor = (self._cursor + 1) % len(self.shards)
+        return shard
@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+"""Local stand-in for Yahoo quote, Stooq, Google News RSS and the LLM APIs.
+
+Batched AI requests (OpenAI ``json_schema`` response format, Anthropic
+forced tool use) are answered with one analysis per ticker in the prompt.
+Responses are replayed from recorded files in ``--fixtures`` when present,
+otherwise synthesised deterministically per ticker. Every request waits
+``--latency-ms`` (± ``--jitter-ms``) and fails with a 503 / 429 at
+``--error-rate``; LLM endpoints use ``--llm-latency-ms`` instead.
+
+Fixture files (all optional)::
+
+    quote/<TICKER>.json   one item of a Yahoo quoteResponse.result
+    stooq/<ticker>.csv    Stooq daily CSV (Date,Open,High,Low,Close,Volume)
+    rss/<anything>.xml    RSS documents, served round-robin by query
+    llm/openai.json       chat.completions response body
+    llm/anthropic.json    messages response body
+
+Run: ``python fake_upstream.py --port 9100 --latency-ms 40 --error-rate 0.02``
+"""
+import argparse
+import asyncio
+import datetime
+import hashlib
+import json
+import random
+import re
+import time
+from email.utils import format_datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+from xml.sax.saxutils import escape
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
+
+
+def _seed(*parts: str) -> int:
+    return int(hashlib.sha256("|".join(parts).encode()).hexdigest()[:12], 16)
+
+
+def _base_price(ticker: str) -> float:
+    return 20 + _seed(ticker) % 780
+
+
+class Fixtures:
+    def __init__(self, root: Optional[Path]):
+        self.root = root
+        self.rss: List[bytes] = []
+        if root is not None and (root / "rss").is_dir():
+            self.rss = [p.read_bytes() for p in sorted((root / "rss").glob("*.xml"))]
+
+    def read(self, *parts: str) -> Optional[bytes]:
+        if self.root is None:
+            return None
+        path = self.root.joinpath(*parts)
+        return path.read_bytes() if path.is_file() else None
+
+
+def synth_quote(ticker: str, now: float) -> Dict[str, object]:
+    base = _base_price(ticker)
+    # 以分鐘為單位的確定性隨機漫步，重複請求在同一分鐘內結果相同
+    minute = int(now // 60)
+    rng = random.Random(_seed(ticker, str(minute)))
+    price = round(base * (1 + rng.uniform(-0.03, 0.03)), 2)
+    return {
+        "symbol": ticker,
+        "currency": "USD",
+        "fullExchangeName": "NasdaqGS",
+        "exchange": "NMS",
+        "regularMarketPrice": price,
+        "regularMarketTime": minute * 60,
+        "regularMarketVolume": 1_000_000 + (minute % 390) * 5_000,
+        "regularMarketPreviousClose": round(base, 2),
+        "preMarketPrice": round(price * 0.998, 2),
+        "preMarketTime": minute * 60,
+        "postMarketPrice": round(price * 1.002, 2),
+        "postMarketTime": minute * 60,
+    }
+
+
+def synth_stooq(symbol: str, start: datetime.date, end: datetime.date) -> str:
+    ticker = symbol.split(".")[0].upper()
+    rng = random.Random(_seed("stooq", ticker))
+    price = _base_price(ticker)
+    lines = ["Date,Open,High,Low,Close,Volume"]
+    # 固定從兩年前的元旦起產生，讓同一檔股票不同區間（增量同步）的資料一致
+    day = datetime.date(datetime.date.today().year - 2, 1, 1)
+    while day <= end:
+        if day.weekday() < 5:
+            open_ = price
+            price = max(1.0, price * (1 + rng.gauss(0.0003, 0.02)))
+            high = max(open_, price) * (1 + abs(rng.gauss(0, 0.005)))
+            low = min(open_, price) * (1 - abs(rng.gauss(0, 0.005)))
+            volume = int(1_000_000 * (1 + rng.random()))
+            if day >= start:
+                lines.append(f"{day},{open_:.2f},{high:.2f},{low:.2f},{price:.2f},{volume}")
+        day += datetime.timedelta(days=1)
+    return "\n".join(lines) + "\n"
+
+
+def synth_rss(query: str, items: int, bucket: int) -> bytes:
+    now = datetime.datetime.fromtimestamp(bucket, datetime.timezone.utc)
+    entries = []
+    for i in range(items):
+        # 每個時間桶換掉最新的幾則，模擬新聞逐步更新
+        n = bucket // 600 * 3 + i
+        published = now - datetime.timedelta(minutes=7 * i)
+        title = escape(f"{query} headline {n}")
+        entries.append(
+            f"<item><title>{title}</title>"
+            f"<link>https://example.invalid/{_seed(query, str(n)):x}</link>"
+            f"<guid>{_seed(query, str(n)):x}</guid>"
+            f"<pubDate>{format_datetime(published)}</pubDate>"
+            f"<source url=\"https://example.invalid\">Bench Wire</source></item>"
+        )
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?><rss version="2.0"><channel>'
+        f"<title>{escape(query)}</title>{''.join(entries)}</channel></rss>"
+    ).encode()
+
+
+ANALYSIS = {
+    "summary": "基準測試用的模擬分析。",
+    "trend": "neutral",
+    "key_points": ["模擬要點一", "模擬要點二", "模擬要點三"],
+}
+
+
+def batch_analyses(prompt: str) -> Dict[str, object]:
+    tickers = re.findall(r'"ticker":"([^"]+)"', prompt)
+    return {"analyses": [{"ticker": ticker, **ANALYSIS} for ticker in tickers]}
+
+
+def create_app(args: argparse.Namespace) -> FastAPI:
+    app = FastAPI(title="Fake upstreams")
+    fixtures = Fixtures(Path(args.fixtures) if args.fixtures else None)
+    rng = random.Random(args.seed)
+    counters: Dict[str, int] = {}
+
+    async def delay(kind: str) -> Optional[Response]:
+        counters[kind] = counters.get(kind, 0) + 1
+        mean = args.llm_latency_ms if kind == "llm" else args.latency_ms
+        wait = max(0.0, rng.gauss(mean, args.jitter_ms)) / 1000
+        if wait:
+            await asyncio.sleep(wait)
+        if rng.random() < args.error_rate:
+            counters[f"{kind}_errors"] = counters.get(f"{kind}_errors", 0) + 1
+            # 大部分為 503，少部分為帶 Retry-After 的 429
+            if rng.random() < 0.2:
+                return PlainTextResponse("rate limited", status_code=429, headers={"Retry-After": "5"})
+            return PlainTextResponse("unavailable", status_code=503)
+        return None
+
+    @app.get("/v7/finance/quote")
+    async def quote(symbols: str = ""):
+        error = await delay("quote")
+        if error is not None:
+            return error
+        now = time.time()
+        results = []
+        for ticker in filter(None, (s.strip().upper() for s in symbols.split(","))):
+            recorded = fixtures.read("quote", f"{ticker}.json")
+            results.append(json.loads(recorded) if recorded else synth_quote(ticker, now))
+        return JSONResponse({"quoteResponse": {"result": results, "error": None}})
+
+    @app.get("/q/d/l/")
+    async def stooq(s: str, d1: str = "", d2: str = ""):
+        error = await delay("stooq")
+        if error is not None:
+            return error
+        recorded = fixtures.read("stooq", f"{s.split('.')[0].lower()}.csv")
+        if recorded:
+            return Response(recorded, media_type="text/csv")
+        start = datetime.datetime.strptime(d1, "%Y%m%d").date() if d1 else datetime.date.today() - datetime.timedelta(days=400)
+        end = datetime.datetime.strptime(d2, "%Y%m%d").date() if d2 else datetime.date.today()
+        return PlainTextResponse(synth_stooq(s, start, min(end, datetime.date.today())), media_type="text/csv")
+
+    @app.get("/rss/search")
+    async def rss(request: Request, q: str = ""):
+        error = await delay("rss")
+        if error is not None:
+            return error
+        bucket = int(time.time()) // args.news_refresh_sec * args.news_refresh_sec
+        if fixtures.rss:
+            body = fixtures.rss[_seed(q) % len(fixtures.rss)]
+        else:
+            body = synth_rss(q, args.news_items, bucket)
+        etag = f'"{hashlib.sha256(body).hexdigest()[:16]}"'
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers={"ETag": etag})
+        return Response(body, media_type="application/rss+xml", headers={"ETag": etag})
+
+    @app.post("/v1/chat/completions")
+    async def openai_chat(request: Request):
+        body = await request.json()
+        error = await delay("llm")
+        if error is not None:
+            return error
+        recorded = fixtures.read("llm", "openai.json")
+        if recorded:
+            return Response(recorded, media_type="application/json")
+        content = ANALYSIS
+        if (body.get("response_format") or {}).get("type") == "json_schema":
+            content = batch_analyses(body["messages"][-1]["content"])
+        return JSONResponse({
+            "id": f"chatcmpl-{_seed(str(time.time())):x}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "bench"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": json.dumps(content, ensure_ascii=False)},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": 500, "completion_tokens": 120, "total_tokens": 620},
+        })
+
+    @app.post("/v1/messages")
+    async def anthropic_messages(request: Request):
+        body = await request.json()
+        error = await delay("llm")
+        if error is not None:
+            return error
+        recorded = fixtures.read("llm", "anthropic.json")
+        if recorded:
+            return Response(recorded, media_type="application/json")
+        block = {"type": "text", "text": json.dumps(ANALYSIS, ensure_ascii=False)}
+        if body.get("tools"):
+            block = {
+                "type": "tool_use",
+                "id": f"toolu_{_seed(str(time.time())):x}",
+                "name": body["tools"][0]["name"],
+                "input": batch_analyses(body["messages"][-1]["content"]),
+            }
+        return JSONResponse({
+            "id": f"msg_{_seed(str(time.time())):x}",
+            "type": "message",
+            "role": "assistant",
+            "model": body.get("model", "bench"),
+            "content": [block],
+            "stop_reason": "tool_use" if block["type"] == "tool_use" else "end_turn",
+            "stop_sequence": None,
+            "usage": {"input_tokens": 500, "output_tokens": 120},
+        })
+
+    @app.get("/_stats")
+    def stats():
+        return counters
+
+    return app
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency-ms", type=float, default=40.0, help="mean latency of data endpoints")
+    parser.add_argument("--jitter-ms", type=float, default=10.0, help="latency standard deviation")
+    parser.add_argument("--llm-latency-ms", type=float, default=800.0, help="mean latency of LLM endpoints")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 503 / 429")
+    parser.add_argument("--news-items", type=int, default=20, help="items per synthesised RSS feed")
+    parser.add_argument("--news-refresh-sec", type=int, default=600, help="how often synthesised feeds change")
+    parser.add_argument("--fixtures", default="", help="directory of recorded responses")
+    parser.add_argument("--seed", type=int, default=42)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    uvicorn.run(create_app(args), host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,423 @@
+# -*- coding: utf-8 -*-
+"""Offline benchmark: ``build_snapshot`` and the HTTP endpoints against local stand-ins.
+
+Starts ``fake_upstream.py``, then for every ticker count runs a worker
+process that imports the app with its upstream URLs pointed at the stand-in
+and measures:
+
+* refresh phases (cold start, quotes-only, full, AI): wall time, CPU time
+  and the per-stage breakdown from the app's own Prometheus histograms;
+* peak RSS of the refresh process and of the serving process;
+* serving-process startup: time until the persisted snapshot is served,
+  plus the app's own startup phases from ``/metrics``;
+* ``/data/dashboard.json`` throughput and latency percentiles with
+  ``--viewers`` concurrent clients, for full and conditional (304) requests.
+
+Example::
+
+    python run_bench.py --tickers 3 100 1000 --viewers 50 --duration 10 --json result.json
+    python run_bench.py --tickers 100 --baseline result.json   # exit 1 on regression
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+BENCH_DIR = Path(__file__).resolve().parent
+APP_DIR = BENCH_DIR.parent / "app"
+
+# 越低越好的指標；其餘（吞吐量）越高越好
+LOWER_IS_BETTER = ("wall_sec", "cpu_sec", "peak_rss_mb", "p50_ms", "p90_ms", "p99_ms", "startup_sec")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_http(url: str, timeout: float = 30.0, ok=(200,), interval: float = 0.2) -> None:
+    import httpx
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(url, timeout=1.0).status_code in ok:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(interval)
+    raise RuntimeError(f"{url} did not become ready in {timeout:.0f}s")
+
+
+def bench_tickers(count: int) -> List[str]:
+    # 保留真實代號讓新聞查詢與基準指數（QQQ）的路徑一致，其餘以合成代號補足
+    real = ["NVDA", "SMCI", "QQQ"]
+    return real[:count] + [f"T{i:04d}" for i in range(max(0, count - len(real)))]
+
+
+def app_env(args: argparse.Namespace, upstream: str, data_dir: Path, tickers: List[str]) -> Dict[str, str]:
+    env = dict(os.environ)
+    env.update({
+        "DATA_DIR": str(data_dir),
+        "TICKERS": ",".join(tickers),
+        "YAHOO_QUOTE_BASE_URL": upstream,
+        "STOOQ_BASE_URL": upstream,
+        "GOOGLE_NEWS_BASE_URL": upstream,
+        "OPENAI_BASE_URL": f"{upstream}/v1",
+        "ANTHROPIC_BASE_URL": upstream,
+        "OPENAI_API_KEY": "bench",
+        "ANTHROPIC_API_KEY": "bench",
+        "AI_PROVIDER": args.ai,
+        "YFINANCE_ENABLED": "0",
+        "INTRADAY_SOURCE": "off",
+        "HTTP2_ENABLED": "0",
+        "UPSTREAM_RATE_SCALE": "1" if args.real_budgets else "1000",
+    })
+    return env
+
+
+# ---------------------------------------------------------------- worker side
+
+def stage_totals(registry) -> Dict[str, Dict[str, float]]:
+    totals: Dict[str, Dict[str, float]] = {}
+    for metric in registry.collect():
+        if metric.name != "market_monitor_stage_seconds":
+            continue
+        for sample in metric.samples:
+            stage = sample.labels.get("stage")
+            if sample.name.endswith("_sum"):
+                totals.setdefault(stage, {})["sum"] = sample.value
+            elif sample.name.endswith("_count"):
+                totals.setdefault(stage, {})["count"] = sample.value
+    return totals
+
+
+def upstream_errors(registry) -> Dict[str, float]:
+    errors: Dict[str, float] = {}
+    for metric in registry.collect():
+        if metric.name != "market_monitor_upstream_errors":
+            continue
+        for sample in metric.samples:
+            if sample.name.endswith("_total"):
+                key = f"{sample.labels['upstream']}:{sample.labels['reason']}"
+                errors[key] = errors.get(key, 0) + sample.value
+    return errors
+
+
+async def measure(name: str, coro_factory, registry, repeat: int = 1) -> Dict[str, Any]:
+    before, errors_before = stage_totals(registry), upstream_errors(registry)
+    walls = []
+    cpu_start = time.process_time()
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await coro_factory()
+        walls.append(time.perf_counter() - started)
+    cpu = time.process_time() - cpu_start
+    after, errors_after = stage_totals(registry), upstream_errors(registry)
+    stages = {}
+    for stage, values in after.items():
+        count = values.get("count", 0) - before.get(stage, {}).get("count", 0)
+        if count:
+            total = values.get("sum", 0) - before.get(stage, {}).get("sum", 0)
+            stages[stage] = {"count": int(count), "total_sec": round(total, 4), "mean_ms": round(total / count * 1000, 3)}
+    errors = {k: int(v - errors_before.get(k, 0)) for k, v in errors_after.items() if v - errors_before.get(k, 0)}
+    return {
+        "phase": name,
+        "repeat": repeat,
+        "wall_sec": round(sum(walls) / len(walls), 4),
+        "wall_min_sec": round(min(walls), 4),
+        "cpu_sec": round(cpu / repeat, 4),
+        "stages": stages,
+        "upstream_errors": errors,
+    }
+
+
+async def refresh_phases(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    sys.path.insert(0, str(APP_DIR))
+    import server  # noqa: E402  # 環境變數需在匯入前設定
+    from metrics import REGISTRY
+
+    server.HTTP_POOL.start(server.UPSTREAM_HOSTS)
+    phases = [
+        await measure("cold_start", server.build_snapshot, REGISTRY),
+        await measure("quotes", lambda: server.build_snapshot(["quotes"]), REGISTRY, repeat=args.repeat),
+        await measure("full", server.build_snapshot, REGISTRY, repeat=args.repeat),
+    ]
+    if args.ai != "none":
+        phases.append(await measure("ai", server.run_ai_stage, REGISTRY))
+    await server.HTTP_POOL.aclose()
+    server.HISTORY_STORE.close()
+    server.NEWS_INDEX.close()
+    server.FETCH_EXECUTOR.shutdown(wait=True)
+    server.NEWS_PARSE_EXECUTOR.shutdown(wait=True)
+    return phases
+
+
+def percentiles(latencies: List[float]) -> Dict[str, float]:
+    import numpy as np
+    if not latencies:
+        return {}
+    values = np.asarray(latencies) * 1000
+    return {
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p90_ms": round(float(np.percentile(values, 90)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3),
+        "max_ms": round(float(values.max()), 3),
+    }
+
+
+async def load(url: str, viewers: int, duration: float, conditional: bool) -> Dict[str, Any]:
+    import httpx
+    latencies: List[float] = []
+    errors = 0
+    limits = httpx.Limits(max_connections=viewers, max_keepalive_connections=viewers)
+    async with httpx.AsyncClient(limits=limits, timeout=10.0) as client:
+        etag = (await client.get(url)).headers.get("etag")
+        stop_at = time.perf_counter() + duration
+
+        async def viewer() -> None:
+            nonlocal errors
+            headers = {"Accept-Encoding": "gzip"}
+            if conditional and etag:
+                headers["If-None-Match"] = etag
+            while time.perf_counter() < stop_at:
+                started = time.perf_counter()
+                try:
+                    r = await client.get(url, headers=headers)
+                    await r.aread()
+                    if r.status_code not in (200, 304):
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                    continue
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(viewer() for _ in range(viewers)))
+        elapsed = time.perf_counter() - started
+    return {
+        "scenario": "conditional" if conditional else "full",
+        "viewers": viewers,
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+        **percentiles(latencies),
+    }
+
+
+def startup_phases(metrics_url: str) -> Dict[str, float]:
+    import httpx
+    phases = {}
+    for line in httpx.get(metrics_url, timeout=5.0).text.splitlines():
+        if line.startswith(("market_monitor_startup_seconds{", "market_monitor_lazy_import_seconds{")):
+            labels, value = line.rsplit(" ", 1)
+            name = labels.split('"')[1]
+            phases[name if line.startswith("market_monitor_startup") else f"import_{name}"] = round(float(value), 3)
+    return phases
+
+
+def serving_phase(args: argparse.Namespace, env: Dict[str, str]) -> Dict[str, Any]:
+    """Serve the snapshot the refresh phases left in DATA_DIR and load it with concurrent viewers."""
+    port = free_port()
+    launched = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning"],
+        cwd=APP_DIR, env=env,
+    )
+    url = f"http://127.0.0.1:{port}/data/dashboard.json"
+    try:
+        wait_http(url, timeout=120, interval=0.02)
+        # 以上一階段留下的 dashboard.json 啟動，量測到第一個 200 回應的時間
+        startup = {"startup_sec": round(time.perf_counter() - launched, 3),
+                   **startup_phases(f"http://127.0.0.1:{port}/metrics")}
+        results = [asyncio.run(load(url, args.viewers, args.duration, conditional))
+                   for conditional in (False, True)]
+        peak_kb = 0
+        try:
+            for line in Path(f"/proc/{proc.pid}/status").read_text().splitlines():
+                if line.startswith("VmHWM:"):
+                    peak_kb = int(line.split()[1])
+        except OSError:
+            pass
+        return {"endpoints": results, "startup": startup, "server_peak_rss_mb": round(peak_kb / 1024, 1) if peak_kb else None}
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+
+
+def run_worker(args: argparse.Namespace) -> None:
+    tickers = bench_tickers(args.worker)
+    data_dir = Path(args.data_dir)
+    data_dir.mkdir(parents=True, exist_ok=True)
+    env = app_env(args, args.upstream, data_dir, tickers)
+    os.environ.update(env)
+
+    phases = asyncio.run(refresh_phases(args))
+    self_usage = resource.getrusage(resource.RUSAGE_SELF)
+    # 此時只有已結束的新聞解析子行程，serving 階段的子行程尚未啟動
+    child_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    result = {
+        "tickers": len(tickers),
+        "phases": phases,
+        "peak_rss_mb": round(self_usage.ru_maxrss / 1024, 1),
+        "child_cpu_sec": round(child_usage.ru_utime + child_usage.ru_stime, 3),
+    }
+    if args.viewers > 0:
+        result.update(serving_phase(args, env))
+    print("BENCH_RESULT " + json.dumps(result))
+
+
+# ---------------------------------------------------------------- parent side
+
+def start_upstream(args: argparse.Namespace) -> Tuple[subprocess.Popen, str]:
+    port = free_port()
+    cmd = [
+        sys.executable, str(BENCH_DIR / "fake_upstream.py"), "--port", str(port),
+        "--latency-ms", str(args.latency_ms), "--jitter-ms", str(args.jitter_ms),
+        "--llm-latency-ms", str(args.llm_latency_ms), "--error-rate", str(args.error_rate),
+    ]
+    if args.fixtures:
+        cmd += ["--fixtures", args.fixtures]
+    proc = subprocess.Popen(cmd)
+    url = f"http://127.0.0.1:{port}"
+    wait_http(f"{url}/_stats")
+    return proc, url
+
+
+def run_one(args: argparse.Namespace, count: int, upstream: str, work_dir: Path) -> Dict[str, Any]:
+    cmd = [
+        sys.executable, __file__, "--worker", str(count), "--upstream", upstream,
+        "--data-dir", str(work_dir / f"tickers_{count}"),
+        "--repeat", str(args.repeat), "--viewers", str(args.viewers), "--duration", str(args.duration),
+        "--ai", args.ai,
+    ]
+    if args.real_budgets:
+        cmd.append("--real-budgets")
+    out = subprocess.run(cmd, capture_output=True, text=True, timeout=args.timeout)
+    for line in out.stdout.splitlines():
+        if line.startswith("BENCH_RESULT "):
+            return json.loads(line[len("BENCH_RESULT "):])
+    sys.stderr.write(out.stdout[-4000:] + out.stderr[-4000:])
+    raise RuntimeError(f"benchmark worker for {count} tickers failed (exit {out.returncode})")
+
+
+def print_report(results: List[Dict[str, Any]]) -> None:
+    for result in results:
+        print(f"\n=== {result['tickers']} tickers — refresh peak RSS {result['peak_rss_mb']} MB, "
+              f"news parse workers CPU {result['child_cpu_sec']} s")
+        print(f"{'phase':<12}{'wall s':>10}{'min s':>10}{'cpu s':>10}   top stages (total s / mean ms)")
+        for phase in result["phases"]:
+            top = sorted(phase["stages"].items(), key=lambda kv: kv[1]["total_sec"], reverse=True)[:5]
+            stages = ", ".join(f"{k} {v['total_sec']:.3f}/{v['mean_ms']:.1f}" for k, v in top)
+            print(f"{phase['phase']:<12}{phase['wall_sec']:>10.3f}{phase['wall_min_sec']:>10.3f}"
+                  f"{phase['cpu_sec']:>10.3f}   {stages}")
+            if phase["upstream_errors"]:
+                print(f"{'':<12}upstream errors: {phase['upstream_errors']}")
+        for ep in result.get("endpoints", []):
+            print(f"GET /data/dashboard.json [{ep['scenario']:<11}] {ep['viewers']} viewers: "
+                  f"{ep['throughput_rps']} req/s, p50 {ep.get('p50_ms')} ms, p90 {ep.get('p90_ms')} ms, "
+                  f"p99 {ep.get('p99_ms')} ms, errors {ep['errors']}")
+        if result.get("startup"):
+            phases = ", ".join(f"{k} {v}" for k, v in result["startup"].items() if k != "startup_sec")
+            print(f"serving process answered after {result['startup']['startup_sec']} s ({phases})")
+        if result.get("server_peak_rss_mb"):
+            print(f"serving process peak RSS {result['server_peak_rss_mb']} MB")
+
+
+def flatten(results: List[Dict[str, Any]]) -> Dict[str, float]:
+    flat: Dict[str, float] = {}
+    for result in results:
+        prefix = f"{result['tickers']}"
+        flat[f"{prefix}.peak_rss_mb"] = result["peak_rss_mb"]
+        for phase in result["phases"]:
+            flat[f"{prefix}.{phase['phase']}.wall_sec"] = phase["wall_sec"]
+            flat[f"{prefix}.{phase['phase']}.cpu_sec"] = phase["cpu_sec"]
+        if result.get("startup"):
+            flat[f"{prefix}.startup_sec"] = result["startup"]["startup_sec"]
+        for ep in result.get("endpoints", []):
+            for key in ("throughput_rps", "p50_ms", "p99_ms"):
+                if key in ep:
+                    flat[f"{prefix}.{ep['scenario']}.{key}"] = ep[key]
+    return flat
+
+
+def compare(results: List[Dict[str, Any]], baseline_path: str, tolerance: float) -> List[str]:
+    baseline = flatten(json.loads(Path(baseline_path).read_text())["results"])
+    regressions = []
+    for key, value in flatten(results).items():
+        old = baseline.get(key)
+        if not old or value is None:
+            continue
+        lower_better = key.endswith(LOWER_IS_BETTER)
+        change = (value - old) / old if lower_better else (old - value) / old
+        if change > tolerance:
+            regressions.append(f"{key}: {old} -> {value} ({change:+.0%} worse)")
+    return regressions
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Offline refresh / endpoint benchmark")
+    parser.add_argument("--tickers", type=int, nargs="+", default=[3, 100], help="ticker counts to run, e.g. 3 100 1000")
+    parser.add_argument("--repeat", type=int, default=3, help="repetitions of the warm refresh phases")
+    parser.add_argument("--viewers", type=int, default=50, help="concurrent dashboard clients (0 skips the endpoint phase)")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per endpoint scenario")
+    parser.add_argument("--ai", choices=("openai", "anthropic", "none"), default="openai")
+    parser.add_argument("--latency-ms", type=float, default=40.0)
+    parser.add_argument("--jitter-ms", type=float, default=10.0)
+    parser.add_argument("--llm-latency-ms", type=float, default=800.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--fixtures", default="", help="recorded responses for fake_upstream.py")
+    parser.add_argument("--real-budgets", action="store_true", help="keep production request budgets")
+    parser.add_argument("--json", default="", help="write results to this file")
+    parser.add_argument("--baseline", default="", help="results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative regression")
+    parser.add_argument("--timeout", type=float, default=1800.0, help="per ticker-count time limit")
+    # 內部使用：單一 ticker 數量的 worker 行程
+    parser.add_argument("--worker", type=int, default=0, help=argparse.SUPPRESS)
+    parser.add_argument("--upstream", default="", help=argparse.SUPPRESS)
+    parser.add_argument("--data-dir", default="", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main() -> int:
+    args = parse_args()
+    if args.worker:
+        run_worker(args)
+        return 0
+
+    upstream_proc, upstream = start_upstream(args)
+    try:
+        with tempfile.TemporaryDirectory(prefix="market-bench-") as work_dir:
+            results = [run_one(args, count, upstream, Path(work_dir)) for count in args.tickers]
+    finally:
+        upstream_proc.terminate()
+        upstream_proc.wait(timeout=30)
+
+    print_report(results)
+    if args.json:
+        Path(args.json).write_text(json.dumps({
+            "created_unix": int(time.time()),
+            "argv": sys.argv[1:],
+            "results": results,
+        }, indent=2))
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.tolerance)
+        if regressions:
+            print("\nRegressions beyond tolerance:")
+            print("\n".join(f"  {r}" for r in regressions))
+            return 1
+        print(f"\nNo regressions beyond {args.tolerance:.0%} against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
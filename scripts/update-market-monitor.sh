@@ -96,6 +96,17 @@ rsync -avz --progress \
   --exclude '__pycache__/' \
   --exclude '*.pyc' \
   --exclude 'app/data/dashboard.json' \
+  --exclude 'app/data/*.sqlite3*' \
+  --exclude 'app/data/archive/' \
+  --exclude 'app/data/alerts.jsonl' \
+  --exclude 'app/data/ai_analysis.json' \
+  --exclude 'app/data/ai_responses.json' \
+  --exclude 'app/data/ai_jobs.json' \
+  --exclude 'app/data/ai_trigger.json' \
+  --exclude 'app/data/refresh_status.json' \
+  --exclude 'app/data/refresher.lock' \
+  --exclude 'app/data/snapshot.shm' \
+  --exclude 'app/data/*.tmp' \
   --exclude '.env.backup' \
   "$SOURCE_DIR/" "$REMOTE_HOST:$TARGET_DIR/"
 echo_success "Files synchronized"